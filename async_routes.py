@@ -0,0 +1,182 @@
+"""Async route handlers for the hot paths (enabled with DB_ASYNC=1).
+
+Covers the character reads and the writes of the level_up and equip_churn
+benchmark scenarios; other writes stay on the sync handlers in main.py.
+"""
+
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_async_db
+from pagination import PageParams
+import schemas
+import crud_async
+import auth
+import cache
+
+router = APIRouter()
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """Get the current user from the JWT token."""
+    cached = cache.user_cache.get(token)
+    if cached is not None:
+        return cached
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    payload = auth.verify_access_token(token)
+    if payload is None or payload.get("sub") is None:
+        raise credentials_exception
+    user = await crud_async.get_user_by_username(db, username=payload["sub"])
+    if user is None:
+        raise credentials_exception
+    current_user = schemas.User.model_validate(user)
+    cache.user_cache.set(token, current_user, expires_at=payload.get("exp"))
+    return current_user
+
+
+async def get_owned_character_id(
+    local_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    user: schemas.User = Depends(get_current_user)
+) -> int:
+    """Get the id of a character of the current user by local_id or raise 404."""
+    character_id = await crud_async.get_character_id_by_local_id(db, user.id, local_id)
+    if character_id is None:
+        raise HTTPException(status_code=404, detail="Character not found")
+    return character_id
+
+
+async def get_owned_character(
+    local_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    """Get a fully loaded character of the current user by local_id or raise 404."""
+    character = await crud_async.get_character_by_local_id(db, user.id, local_id)
+    if character is None:
+        raise HTTPException(status_code=404, detail="Character not found")
+    return character
+
+
+@router.get("/users/me", response_model=schemas.User)
+async def read_users_me(current_user: schemas.User = Depends(get_current_user)):
+    """Get current user info."""
+    return current_user
+
+
+@router.get("/characters/", response_model=List[schemas.Character])
+async def get_characters(
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    """Get characters of the current user, one keyset page at a time."""
+    rows = await crud_async.get_characters_by_user(db, user.id, page.after, page.fetch)
+    return page.apply(response, rows)
+
+
+@router.get("/characters/{local_id}", response_model=schemas.Character)
+async def get_character(
+    local_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    """Get a character by local_id."""
+    etag = cache.character_etag(user.id, local_id)
+    if cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    character = await crud_async.get_character_by_local_id(db, user.id, local_id)
+    if character is None:
+        raise HTTPException(status_code=404, detail="Character not found")
+    response.headers["ETag"] = etag
+    return character
+
+
+@router.get("/characters/{local_id}/abilities/", response_model=List[schemas.CharacterAbility])
+async def get_character_abilities(
+    db: AsyncSession = Depends(get_async_db),
+    character_id: int = Depends(get_owned_character_id)
+):
+    """Get abilities of a character."""
+    return await crud_async.get_character_abilities(db, character_id)
+
+
+@router.get("/characters/{local_id}/equipment/", response_model=List[schemas.CharacterEquipment])
+async def get_character_equipments(
+    db: AsyncSession = Depends(get_async_db),
+    character_id: int = Depends(get_owned_character_id)
+):
+    """Get all equipment of a character."""
+    return await crud_async.get_character_equipments(db, character_id)
+
+
+@router.get("/characters/{local_id}/equipment/equipped/",
+            response_model=List[schemas.CharacterEquipment])
+async def get_character_equipped_items(
+    db: AsyncSession = Depends(get_async_db),
+    character_id: int = Depends(get_owned_character_id)
+):
+    """Get all equipped items of a character."""
+    return await crud_async.get_character_equipped_items(db, character_id)
+
+
+@router.patch("/characters/{local_id}/set_level")
+async def set_character_level(
+    new_level: int,
+    db: AsyncSession = Depends(get_async_db),
+    character=Depends(get_owned_character)
+):
+    """Set character level and sync abilities/bonuses."""
+    try:
+        return await crud_async.sync_character_level(db, character, new_level)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@router.post("/characters/{local_id}/level_up")
+async def level_up_character(
+    db: AsyncSession = Depends(get_async_db),
+    character=Depends(get_owned_character)
+):
+    """Increase character level by 1 and sync abilities/bonuses."""
+    return await crud_async.sync_character_level(db, character, character.level + 1)
+
+
+async def _set_equipped(db: AsyncSession, character_id: int, equipment_id: int, equipped: bool):
+    ce = await crud_async.set_equipment_equipped(db, character_id, equipment_id, equipped)
+    if ce is None:
+        raise HTTPException(status_code=404, detail="Equipment not found for this character")
+    return ce
+
+
+@router.patch("/characters/{local_id}/equipment/{equipment_id}/equip",
+              response_model=schemas.CharacterEquipment)
+async def equip_equipment(
+    equipment_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    character_id: int = Depends(get_owned_character_id)
+):
+    """Equip an item to a character."""
+    return await _set_equipped(db, character_id, equipment_id, True)
+
+
+@router.patch("/characters/{local_id}/equipment/{equipment_id}/unequip",
+              response_model=schemas.CharacterEquipment)
+async def unequip_equipment(
+    equipment_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    character_id: int = Depends(get_owned_character_id)
+):
+    """Unequip an item from a character."""
+    return await _set_equipped(db, character_id, equipment_id, False)
@@ -0,0 +1,4 @@
+"""Load-testing benchmarks for the DnD API.
+
+Usage: python -m benchmarks.run [--target inprocess|uvicorn] [--save FILE] [--compare FILE]
+"""
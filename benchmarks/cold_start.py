@@ -0,0 +1,130 @@
+"""Measure cold start: from `import main` to the first successful responses.
+
+Each run is a fresh Python process on the same generated database, once
+with STARTUP_WARM_UP=1 and once with 0, so the cost moved into the lifespan
+shows up next to what it saves on the first requests. The in-process probe
+splits import, lifespan startup and first requests; the uvicorn target times
+process spawn to the first 200 as a client sees it.
+
+Usage: python -m benchmarks.cold_start [--runs N] [--target inprocess|uvicorn]
+                                       [--characters-per-user N]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import harness
+
+
+async def _first_requests(client, username: str, password: str) -> dict:
+    # Каталог и прогрессия идут из кэшей, вход через пул хеширования, ростер из пула соединений
+    timings = {}
+
+    async def timed(name, method, path, **kwargs):
+        started = time.perf_counter()
+        response = await client.request(method, path, **kwargs)
+        timings[name] = time.perf_counter() - started
+        if response.status_code != 200:
+            raise RuntimeError(f"{method} {path} -> {response.status_code}")
+        return response
+
+    await timed("catalog", "GET", "/equipment/")
+    token = (await timed("login", "POST", "/token",
+                         data={"username": username, "password": password})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    await timed("roster", "GET", "/characters/", headers=headers)
+    await timed("progression", "GET", "/class_progression/")
+    return timings
+
+
+def probe(username: str, password: str) -> dict:
+    """Time import, lifespan startup and the first requests in this (fresh) process."""
+    started = time.perf_counter()
+    # pylint: disable=import-outside-toplevel
+    import httpx
+    from main import app
+    import startup
+    timings = {"import": time.perf_counter() - started}
+
+    async def run():
+        lifespan_started = time.perf_counter()
+        async with app.router.lifespan_context(app):
+            timings["startup"] = time.perf_counter() - lifespan_started
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                timings.update(await _first_requests(client, username, password))
+
+    asyncio.run(run())
+    timings["total"] = time.perf_counter() - started
+    timings.update({f"startup.{name}": value for name, value in startup.timings.items()})
+    return timings
+
+
+async def _uvicorn_run(username: str, password: str) -> dict:
+    started = time.perf_counter()
+    async with harness.uvicorn_client(connections=1) as client:
+        timings = {"ready": time.perf_counter() - started}
+        timings.update(await _first_requests(client, username, password))
+        timings["total"] = time.perf_counter() - started
+    return timings
+
+
+def _run_once(target: str, warm_up: bool, username: str, password: str) -> dict:
+    env = {**os.environ, "STARTUP_WARM_UP": "1" if warm_up else "0"}
+    if target == "uvicorn":
+        os.environ["STARTUP_WARM_UP"] = env["STARTUP_WARM_UP"]
+        return asyncio.run(_uvicorn_run(username, password))
+    # Отдельный процесс на прогон: иначе import main берётся из sys.modules
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.cold_start", "--probe", username, password],
+        cwd=harness.ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def summarize(runs: list) -> dict:
+    """Median of every timing over the runs, in milliseconds."""
+    return {name: round(statistics.median(run[name] for run in runs) * 1000, 2) for name in runs[0]}
+
+
+def main(argv=None) -> int:
+    """Generate a dataset and print median cold-start timings with and without warm-up."""
+    parser = argparse.ArgumentParser(description="Measure cold start of the API.")
+    parser.add_argument("--target", choices=("inprocess", "uvicorn"), default="inprocess")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per mode")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--characters-per-user", type=int, default=10)
+    parser.add_argument("--probe", nargs=2, metavar=("USERNAME", "PASSWORD"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.probe:
+        print(json.dumps(probe(*args.probe)))
+        return 0
+    with tempfile.TemporaryDirectory(prefix="dnd-bench-") as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        # pylint: disable=import-outside-toplevel
+        import datagen
+        from database import engine
+        dataset = datagen.generate(engine, datagen.DatasetConfig(
+            users=args.users, characters_per_user=args.characters_per_user))
+        engine.dispose()
+        username = datagen.username_for(dataset.first_user_id)
+        results = {}
+        for warm_up in (False, True):
+            runs = [_run_once(args.target, warm_up, username, dataset.config.password) for _ in range(args.runs)]
+            results["warm" if warm_up else "cold"] = summarize(runs)
+    names = list(dict.fromkeys(name for summary in results.values() for name in summary))
+    print(f"{'median, ms':<24}{'no warm-up':>12}{'warm-up':>12}")
+    for name in names:
+        cold, warm = results["cold"].get(name, "-"), results["warm"].get(name, "-")
+        print(f"{name:<24}{cold:>12}{warm:>12}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
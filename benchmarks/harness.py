@@ -0,0 +1,195 @@
+"""Latency recording, targets and JSON baselines for the benchmarks."""
+
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class Recorder:
+    """Collects latencies and status codes per route template."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def request(self, client: httpx.AsyncClient, method: str, template: str,
+                      path: Optional[Dict[str, Any]] = None, expect=(200,), **kwargs) -> httpx.Response:
+        """Send a request and record it under "METHOD template"."""
+        route = f"{method} {template}"
+        url = template.format(**path) if path else template
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[route].append(time.perf_counter() - started)
+        self.statuses[route][response.status_code] += 1
+        if response.status_code not in expect:
+            self.errors[route] += 1
+        return response
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        """Summarize: req/s and p50/p95/p99 in milliseconds per route and in total."""
+        routes = {route: self._summary(values, elapsed, self.errors[route], self.statuses[route])
+                  for route, values in sorted(self.latencies.items())}
+        everything = [value for values in self.latencies.values() for value in values]
+        total = self._summary(everything, elapsed, sum(self.errors.values()), Counter())
+        return {"elapsed_s": round(elapsed, 3), "total": total, "routes": routes}
+
+    @staticmethod
+    def _summary(values: List[float], elapsed: float, errors: int, statuses: Counter) -> Dict[str, Any]:
+        values = sorted(values)
+        summary = {
+            "count": len(values),
+            "errors": errors,
+            "rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+            "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        }
+        for pct in (50, 95, 99):
+            summary[f"p{pct}_ms"] = round(percentile(values, pct) * 1000, 3)
+        if statuses:
+            summary["statuses"] = {str(code): count for code, count in sorted(statuses.items())}
+        return summary
+
+
+@asynccontextmanager
+async def in_process_client(app):
+    """Client that calls the ASGI app directly, without sockets, inside its lifespan."""
+    # ASGITransport не шлёт lifespan-события, поэтому запускаем его сами
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            yield client
+
+
+def free_port() -> int:
+    """Ask the OS for an unused TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def uvicorn_client(connections: int, extra_args: Optional[List[str]] = None, startup_timeout: float = 30.0):
+    """Start main:app under a real uvicorn process and yield a client to it."""
+    port = free_port()
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+               "--port", str(port), "--log-level", "warning", *(extra_args or [])]
+    async with process_client(command, port, connections, startup_timeout) as client:
+        yield client
+
+
+@asynccontextmanager
+async def serve_client(connections: int, workers: int, extra_args: Optional[List[str]] = None,
+                       startup_timeout: float = 60.0):
+    """Start the production launcher (serve.py) with `workers` workers and yield a client to it."""
+    port = free_port()
+    command = [sys.executable, "serve.py", "--workers", str(workers), "--host", "127.0.0.1",
+               "--port", str(port), "--log-level", "warning", *(extra_args or [])]
+    async with process_client(command, port, connections, startup_timeout) as client:
+        yield client
+
+
+@asynccontextmanager
+async def process_client(command: List[str], port: int, connections: int, startup_timeout: float):
+    """Run a server command, wait until it answers on port, yield a client, stop it."""
+    # Сервер наследует окружение, в том числе DATABASE_URL бенчмарка
+    process = subprocess.Popen(command, cwd=ROOT, env=os.environ.copy())
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            deadline = time.monotonic() + startup_timeout
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"{command[1]} exited with code {process.returncode}")
+                try:
+                    await client.get("/openapi.json")
+                    break
+                except httpx.TransportError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"{command[1]} did not start in time") from None
+                    await asyncio.sleep(0.1)
+            yield client
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def git_revision() -> Optional[str]:
+    """Short hash of the checked out commit, if available."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_baseline(path: str, results: Dict[str, Any]) -> None:
+    """Write benchmark results as a JSON baseline."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    """Read a JSON baseline written by save_baseline."""
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return human-readable regressions of current results against a baseline.
+
+    A route regresses when its p95 grows or its req/s drops by more than
+    tolerance (a fraction), or when it starts answering with errors.
+    """
+    regressions = []
+    for scenario, result in current["scenarios"].items():
+        old_routes = baseline.get("scenarios", {}).get(scenario, {}).get("routes", {})
+        for route, stats in result["routes"].items():
+            old = old_routes.get(route)
+            if old is None:
+                continue
+            name = f"{scenario}: {route}"
+            if old["p95_ms"] and stats["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{name} p95 {old['p95_ms']} -> {stats['p95_ms']} ms")
+            if old["rps"] and stats["rps"] < old["rps"] * (1 - tolerance):
+                regressions.append(f"{name} req/s {old['rps']} -> {stats['rps']}")
+            if stats["errors"] and not old["errors"]:
+                regressions.append(f"{name} errors 0 -> {stats['errors']}")
+    return regressions
+
+
+def format_report(results: Dict[str, Any]) -> str:
+    """Render results as a plain text table."""
+    lines = []
+    header = f"{'route':<64} {'count':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'err':>5}"
+    for scenario, result in results["scenarios"].items():
+        lines.append(f"== {scenario} ({result['elapsed_s']} s)")
+        lines.append(header)
+        for route, stats in [*result["routes"].items(), ("total", result["total"])]:
+            lines.append(f"{route:<64} {stats['count']:>7} {stats['rps']:>9} {stats['p50_ms']:>9} "
+                         f"{stats['p95_ms']:>9} {stats['p99_ms']:>9} {stats['errors']:>5}")
+        lines.append("")
+    return "\n".join(lines)
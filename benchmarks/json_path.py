@@ -0,0 +1,87 @@
+"""Compare the default response path with FAST_JSON on hot read routes.
+
+Runs the same requests in-process with fastjson.FAST_JSON off and on, checks
+that the bodies are byte-identical and prints latency per route.
+
+Usage: python -m benchmarks.json_path [--characters-per-user N] [--requests N]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+from benchmarks import harness
+
+ROUTES = (
+    "/characters/",
+    "/characters/{local_id}",
+    "/characters/{local_id}/abilities/",
+    "/characters/{local_id}/equipment/",
+    "/characters/{local_id}/effective_stats/",
+    "/characters/effective_stats/",
+)
+
+
+async def compare_paths(app, dataset, requests: int) -> dict:
+    """Return {mode: report} for FAST_JSON off and on."""
+    # pylint: disable=import-outside-toplevel
+    import fastjson
+    from benchmarks import scenarios
+    recorders = {mode: harness.Recorder() for mode in ("default", "fast")}
+    elapsed = dict.fromkeys(recorders, 0.0)
+    bodies = {}
+    async with harness.in_process_client(app) as client:
+        user = (await scenarios.prepare(client, dataset, concurrency=1)).users[0]
+        loop = asyncio.get_running_loop()
+        # Режимы чередуются по кругам, чтобы дрейф (GC, прогрев) не доставался одному
+        for round_index in range(requests + 1):
+            for mode, recorder in recorders.items():
+                fastjson.FAST_JSON = mode == "fast"
+                if round_index == 0:
+                    recorder = harness.Recorder()  # прогрев
+                started = loop.time()
+                for template in ROUTES:
+                    response = await recorder.request(
+                        client, "GET", template, {"local_id": user.local_ids[-1]},
+                        params={"limit": 1000} if template == "/characters/" else None, headers=user.headers)
+                    bodies.setdefault(template, {})[mode] = response.content
+                if round_index:
+                    elapsed[mode] += loop.time() - started
+    reports = {mode: recorder.report(elapsed[mode]) for mode, recorder in recorders.items()}
+    mismatched = [template for template, by_mode in bodies.items() if by_mode["default"] != by_mode["fast"]]
+    return {"scenarios": reports, "mismatched": mismatched}
+
+
+def main(argv=None) -> int:
+    """Generate a dataset, time both paths and print the comparison."""
+    parser = argparse.ArgumentParser(description="Benchmark FAST_JSON against the default response path.")
+    parser.add_argument("--characters-per-user", type=int, default=100)
+    parser.add_argument("--inventory", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=50, help="rounds over all routes per mode")
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="dnd-bench-") as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        # pylint: disable=import-outside-toplevel
+        import datagen
+        from database import engine
+        from main import app
+        dataset = datagen.generate(engine, datagen.DatasetConfig(
+            users=10, characters_per_user=args.characters_per_user, inventory=args.inventory))
+        result = asyncio.run(compare_paths(app, dataset, args.requests))
+    print(harness.format_report(result))
+    default_routes = result["scenarios"]["default"]["routes"]
+    for route, fast in result["scenarios"]["fast"]["routes"].items():
+        default = default_routes[route]
+        print(f"{route:<50} p50 {default['p50_ms']:>8} -> {fast['p50_ms']:>8} ms "
+              f"({default['p50_ms'] / fast['p50_ms']:.2f}x)")
+    if result["mismatched"]:
+        print("BODIES DIFFER:", ", ".join(result["mismatched"]))
+        return 1
+    print("bodies are byte-identical")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
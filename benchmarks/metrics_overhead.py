@@ -0,0 +1,71 @@
+"""Measure the per-request cost of MetricsMiddleware.
+
+Calls a trivial ASGI app directly (no HTTP, no routing) with and without the
+middleware and reports the difference per request.
+
+Usage: python -m benchmarks.metrics_overhead [--requests N]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from metrics import Metrics, MetricsMiddleware
+
+
+class _Route:
+    path = "/characters/{local_id}"
+
+
+async def _app(scope, receive, send):
+    scope["route"] = _Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def _receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def _send(message):
+    pass
+
+
+async def _time_calls(app, requests: int) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app({"type": "http", "method": "GET", "path": "/characters/1"}, _receive, _send)
+    return time.perf_counter() - started
+
+
+def measure(requests: int, rounds: int = 5) -> dict:
+    """Best-of-rounds time per request with and without the middleware, in microseconds."""
+    wrapped = MetricsMiddleware(_app, Metrics())
+
+    async def run():
+        bare = min([await _time_calls(_app, requests) for _ in range(rounds)])
+        instrumented = min([await _time_calls(wrapped, requests) for _ in range(rounds)])
+        return bare, instrumented
+
+    bare, instrumented = asyncio.run(run())
+    return {
+        "bare_us": round(bare / requests * 1e6, 3),
+        "instrumented_us": round(instrumented / requests * 1e6, 3),
+        "overhead_us": round((instrumented - bare) / requests * 1e6, 3),
+    }
+
+
+def main(argv=None) -> int:
+    """Print middleware overhead per request."""
+    parser = argparse.ArgumentParser(description="Measure MetricsMiddleware overhead.")
+    parser.add_argument("--requests", type=int, default=100000)
+    args = parser.parse_args(argv)
+    result = measure(args.requests)
+    print(f"bare app {result['bare_us']} us/request, with metrics {result['instrumented_us']} us/request, "
+          f"overhead {result['overhead_us']} us/request")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Run the API benchmarks in-process or against a real uvicorn.
+
+Every run generates a fresh synthetic database with datagen, so results of
+runs with the same dataset options are comparable.
+
+Usage: python -m benchmarks.run [--target inprocess|uvicorn] [--scenario NAME ...]
+                                [--save FILE] [--compare FILE]
+"""
+
+import argparse
+import asyncio
+import os
+import platform
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+
+from benchmarks import harness
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure req/s and latency percentiles of the API.")
+    parser.add_argument("--target", choices=("inprocess", "uvicorn"), default="inprocess",
+                        help="call the ASGI app directly (httpx ASGITransport) or through a uvicorn process")
+    parser.add_argument("--scenario", action="append",
+                        help="scenario to run, may repeat: login, roster, level_up, equip_churn, catalog (default: all)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--characters-per-user", type=int, default=10)
+    parser.add_argument("--abilities", type=int, default=500)
+    parser.add_argument("--equipment", type=int, default=1000)
+    parser.add_argument("--levels", type=int, default=20)
+    parser.add_argument("--inventory", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=10, help="virtual users per scenario")
+    parser.add_argument("--iterations", type=int, default=20, help="scenario rounds per virtual user")
+    parser.add_argument("--warmup", type=int, default=1, help="unrecorded rounds per virtual user")
+    parser.add_argument("--save", metavar="FILE", help="write results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare with a saved baseline, exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative p95 growth / req/s drop before a route counts as regressed")
+    return parser.parse_args(argv)
+
+
+async def run(args: argparse.Namespace, dataset) -> dict:
+    """Run the selected scenarios against the target."""
+    # pylint: disable=import-outside-toplevel
+    from benchmarks import scenarios
+    if args.target == "inprocess":
+        from main import app
+        target = harness.in_process_client(app)
+    else:
+        target = harness.uvicorn_client(connections=args.concurrency)
+    results = {
+        "meta": {
+            "target": args.target,
+            "revision": harness.git_revision(),
+            "python": platform.python_version(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "dataset": asdict(dataset.config),
+            "params": {name: getattr(args, name) for name in ("concurrency", "iterations", "warmup")},
+        },
+        "scenarios": {},
+    }
+    async with target as client:
+        fixture = await scenarios.prepare(client, dataset, args.concurrency)
+        if args.concurrency > len(fixture.slots()):
+            print("warning: more virtual users than characters, write scenarios will contend", file=sys.stderr)
+        for name in args.scenario or scenarios.SCENARIOS:
+            results["scenarios"][name] = await scenarios.run_scenario(
+                client, fixture, scenarios.SCENARIOS[name], args.concurrency, args.iterations, args.warmup)
+    return results
+
+
+def main(argv=None) -> int:
+    """Generate the dataset, run benchmarks, print the report, save and compare baselines."""
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="dnd-bench-") as tmp:
+        # До импорта datagen/main: engine приложения создаётся при импорте database
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        # pylint: disable=import-outside-toplevel
+        import datagen
+        from benchmarks import scenarios
+        unknown = set(args.scenario or ()) - set(scenarios.SCENARIOS)
+        if unknown:
+            print(f"unknown scenario(s): {', '.join(sorted(unknown))}", file=sys.stderr)
+            return 2
+        config = datagen.DatasetConfig(
+            users=args.users, characters_per_user=args.characters_per_user, abilities=args.abilities,
+            equipment=args.equipment, levels=args.levels, inventory=args.inventory, seed=args.seed,
+        )
+        started = time.perf_counter()
+        from database import engine
+        dataset = datagen.generate(engine, config)
+        print(f"dataset generated in {time.perf_counter() - started:.1f} s: {dataset.counts}")
+        results = asyncio.run(run(args, dataset))
+    print(harness.format_report(results))
+    if args.save:
+        harness.save_baseline(args.save, results)
+        print(f"baseline saved to {args.save}")
+    if args.compare:
+        regressions = harness.compare(results, harness.load_baseline(args.compare), args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            return 1
+        print(f"no regressions against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
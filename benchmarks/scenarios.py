@@ -0,0 +1,135 @@
+"""Benchmark fixture and scripted scenarios.
+
+A scenario is a coroutine run repeatedly by every virtual user; each virtual
+user owns one character, so write scenarios never contend for the same row.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+
+from benchmarks.harness import Recorder
+from datagen import Dataset, username_for
+
+LEVEL_CHAIN = 10
+
+
+@dataclass
+class BenchUser:
+    """Logged in user with a token and the local ids of its characters."""
+    username: str
+    password: str
+    token: str
+    local_ids: List[int] = field(default_factory=list)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+@dataclass
+class Fixture:
+    """Users every scenario runs as."""
+    users: List[BenchUser]
+
+    def slots(self):
+        """(user, local_id) pairs, one per character."""
+        return [(user, local_id) for user in self.users for local_id in user.local_ids]
+
+
+async def prepare(client: httpx.AsyncClient, dataset: Dataset, concurrency: int) -> Fixture:
+    """Log in as enough generated users to give every virtual user its own character."""
+    config = dataset.config
+    needed = min(config.users, -(-concurrency // max(config.characters_per_user, 1)))
+
+    async def login_as(user_id: int) -> BenchUser:
+        username = username_for(user_id)
+        response = await client.post("/token", data={"username": username, "password": config.password})
+        if response.status_code != 200:
+            raise RuntimeError(f"login as {username} failed: {response.status_code} {response.text}")
+        return BenchUser(username, config.password, response.json()["access_token"],
+                         list(range(1, config.characters_per_user + 1)))
+
+    users = await asyncio.gather(*(login_as(user_id) for user_id in dataset.user_ids()[:needed]))
+    return Fixture(list(users))
+
+
+Scenario = Callable[[httpx.AsyncClient, Recorder, BenchUser, int], Awaitable[None]]
+
+
+async def login(client, recorder, user, local_id):
+    """Password login: PBKDF2 in the hasher pool plus a user lookup."""
+    await recorder.request(client, "POST", "/token", data={"username": user.username, "password": user.password})
+
+
+async def roster(client, recorder, user, local_id):
+    """Roster page, one character and the batched effective stats of the page."""
+    response = await recorder.request(client, "GET", "/characters/", params={"limit": 100}, headers=user.headers)
+    ids = ",".join(str(row["local_id"]) for row in response.json())
+    await recorder.request(client, "GET", "/characters/{local_id}", {"local_id": local_id}, headers=user.headers)
+    await recorder.request(client, "GET", "/characters/effective_stats/", params={"ids": ids}, headers=user.headers)
+
+
+async def level_up(client, recorder, user, local_id):
+    """Reset to level 1, then a chain of level ups through the progression table."""
+    path = {"local_id": local_id}
+    await recorder.request(client, "PATCH", "/characters/{local_id}/set_level", path,
+                           params={"new_level": 1}, headers=user.headers)
+    for _ in range(LEVEL_CHAIN):
+        await recorder.request(client, "POST", "/characters/{local_id}/level_up", path, headers=user.headers)
+
+
+async def equip_churn(client, recorder, user, local_id):
+    """Equip an inventory item, read effective stats, unequip it."""
+    path = {"local_id": local_id}
+    items = await recorder.request(client, "GET", "/characters/{local_id}/equipment/", path, headers=user.headers)
+    for item in items.json():
+        path = {"local_id": local_id, "equipment_id": item["equipment_id"]}
+        await recorder.request(client, "PATCH", "/characters/{local_id}/equipment/{equipment_id}/equip",
+                               path, headers=user.headers)
+        await recorder.request(client, "GET", "/characters/{local_id}/effective_stats/", path, headers=user.headers)
+        await recorder.request(client, "PATCH", "/characters/{local_id}/equipment/{equipment_id}/unequip",
+                               path, headers=user.headers)
+
+
+async def catalog(client, recorder, user, local_id):
+    """Catalog pages, a progression row and a conditional revalidation."""
+    response = await recorder.request(client, "GET", "/abilities/", params={"limit": 100})
+    await recorder.request(client, "GET", "/abilities/", params={"limit": 100}, expect=(304,),
+                           headers={"If-None-Match": response.headers.get("etag", "")})
+    await recorder.request(client, "GET", "/equipment/", params={"limit": 100})
+    await recorder.request(client, "GET", "/character_classes/")
+    progressions = await recorder.request(client, "GET", "/class_progression/", params={"limit": 100})
+    rows = progressions.json()
+    if rows:
+        await recorder.request(client, "GET", "/class_progression/{prog_id}", {"prog_id": rows[-1]["id"]})
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "login": login,
+    "roster": roster,
+    "level_up": level_up,
+    "equip_churn": equip_churn,
+    "catalog": catalog,
+}
+
+
+async def run_scenario(client: httpx.AsyncClient, fixture: Fixture, scenario: Scenario,
+                       concurrency: int, iterations: int, warmup: int = 1) -> dict:
+    """Run a scenario with concurrent virtual users and return the report."""
+    slots = fixture.slots()
+    workers = [slots[index % len(slots)] for index in range(concurrency)]
+
+    async def worker(user, local_id, recorder, rounds):
+        for _ in range(rounds):
+            await scenario(client, recorder, user, local_id)
+
+    if warmup:
+        await asyncio.gather(*(worker(user, local_id, Recorder(), warmup) for user, local_id in workers))
+    recorder = Recorder()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(user, local_id, recorder, iterations) for user, local_id in workers))
+    return recorder.report(time.perf_counter() - started)
@@ -0,0 +1,75 @@
+"""Mixed read/write load with and without the SQLite profile.
+
+Readers run the roster scenario while writers run level-up chains at the
+same time, against serve.py on two copies of one generated database: one in
+rollback-journal mode with DB_SQLITE_PROFILE=0, one with the profile (WAL,
+synchronous=NORMAL, cache and mmap sizes). In rollback mode a write locks
+out the readers, so their latency is where the difference shows.
+
+Usage: python -m benchmarks.sqlite_profile [--workers N] [--readers N] [--writers N]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+from benchmarks import harness
+
+MODES = {"default": "0", "profile": "1"}
+
+
+async def mixed_load(workers: int, dataset, readers: int, writers: int, iterations: int) -> dict:
+    """Run readers and writers concurrently; return a report per side."""
+    # pylint: disable=import-outside-toplevel
+    from benchmarks import scenarios
+    async with harness.serve_client(connections=readers + writers, workers=workers) as client:
+        fixture = await scenarios.prepare(client, dataset, readers + writers)
+        reads, writes = await asyncio.gather(
+            scenarios.run_scenario(client, fixture, scenarios.roster, readers, iterations),
+            scenarios.run_scenario(client, fixture, scenarios.level_up, writers, iterations),
+        )
+    return {"reads": reads, "writes": writes}
+
+
+def main(argv=None) -> int:
+    """Generate a dataset, run the mixed load in both modes and print the comparison."""
+    parser = argparse.ArgumentParser(description="Compare mixed load with and without the SQLite profile.")
+    parser.add_argument("--workers", type=int, default=2, help="serve.py worker processes")
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--users", type=int, default=200)
+    args = parser.parse_args(argv)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="dnd-bench-") as tmp:
+        base = os.path.join(tmp, "base.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{base}"
+        # pylint: disable=import-outside-toplevel
+        import datagen
+        from database import engine
+        dataset = datagen.generate(engine, datagen.DatasetConfig(users=args.users))
+        engine.dispose()
+        for mode, enabled in MODES.items():
+            path = os.path.join(tmp, f"{mode}.db")
+            shutil.copy(base, path)
+            # Режим журнала хранится в файле: копию без профиля возвращаем к rollback journal
+            with sqlite3.connect(path) as conn:
+                conn.execute("PRAGMA journal_mode = WAL" if enabled == "1" else "PRAGMA journal_mode = DELETE")
+            os.environ.update({"DATABASE_URL": f"sqlite:///{path}", "DB_SQLITE_PROFILE": enabled})
+            results[mode] = asyncio.run(mixed_load(args.workers, dataset, args.readers, args.writers,
+                                                   args.iterations))
+    print(f"{'':<8}{'':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for side in ("reads", "writes"):
+        for mode in MODES:
+            total = results[mode][side]["total"]
+            print(f"{side:<8}{mode:<10}{total['rps']:>10}{total['p50_ms']:>10}{total['p95_ms']:>10}"
+                  f"{total['p99_ms']:>10}{total['errors']:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""Compare throughput of the production launcher with 1 and N workers.
+
+Generates one dataset, then for every worker count starts serve.py against
+it, runs the same scenarios over real HTTP and prints req/s side by side.
+Worker processes only help up to the number of CPUs; SQLite writes are
+still serialized by the database lock, so write scenarios gain less.
+
+Usage: python -m benchmarks.workers [--workers 1 4] [--scenario NAME ...]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+from benchmarks import harness
+
+
+async def measure(workers: int, dataset, scenario_names, concurrency: int, iterations: int) -> dict:
+    """Run the scenarios against serve.py with the given worker count."""
+    # pylint: disable=import-outside-toplevel
+    from benchmarks import scenarios
+    results = {}
+    async with harness.serve_client(connections=concurrency, workers=workers) as client:
+        fixture = await scenarios.prepare(client, dataset, concurrency)
+        for name in scenario_names:
+            results[name] = await scenarios.run_scenario(
+                client, fixture, scenarios.SCENARIOS[name], concurrency, iterations)
+    return results
+
+
+def main(argv=None) -> int:
+    """Generate the dataset, benchmark every worker count and print the comparison."""
+    parser = argparse.ArgumentParser(description="Compare req/s of serve.py with different worker counts.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--scenario", action="append",
+                        help="scenario to run, may repeat (default: login, roster, catalog, level_up)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args(argv)
+    names = args.scenario or ["login", "roster", "catalog", "level_up"]
+    with tempfile.TemporaryDirectory(prefix="dnd-bench-") as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        # pylint: disable=import-outside-toplevel
+        import datagen
+        from database import engine
+        dataset = datagen.generate(engine, datagen.DatasetConfig(users=args.users))
+        engine.dispose()
+        results = {workers: asyncio.run(measure(workers, dataset, names, args.concurrency, args.iterations))
+                   for workers in dict.fromkeys(args.workers)}
+    counts = list(results)
+    print(f"{'req/s':<12}" + "".join(f"{f'{count} worker(s)':>16}" for count in counts) + f"{'speedup':>10}")
+    for name in names:
+        rps = [results[count][name]["total"]["rps"] for count in counts]
+        print(f"{name:<12}" + "".join(f"{value:>16}" for value in rps) + f"{rps[-1] / rps[0]:>9.2f}x")
+        errors = sum(results[count][name]["total"]["errors"] for count in counts)
+        if errors:
+            print(f"  {name}: {errors} failed requests")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""Streaming NDJSON bulk import of catalog data."""
+
+import os
+from typing import AsyncIterator, Callable, Dict, List, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.orm import Session
+
+import cache
+import crud
+import effects
+import models
+import schemas
+from progression import progression_cache
+
+CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+
+
+def _insert_equipment(db: Session, items: List[tuple]) -> Tuple[int, List[Tuple[int, str]]]:
+    valid, errors = [], []
+    for line, item in items:
+        try:
+            effects.parse_effects(item.effects)
+        except ValueError as exc:
+            errors.append((line, str(exc)))
+            continue
+        valid.append((line, item))
+    inserted, duplicates = crud.bulk_create_named(db, models.Equipment, valid, "Equipment")
+    return inserted, errors + duplicates
+
+
+# Вид импорта: схема строки, вставка пачки, таблица справочника для сброса кэша
+IMPORTERS: Dict[str, Tuple[type, Callable, str]] = {
+    "abilities": (
+        schemas.AbilityCreate,
+        lambda db, items: crud.bulk_create_named(db, models.Ability, items, "Ability"),
+        "abilities",
+    ),
+    "equipment": (schemas.EquipmentCreate, _insert_equipment, "equipment"),
+    "class_progressions": (
+        schemas.ClassProgressionCreate,
+        crud.bulk_create_class_progressions,
+        "class_progressions",
+    ),
+}
+
+
+async def iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """Yield (line number, line) from a byte stream without buffering the body."""
+    buffer = b""
+    line_no = 0
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            yield line_no, line
+    if buffer:
+        yield line_no + 1, buffer
+
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc']) or 'line'}: {error['msg']}"
+        for error in exc.errors()
+    )
+
+
+async def import_ndjson(kind: str, stream: AsyncIterator[bytes], db: Session) -> dict:
+    """Import one NDJSON stream in a single transaction and return a per-line report.
+
+    Lines are validated as they arrive and flushed to the database in chunks
+    of CHUNK_SIZE; bad lines are reported and skipped, the rest is committed.
+    """
+    schema, insert_chunk, table = IMPORTERS[kind]
+    inserted = 0
+    errors: List[dict] = []
+    chunk: List[Tuple[int, BaseModel]] = []
+
+    async def flush():
+        nonlocal inserted
+        count, chunk_errors = await run_in_threadpool(insert_chunk, db, chunk)
+        inserted += count
+        errors.extend({"line": line, "error": message} for line, message in chunk_errors)
+        chunk.clear()
+
+    try:
+        async for line_no, line in iter_lines(stream):
+            if not line.strip():
+                continue
+            try:
+                chunk.append((line_no, schema.model_validate_json(line)))
+            except ValidationError as exc:
+                errors.append({"line": line_no, "error": _validation_message(exc)})
+                continue
+            if len(chunk) >= CHUNK_SIZE:
+                await flush()
+        if chunk:
+            await flush()
+        await run_in_threadpool(db.commit)
+    except BaseException:
+        await run_in_threadpool(db.rollback)
+        raise
+    cache.catalog_cache.invalidate(table)
+    if kind == "class_progressions":
+        progression_cache.invalidate()
+    errors.sort(key=lambda error: error["line"])
+    return {"inserted": inserted, "errors": errors}
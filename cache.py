@@ -0,0 +1,355 @@
+"""In-process caches for DnD project."""
+
+import bisect
+import json
+import mmap
+import os
+import secrets
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # нет на Windows: там воркеры делят только TTL
+    fcntl = None
+
+
+class SharedCounters:
+    """Named invalidation counters shared by the worker processes of one server.
+
+    With a file path (serve.py passes CACHE_SYNC_FILE to its workers) the
+    counters live in that file mapped into every process: a write bumps a
+    counter, and the other workers notice the change on their next cache
+    read and drop what they hold. Reading a counter is a memory load, so
+    checking it on every cache hit is cheap. Without a path the counters
+    are plain process memory.
+    """
+
+    # Инвалидация пользователей идёт по корзинам хеша имени: смена пароля
+    # сбрасывает токены 1/USER_BUCKETS пользователей, а не всех
+    USER_BUCKETS = 256
+    NAMES = ("character_classes", "class_progressions", "abilities", "equipment",
+             "progression", "characters", *(f"users:{bucket}" for bucket in range(USER_BUCKETS)))
+
+    def __init__(self, path: Optional[str] = None):
+        size = 8 * len(self.NAMES)
+        self._offsets = {name: 8 * index for index, name in enumerate(self.NAMES)}
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        if path:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._buffer = mmap.mmap(self._fd, size)
+        else:
+            self._buffer = bytearray(size)
+
+    def get(self, name: str) -> int:
+        """Return the current value of a counter."""
+        return struct.unpack_from("<Q", self._buffer, self._offsets[name])[0]
+
+    def bump(self, name: str) -> int:
+        """Increment a counter and return its new value."""
+        with self._lock:
+            # Блокировка файла: инкремент из двух процессов не должен потеряться
+            if self._fd is not None and fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                value = self.get(name) + 1
+                struct.pack_into("<Q", self._buffer, self._offsets[name], value)
+            finally:
+                if self._fd is not None and fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return value
+
+
+shared_counters = SharedCounters(os.getenv("CACHE_SYNC_FILE"))
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry expiry and a size bound."""
+
+    def __init__(self, maxsize: int, ttl: float, channel: Optional[str] = None,
+                 tag: Optional[Callable[[Any], str]] = None, counters: SharedCounters = shared_counters):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # channel + tag(value): запись помнит счётчик своей корзины и устаревает,
+        # когда invalidate_tag в любом воркере его увеличит
+        self.channel = channel
+        self._tag = tag
+        self._counters = counters
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _slot(self, tag: str) -> str:
+        return f"{self.channel}:{zlib.crc32(tag.encode()) % SharedCounters.USER_BUCKETS}"
+
+    def get(self, key: Any) -> Optional[Any]:
+        """Return cached value or None if missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, stamp = entry
+            if expires_at <= time.time() or (stamp is not None and self._counters.get(stamp[0]) != stamp[1]):
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Any, value: Any, expires_at: Optional[float] = None) -> None:
+        """Store value; expiry is capped by the cache TTL."""
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        stamp = None
+        if self.channel is not None and self._tag is not None:
+            slot = self._slot(self._tag(value))
+            stamp = (slot, self._counters.get(slot))
+        with self._lock:
+            self._data[key] = (value, deadline, stamp)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard_where(self, predicate) -> int:
+        """Drop every entry of this process whose value matches predicate, return how many."""
+        with self._lock:
+            keys = [key for key, (value, _, _) in self._data.items() if predicate(value)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def invalidate_tag(self, tag: str) -> int:
+        """Drop entries with this tag here and make other workers drop theirs on next read."""
+        removed = self.discard_where(lambda value: self._tag(value) == tag)
+        if self.channel is not None:
+            self._counters.bump(self._slot(tag))
+        return removed
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and current size."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+# Кэш аутентифицированных пользователей: токен -> schemas.User
+user_cache = TTLCache(
+    maxsize=int(os.getenv("AUTH_CACHE_MAXSIZE", "10000")),
+    ttl=float(os.getenv("AUTH_CACHE_TTL", "300")),
+    channel="users",
+    tag=lambda user: user.username,
+)
+
+
+def invalidate_user(username: str) -> int:
+    """Drop all cached tokens of a user (in every worker)."""
+    return user_cache.invalidate_tag(username)
+
+
+def dumps_json(content: Any) -> bytes:
+    """Serialize exactly like fastapi's JSONResponse does."""
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class _CatalogEntry:
+    """Snapshot of one catalog table: rows sorted by id plus rendered bodies."""
+
+    def __init__(self, version: int, rows: List[dict]):
+        self.version = version
+        self.loaded_at = time.time()
+        self.rows = sorted(rows, key=lambda row: row["id"])
+        self.ids = [row["id"] for row in self.rows]
+        self.items = {row["id"]: row for row in self.rows}
+        self.item_bodies: Dict[int, bytes] = {}
+        self.pages: Dict[Tuple[Optional[int], int], Tuple[bytes, Optional[int]]] = {}
+
+
+class CatalogCache:
+    """Versioned read-through cache of read-mostly catalog tables.
+
+    Each table keeps a version counter bumped by every write (see crud). A
+    snapshot holds already serialized rows, and rendered JSON bodies of pages
+    and single items are memoized, so a hot GET skips the ORM and Pydantic.
+    Versions are SharedCounters, so a write in one worker also invalidates
+    the snapshots of the others; the TTL only bounds staleness of writes
+    made outside the API.
+    """
+
+    TABLES = ("character_classes", "class_progressions", "abilities", "equipment")
+
+    def __init__(self, ttl: float, max_pages: int, counters: SharedCounters = shared_counters):
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self.hits = 0
+        self.misses = 0
+        self._counters = counters
+        self._entries: Dict[str, _CatalogEntry] = {}
+        self._lock = threading.Lock()
+
+    def version(self, table: str) -> int:
+        """Return current version of a table."""
+        return self._counters.get(table)
+
+    def invalidate(self, table: str) -> None:
+        """Bump table version and drop its snapshot."""
+        with self._lock:
+            self._counters.bump(table)
+            self._entries.pop(table, None)
+
+    def clear(self) -> None:
+        """Invalidate every table."""
+        for table in self.TABLES:
+            self.invalidate(table)
+
+    def _entry(self, table: str, loader: Callable[[], List[dict]]) -> _CatalogEntry:
+        entry = self._entries.get(table)
+        version = self.version(table)
+        if entry is not None and entry.version == version and entry.loaded_at + self.ttl > time.time():
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = _CatalogEntry(version, loader())
+        with self._lock:
+            # Запись, случившаяся во время загрузки, делает снимок устаревшим
+            if self.version(table) == version:
+                self._entries[table] = entry
+        return entry
+
+    def page(self, table: str, loader: Callable[[], List[dict]],
+             after: Optional[int], limit: int) -> Tuple[bytes, Optional[int]]:
+        """Return JSON body of a keyset page and the next cursor (or None)."""
+        entry = self._entry(table, loader)
+        key = (after, limit)
+        cached = entry.pages.get(key)
+        if cached is not None:
+            return cached
+        start = 0 if after is None else bisect.bisect_right(entry.ids, after)
+        rows = entry.rows[start:start + limit]
+        next_cursor = rows[-1]["id"] if start + limit < len(entry.rows) else None
+        result = (dumps_json(rows), next_cursor)
+        if len(entry.pages) >= self.max_pages:
+            entry.pages.clear()
+        entry.pages[key] = result
+        return result
+
+    def item(self, table: str, loader: Callable[[], List[dict]], item_id: int) -> Optional[bytes]:
+        """Return JSON body of a single row or None if there is no such id."""
+        entry = self._entry(table, loader)
+        body = entry.item_bodies.get(item_id)
+        if body is None:
+            row = entry.items.get(item_id)
+            if row is None:
+                return None
+            body = entry.item_bodies[item_id] = dumps_json(row)
+        return body
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters."""
+        return {"hits": self.hits, "misses": self.misses, "tables": len(self._entries)}
+
+
+catalog_cache = CatalogCache(
+    ttl=float(os.getenv("CATALOG_CACHE_TTL", "300")),
+    max_pages=int(os.getenv("CATALOG_CACHE_MAX_PAGES", "256")),
+)
+
+
+class VersionMap:
+    """Bounded map of entity versions for ETags.
+
+    Versions come from one shared counter, so a version never repeats. A key
+    that is not tracked (never written or evicted) reports the counter value
+    of the last eviction: never lower than anything it reported before, and
+    unchanged until the entity is written again. A write made by another
+    worker is not known by key, so it raises the version of every key here.
+    """
+
+    def __init__(self, maxsize: int, channel: str, counters: SharedCounters = shared_counters):
+        self.maxsize = maxsize
+        self.channel = channel
+        self._counters = counters
+        # Всё, что записано до запуска этого процесса, считаем чужой записью
+        self._seen = self._foreign = counters.get(channel)
+        self._floor = 0
+        self._data: "OrderedDict[Any, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> int:
+        """Return current version of key."""
+        current = self._counters.get(self.channel)
+        if current != self._seen:
+            with self._lock:
+                self._foreign = max(self._foreign, current)
+                self._seen = max(self._seen, current)
+        return max(self._data.get(key, self._floor), self._foreign)
+
+    def bump(self, key: Any) -> int:
+        """Give key a new version and return it."""
+        with self._lock:
+            version = self._counters.bump(self.channel)
+            if version != self._seen + 1:
+                # Между нашими записями писали другие воркеры
+                self._foreign = max(self._foreign, version - 1)
+            self._seen = max(self._seen, version)
+            self._data[key] = version
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                _, evicted = self._data.popitem(last=False)
+                self._floor = max(self._floor, evicted)
+            return version
+
+
+# Версии живут в памяти сервера; идентификатор запуска не даёт ETag совпасть
+# с выданным до перезапуска. serve.py задаёт общий CACHE_BOOT_ID всем воркерам
+BOOT_ID = os.getenv("CACHE_BOOT_ID") or secrets.token_hex(4)
+
+character_versions = VersionMap(maxsize=int(os.getenv("CHARACTER_VERSIONS_MAXSIZE", "100000")),
+                                channel="characters")
+
+
+def bump_character(owner_id: int, local_id: int) -> None:
+    """Mark a character as changed."""
+    character_versions.bump((owner_id, local_id))
+
+
+def catalog_etag(table: str) -> str:
+    """Strong ETag of a catalog table."""
+    return f'"{BOOT_ID}-{table}-{catalog_cache.version(table)}"'
+
+
+def character_etag(owner_id: int, local_id: int) -> str:
+    """Strong ETag of a character including the catalog rows it embeds."""
+    return '"{}-c{}-{}-{}-{}"'.format(
+        BOOT_ID,
+        character_versions.get((owner_id, local_id)),
+        catalog_cache.version("character_classes"),
+        catalog_cache.version("abilities"),
+        catalog_cache.version("equipment"),
+    )
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header value against an ETag."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
@@ -1,11 +1,71 @@
 """CRUD operations for DnD project."""
 
-from typing import Optional, List
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from typing import Dict, Optional, List, Tuple
+from sqlalchemy.orm import Session, joinedload, raiseload, selectinload
+from sqlalchemy import event, insert, update
 
+import cache
+import database
+import effects
 import models
 import schemas
+from progression import ProgressionTable, progression_cache
+
+
+def character_load_options() -> list:
+    """Loader options for everything schemas.Character serializes.
+
+    Collections are loaded with selectinload (one extra query per relationship
+    for the whole result), many-to-one links with joinedload. In strict mode
+    any other relationship access raises instead of lazy-loading.
+    """
+    options = [
+        selectinload(models.Character.abilities).joinedload(models.CharacterAbility.ability),
+        selectinload(models.Character.equipment).joinedload(models.CharacterEquipment.equipment),
+        joinedload(models.Character.character_class),
+    ]
+    if database.STRICT_LOADING:
+        options.append(raiseload("*"))
+    return options
+
+
+def keyset_page(query, column, after: Optional[int] = None, limit: Optional[int] = None) -> list:
+    """Return rows ordered by column, starting after the given cursor.
+
+    The cursor is a primary key value, so every page is a range scan on the
+    primary key index and costs the same as the first one (unlike OFFSET).
+    """
+    if after is not None:
+        query = query.filter(column > after)
+    query = query.order_by(column)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def mark_character_changed(db: Session, character: models.Character) -> None:
+    """Schedule an ETag version bump of a character for the next commit."""
+    db.info.setdefault("changed_characters", set()).add((character.owner_id, character.local_id))
+
+
+def touch_character(db: Session, character_id: int) -> None:
+    """Same as mark_character_changed, by id (usually an identity map hit)."""
+    character = db.get(models.Character, character_id)
+    if character is not None:
+        mark_character_changed(db, character)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_changed_characters(db: Session) -> None:
+    # Версия меняется только после коммита: иначе параллельный GET мог бы
+    # закэшировать старые данные под новым ETag
+    for owner_id, local_id in db.info.pop("changed_characters", ()):
+        cache.bump_character(owner_id, local_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_characters(db: Session) -> None:
+    db.info.pop("changed_characters", None)
 
 
 def get_user_by_username(db: Session, username: str) -> Optional[models.User]:
@@ -13,9 +73,8 @@ def get_user_by_username(db: Session, username: str) -> Optional[models.User]:
     return db.query(models.User).filter(models.User.username == username).first()
 
 
-def create_user(db: Session, user: schemas.UserCreate) -> models.User:
-    """Create new user."""
-    hashed_password = user.password  # Для настоящего проекта используй хеширование!
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str) -> models.User:
+    """Create new user with an already hashed password (see passwords)."""
     db_user = models.User(username=user.username, hashed_password=hashed_password)
     db.add(db_user)
     db.commit()
@@ -23,11 +82,12 @@ def create_user(db: Session, user: schemas.UserCreate) -> models.User:
     return db_user
 
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[models.User]:
-    """Authenticate user by username and password."""
-    user = get_user_by_username(db, username)
-    if not user or user.hashed_password != password:
-        return None
+def update_user_password(db: Session, user: models.User, hashed_password: str) -> models.User:
+    """Replace the stored password hash of a user."""
+    user.hashed_password = hashed_password
+    db.commit()
+    db.refresh(user)
+    cache.invalidate_user(user.username)
     return user
 
 
@@ -40,13 +100,14 @@ def create_character_class(db: Session, char_class: schemas.CharacterClassCreate
     db.add(db_class)
     db.commit()
     db.refresh(db_class)
+    cache.catalog_cache.invalidate("character_classes")
     return db_class
 
 
 
-def get_character_classes(db: Session) -> List[models.CharacterClass]:
-    """Get all character classes."""
-    return db.query(models.CharacterClass).all()
+def get_character_classes(db: Session, after: Optional[int] = None, limit: Optional[int] = None) -> List[models.CharacterClass]:
+    """Get character classes, optionally one keyset page."""
+    return keyset_page(db.query(models.CharacterClass), models.CharacterClass.id, after, limit)
 
 
 def update_character_class(db: Session, class_id: int, char_class: schemas.CharacterClassCreate) -> Optional[models.CharacterClass]:
@@ -58,6 +119,7 @@ def update_character_class(db: Session, class_id: int, char_class: schemas.Chara
         setattr(db_class, field, value)
     db.commit()
     db.refresh(db_class)
+    cache.catalog_cache.invalidate("character_classes")
     return db_class
 
 
@@ -68,12 +130,13 @@ def delete_character_class(db: Session, class_id: int) -> Optional[models.Charac
         return None
     db.delete(db_class)
     db.commit()
+    cache.catalog_cache.invalidate("character_classes")
     return db_class
 
 
-def get_class_progressions(db: Session) -> List[models.ClassProgression]:
-    """Get all class progressions."""
-    return db.query(models.ClassProgression).all()
+def get_class_progressions(db: Session, after: Optional[int] = None, limit: Optional[int] = None) -> List[models.ClassProgression]:
+    """Get class progressions, optionally one keyset page."""
+    return keyset_page(db.query(models.ClassProgression), models.ClassProgression.id, after, limit)
 
 
 def get_class_progression(db: Session, progression_id: int) -> Optional[models.ClassProgression]:
@@ -87,6 +150,8 @@ def create_class_progression(db: Session, progression: schemas.ClassProgressionC
     db.add(db_prog)
     db.commit()
     db.refresh(db_prog)
+    cache.catalog_cache.invalidate("class_progressions")
+    progression_cache.invalidate()
     return db_prog
 
 
@@ -99,6 +164,8 @@ def update_class_progression(db: Session, progression_id: int, progression: sche
         setattr(db_prog, field, value)
     db.commit()
     db.refresh(db_prog)
+    cache.catalog_cache.invalidate("class_progressions")
+    progression_cache.invalidate()
     return db_prog
 
 
@@ -109,6 +176,8 @@ def delete_class_progression(db: Session, progression_id: int) -> Optional[model
         return None
     db.delete(db_prog)
     db.commit()
+    cache.catalog_cache.invalidate("class_progressions")
+    progression_cache.invalidate()
     return db_prog
 
 
@@ -129,13 +198,52 @@ def create_ability(db: Session, ability: schemas.AbilityCreate) -> models.Abilit
     db.add(db_ability)
     db.commit()
     db.refresh(db_ability)
+    cache.catalog_cache.invalidate("abilities")
     return db_ability
 
 
 
-def get_abilities(db: Session) -> List[models.Ability]:
-    """Get all abilities."""
-    return db.query(models.Ability).all()
+def get_abilities(db: Session, after: Optional[int] = None, limit: Optional[int] = None) -> List[models.Ability]:
+    """Get abilities, optionally one keyset page."""
+    return keyset_page(db.query(models.Ability), models.Ability.id, after, limit)
+
+
+def bulk_create_named(db: Session, model, items: List[tuple], label: str) -> Tuple[int, List[Tuple[int, str]]]:
+    """Insert a chunk of (line, schema) catalog items with unique names.
+
+    Duplicates (already stored, or repeated in the import) are checked with a
+    single query per chunk; rows are inserted with one executemany. Nothing is
+    committed: the caller commits once per import.
+    """
+    names = [item.name for _, item in items]
+    existing = {name for name, in db.query(model.name).filter(model.name.in_(names))}
+    rows, errors = [], []
+    for line, item in items:
+        if item.name in existing:
+            errors.append((line, f"{label} with this name already exists"))
+            continue
+        existing.add(item.name)
+        rows.append(item.dict())
+    if rows:
+        db.execute(insert(model), rows)
+    return len(rows), errors
+
+
+def bulk_create_class_progressions(db: Session, items: List[tuple]) -> Tuple[int, List[Tuple[int, str]]]:
+    """Insert a chunk of (line, schema) class progressions, checking class ids in one query."""
+    class_ids = {item.character_class_id for _, item in items}
+    known = {class_id for class_id, in db.query(models.CharacterClass.id).filter(
+        models.CharacterClass.id.in_(class_ids)
+    )}
+    rows, errors = [], []
+    for line, item in items:
+        if item.character_class_id not in known:
+            errors.append((line, "Character class not found"))
+            continue
+        rows.append(item.dict())
+    if rows:
+        db.execute(insert(models.ClassProgression), rows)
+    return len(rows), errors
 
 
 def create_equipment(db: Session, equipment: schemas.EquipmentCreate) -> models.Equipment:
@@ -143,55 +251,97 @@ def create_equipment(db: Session, equipment: schemas.EquipmentCreate) -> models.
     existing = db.query(models.Equipment).filter(models.Equipment.name == equipment.name).first()
     if existing:
         raise ValueError("Equipment with this name already exists")
+    compiled = effects.parse_effects(equipment.effects)
     db_equipment = models.Equipment(**equipment.dict())
     db.add(db_equipment)
     db.commit()
     db.refresh(db_equipment)
+    effects.registry.register(db_equipment.id, compiled)
+    cache.catalog_cache.invalidate("equipment")
     return db_equipment
 
 
 
-def get_equipments(db: Session) -> List[models.Equipment]:
-    """Get all equipment."""
-    return db.query(models.Equipment).all()
+def get_equipments(db: Session, after: Optional[int] = None, limit: Optional[int] = None) -> List[models.Equipment]:
+    """Get equipment, optionally one keyset page."""
+    return keyset_page(db.query(models.Equipment), models.Equipment.id, after, limit)
 
 
 def create_character(db: Session, character: schemas.CharacterCreate, user_id: int) -> models.Character:
-    """Create a new character for a user."""
-    last_local = db.query(func.max(models.Character.local_id)).filter(models.Character.owner_id == user_id).scalar()
-    next_local_id = 1 if last_local is None else last_local + 1
+    """Create a new character for a user.
+
+    local_id comes from the owner's counter, bumped by a single UPDATE ...
+    RETURNING in the same transaction as the insert: the UPDATE takes the
+    write lock, so concurrent creates are serialized and never collide.
+    """
+    next_local_id = db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(last_local_id=models.User.last_local_id + 1)
+        .returning(models.User.last_local_id)
+    ).scalar_one()
     db_character = models.Character(
         **character.dict(exclude={"local_id"}),
         owner_id=user_id,
         local_id=next_local_id
     )
     db.add(db_character)
+    db.flush()
+    db.add(models.CharacterStats(character_id=db_character.id, **effects.base_stats(db_character)))
+    mark_character_changed(db, db_character)
     db.commit()
     db.refresh(db_character)
     return db_character
 
 
-def get_characters_by_user(db: Session, user_id: int) -> List[models.Character]:
-    """Get all characters for a user."""
-    return db.query(models.Character).filter(models.Character.owner_id == user_id).all()
+def get_characters_by_user(db: Session, user_id: int, after: Optional[int] = None, limit: Optional[int] = None) -> List[models.Character]:
+    """Get characters for a user, optionally one keyset page."""
+    query = db.query(models.Character).options(*character_load_options()).filter(
+        models.Character.owner_id == user_id
+    )
+    return keyset_page(query, models.Character.id, after, limit)
+
+
+def characters_export_query(db: Session, user_id: int):
+    """Query of all characters of a user for streaming (use with yield_per)."""
+    return db.query(models.Character).options(*character_load_options()).filter(
+        models.Character.owner_id == user_id
+    ).order_by(models.Character.id)
 
 
 def get_character_by_local_id(db: Session, user_id: int, local_id: int) -> Optional[models.Character]:
     """Get a character by user id and local_id."""
-    return db.query(models.Character).filter(
+    return db.query(models.Character).options(*character_load_options()).filter(
         models.Character.owner_id == user_id,
         models.Character.local_id == local_id
     ).first()
 
 
+def get_character_id_by_local_id(db: Session, user_id: int, local_id: int) -> Optional[int]:
+    """Get only the id of a character by user id and local_id."""
+    # Маршрутам записи нужен только id: граф персонажа не загружаем
+    return db.query(models.Character.id).filter(
+        models.Character.owner_id == user_id,
+        models.Character.local_id == local_id
+    ).scalar()
+
+
 def update_character(db: Session, character_id: int, character_update: schemas.CharacterCreate) -> Optional[models.Character]:
     """Update a character by id."""
     character = db.query(models.Character).filter(models.Character.id == character_id).first()
     if not character:
         return None
+    old_base = effects.base_stats(character)
+    old_level = character.level
     for field, value in character_update.dict().items():
         if field != "local_id":
             setattr(character, field, value)
+    if character.level != old_level:
+        # Уровень и HP заданы клиентом напрямую: прогрессия отсчитывается от нового уровня
+        character.base_level = character.level
+    new_base = effects.base_stats(character)
+    apply_stats_delta(db, character.id, {field: new_base[field] - old_base[field] for field in new_base})
+    mark_character_changed(db, character)
     db.commit()
     db.refresh(character)
     return character
@@ -201,13 +351,19 @@ def delete_character(db: Session, character_id: int) -> None:
     """Delete a character by id."""
     character = db.query(models.Character).filter(models.Character.id == character_id).first()
     if character:
+        db.query(models.CharacterStats).filter(
+            models.CharacterStats.character_id == character_id
+        ).delete(synchronize_session=False)
         db.delete(character)
+        mark_character_changed(db, character)
         db.commit()
 
 
 def get_character_abilities(db: Session, character_id: int) -> List[models.CharacterAbility]:
     """Get all abilities of a character."""
-    return db.query(models.CharacterAbility).filter(models.CharacterAbility.character_id == character_id).all()
+    return db.query(models.CharacterAbility).options(
+        joinedload(models.CharacterAbility.ability)
+    ).filter(models.CharacterAbility.character_id == character_id).all()
 
 
 def add_ability_to_character(db: Session, character_id: int, ca: schemas.CharacterAbilityCreate) -> models.CharacterAbility:
@@ -220,6 +376,7 @@ def add_ability_to_character(db: Session, character_id: int, ca: schemas.Charact
         raise ValueError("This character already has this ability")
     db_ca = models.CharacterAbility(character_id=character_id, **ca.dict())
     db.add(db_ca)
+    touch_character(db, character_id)
     db.commit()
     db.refresh(db_ca)
     return db_ca
@@ -235,27 +392,194 @@ def remove_ability_from_character(db: Session, character_id: int, ability_id: in
     if not db_ca:
         return None
     db.delete(db_ca)
+    touch_character(db, character_id)
     db.commit()
     return db_ca
 
 
 def get_character_equipments(db: Session, character_id: int) -> List[models.CharacterEquipment]:
     """Get all equipment of a character."""
-    return db.query(models.CharacterEquipment).filter(models.CharacterEquipment.character_id == character_id).all()
+    return db.query(models.CharacterEquipment).options(
+        joinedload(models.CharacterEquipment.equipment)
+    ).filter(models.CharacterEquipment.character_id == character_id).all()
 
 
 def get_character_equipped_items(db: Session, character_id: int) -> List[models.CharacterEquipment]:
     """Get all equipped items of a character."""
-    return db.query(models.CharacterEquipment).filter(
+    return db.query(models.CharacterEquipment).options(
+        joinedload(models.CharacterEquipment.equipment)
+    ).filter(
         models.CharacterEquipment.character_id == character_id,
         models.CharacterEquipment.is_equipped.is_(True)
     ).all()
 
 
+def get_equipped_effects(db: Session, character_id: int) -> List[Dict[str, int]]:
+    """Get compiled effects of all items a character has equipped."""
+    equipment_ids = [
+        row.equipment_id
+        for row in db.query(models.CharacterEquipment.equipment_id).filter(
+            models.CharacterEquipment.character_id == character_id,
+            models.CharacterEquipment.is_equipped.is_(True)
+        )
+    ]
+    return get_equipment_effects(db, equipment_ids)
+
+
+def get_equipment_effects(db: Session, equipment_ids: List[int]) -> List[Dict[str, int]]:
+    """Get compiled effects by equipment id, compiling unseen items in one query."""
+    missing = {eq_id for eq_id in equipment_ids if eq_id not in effects.registry}
+    if missing:
+        for eq_id, raw in db.query(models.Equipment.id, models.Equipment.effects).filter(
+            models.Equipment.id.in_(missing)
+        ):
+            effects.registry.register_raw(eq_id, raw)
+    return [effects.registry.get(eq_id) for eq_id in equipment_ids if eq_id in effects.registry]
+
+
+def equipment_delta(db: Session, equipment_id: int, sign: int = 1) -> Dict[str, int]:
+    """Stat change caused by equipping (sign=1) or unequipping (sign=-1) an item."""
+    return effects.apply_effects(dict.fromkeys(effects.STAT_FIELDS, 0), get_equipment_effects(db, [equipment_id]), sign)
+
+
+def apply_stats_delta(db: Session, character_id: int, delta: Dict[str, int]) -> None:
+    """Add delta to the materialized effective stats of a character (atomic UPDATE)."""
+    delta = {field: value for field, value in delta.items() if value}
+    if not delta:
+        return
+    db.query(models.CharacterStats).filter(models.CharacterStats.character_id == character_id).update(
+        {
+            getattr(models.CharacterStats, field): getattr(models.CharacterStats, field) + value
+            for field, value in delta.items()
+        },
+        synchronize_session=False
+    )
+
+
+def compute_effective_stats(db: Session, character: models.Character) -> Dict[str, int]:
+    """Compute effective stats from scratch: base stats plus equipped item effects."""
+    return effects.apply_effects(effects.base_stats(character), get_equipped_effects(db, character.id))
+
+
+def get_effective_stats(db: Session, user_id: int, local_id: int, backfill: bool = True) -> Optional[Dict[str, int]]:
+    """Get materialized effective stats of a character by user id and local_id.
+
+    Missing stats are computed; backfill=False (read-only sessions) skips saving them.
+    """
+    row = db.query(models.CharacterStats).join(
+        models.Character, models.Character.id == models.CharacterStats.character_id
+    ).filter(
+        models.Character.owner_id == user_id,
+        models.Character.local_id == local_id
+    ).first()
+    if row is None:
+        # Персонаж создан до появления материализованных статов: считаем и сохраняем
+        character = db.query(models.Character).filter(
+            models.Character.owner_id == user_id,
+            models.Character.local_id == local_id
+        ).first()
+        if character is None:
+            return None
+        stats = compute_effective_stats(db, character)
+        if backfill:
+            db.add(models.CharacterStats(character_id=character.id, **stats))
+            db.commit()
+        return stats
+    return {field: getattr(row, field) for field in effects.STAT_FIELDS}
+
+
+def get_effective_stats_batch(db: Session, user_id: int, local_ids: Optional[List[int]] = None,
+                              backfill: bool = True) -> List[Dict[str, int]]:
+    """Get effective stats of many (or all) characters of a user in one query."""
+    query = db.query(models.Character.id, models.Character.local_id, models.CharacterStats).outerjoin(
+        models.CharacterStats, models.CharacterStats.character_id == models.Character.id
+    ).filter(models.Character.owner_id == user_id)
+    if local_ids is not None:
+        query = query.filter(models.Character.local_id.in_(local_ids))
+    rows = query.order_by(models.Character.local_id).all()
+    missing = compute_missing_stats(db, [character_id for character_id, _, row in rows if row is None])
+    result = []
+    for character_id, local_id, row in rows:
+        if row is None:
+            stats = missing[character_id]
+        else:
+            stats = {field: getattr(row, field) for field in effects.STAT_FIELDS}
+        result.append({"local_id": local_id, **stats})
+    if backfill and missing:
+        db.add_all(models.CharacterStats(character_id=character_id, **stats) for character_id, stats in missing.items())
+        db.commit()
+    return result
+
+
+def compute_missing_stats(db: Session, character_ids: List[int]) -> Dict[int, Dict[str, int]]:
+    """Compute effective stats of several characters with a constant number of queries."""
+    if not character_ids:
+        return {}
+    equipped: Dict[int, List[int]] = {}
+    for character_id, equipment_id in db.query(
+        models.CharacterEquipment.character_id, models.CharacterEquipment.equipment_id
+    ).filter(
+        models.CharacterEquipment.character_id.in_(character_ids),
+        models.CharacterEquipment.is_equipped.is_(True)
+    ):
+        equipped.setdefault(character_id, []).append(equipment_id)
+    get_equipment_effects(db, list({eq_id for ids in equipped.values() for eq_id in ids}))
+    stat_columns = [getattr(models.Character, field) for field in effects.STAT_FIELDS]
+    return {
+        row.id: effects.apply_effects(effects.base_stats(row), [
+            effects.registry.get(eq_id) for eq_id in equipped.get(row.id, ()) if eq_id in effects.registry
+        ])
+        for row in db.query(models.Character.id, *stat_columns).filter(models.Character.id.in_(character_ids))
+    }
+
+
+def rebuild_effective_stats(db: Session, repair: bool = True) -> List[int]:
+    """Verify materialized effective stats against a full recomputation.
+
+    Returns ids of characters whose stored stats were missing or wrong; with
+    repair=True they are fixed and orphaned rows are removed.
+    """
+    equipped: Dict[int, List[int]] = {}
+    for character_id, equipment_id in db.query(
+        models.CharacterEquipment.character_id, models.CharacterEquipment.equipment_id
+    ).filter(models.CharacterEquipment.is_equipped.is_(True)):
+        equipped.setdefault(character_id, []).append(equipment_id)
+    get_equipment_effects(db, list({eq_id for ids in equipped.values() for eq_id in ids}))
+
+    mismatched = []
+    rows = db.query(models.Character, models.CharacterStats).outerjoin(
+        models.CharacterStats, models.CharacterStats.character_id == models.Character.id
+    ).yield_per(1000)
+    for character, row in rows:
+        expected = effects.apply_effects(effects.base_stats(character), [
+            effects.registry.get(eq_id) for eq_id in equipped.get(character.id, ())
+            if eq_id in effects.registry
+        ])
+        if row is not None and all(getattr(row, field) == expected[field] for field in effects.STAT_FIELDS):
+            continue
+        mismatched.append(character.id)
+        if not repair:
+            continue
+        if row is None:
+            db.add(models.CharacterStats(character_id=character.id, **expected))
+        else:
+            for field, value in expected.items():
+                setattr(row, field, value)
+    if repair:
+        db.query(models.CharacterStats).filter(
+            ~models.CharacterStats.character_id.in_(db.query(models.Character.id))
+        ).delete(synchronize_session=False)
+        db.commit()
+    return mismatched
+
+
 def add_equipment_to_character(db: Session, character_id: int, ce: schemas.CharacterEquipmentCreate) -> models.CharacterEquipment:
     """Add equipment to a character."""
     db_ce = models.CharacterEquipment(character_id=character_id, **ce.dict())
     db.add(db_ce)
+    if ce.is_equipped:
+        apply_stats_delta(db, character_id, equipment_delta(db, ce.equipment_id))
+    touch_character(db, character_id)
     db.commit()
     db.refresh(db_ce)
     return db_ce
@@ -269,7 +593,10 @@ def remove_equipment_from_character(db: Session, character_id: int, equipment_id
     ).first()
     if not db_ce:
         return None
+    if db_ce.is_equipped:
+        apply_stats_delta(db, character_id, equipment_delta(db, equipment_id, -1))
     db.delete(db_ce)
+    touch_character(db, character_id)
     db.commit()
     return db_ce
 
@@ -282,37 +609,117 @@ def set_equipment_equipped(db: Session, character_id: int, equipment_id: int, eq
     ).first()
     if not db_ce:
         return None
+    if bool(db_ce.is_equipped) != equipped:
+        apply_stats_delta(db, character_id, equipment_delta(db, equipment_id, 1 if equipped else -1))
     db_ce.is_equipped = equipped
+    touch_character(db, character_id)
     db.commit()
     db.refresh(db_ce)
     return db_ce
 
-import json
+def get_progression_table(db: Session, character_class_id: int) -> ProgressionTable:
+    """Get the cumulative progression table of a class (cached)."""
+    def load():
+        return db.query(
+            models.ClassProgression.id,
+            models.ClassProgression.level,
+            models.ClassProgression.hp_bonus,
+            models.ClassProgressionAbility.ability_id
+        ).outerjoin(
+            models.ClassProgressionAbility,
+            models.ClassProgressionAbility.class_progression_id == models.ClassProgression.id
+        ).filter(models.ClassProgression.character_class_id == character_class_id).all()
+    return progression_cache.get(character_class_id, load)
+
+
+def add_ability_to_progression(db: Session, progression_id: int, ability_id: int) -> models.ClassProgressionAbility:
+    """Link an ability to a class progression."""
+    existing = db.query(models.ClassProgressionAbility).filter(
+        models.ClassProgressionAbility.class_progression_id == progression_id,
+        models.ClassProgressionAbility.ability_id == ability_id
+    ).first()
+    if existing:
+        raise ValueError("This progression already grants this ability")
+    cpa = models.ClassProgressionAbility(
+        class_progression_id=progression_id,
+        ability_id=ability_id
+    )
+    db.add(cpa)
+    db.commit()
+    db.refresh(cpa)
+    progression_cache.invalidate()
+    return cpa
+
+
+def remove_ability_from_progression(db: Session, progression_id: int, ability_id: int) -> Optional[models.ClassProgressionAbility]:
+    """Unlink an ability from a class progression."""
+    cpa = db.query(models.ClassProgressionAbility).filter(
+        models.ClassProgressionAbility.class_progression_id == progression_id,
+        models.ClassProgressionAbility.ability_id == ability_id
+    ).first()
+    if not cpa:
+        return None
+    db.delete(cpa)
+    db.commit()
+    progression_cache.invalidate()
+    return cpa
+
 
 def sync_character_level(db: Session, character: models.Character, new_level: int) -> models.Character:
-    """Sync character's abilities and bonuses with class progression for new level."""
-    for lvl in range(character.level + 1, new_level + 1):
-        progression = get_progression_for_class_and_level(db, character.character_class_id, lvl)
-        if progression:
-            ability_ids = get_abilities_for_progression(db, progression.id)
-            for ab_id in ability_ids:
-                exists = db.query(models.CharacterAbility).filter(
-                    models.CharacterAbility.character_id == character.id,
-                    models.CharacterAbility.ability_id == ab_id
-                ).first()
-                if not exists:
-                    db.add(models.CharacterAbility(character_id=character.id, ability_id=ab_id))
-            # HP бонусы
-            if progression.hp_bonus:
-                character.max_hp += progression.hp_bonus
-                character.current_hp += progression.hp_bonus
+    """Sync character's abilities and HP with class progression for a new level.
+
+    Uses the cached cumulative progression table of the class, so any jump is
+    two lookups plus a set diff; the database only sees one anti-join for the
+    abilities the character lacks and one executemany insert (or one delete
+    when levelling down). Levelling down removes only what progression granted:
+    abilities it added and HP of crossed levels above base_level.
+    """
+    if new_level < 1:
+        raise ValueError("Level must be at least 1")
+    old_level = character.level or 1
+    base_level = character.base_level or 1
+    table = get_progression_table(db, character.character_class_id)
+    _, old_abilities = table.at(old_level)
+    _, new_abilities = table.at(new_level)
+    # HP уровней до base_level персонаж получил при создании, а не из прогрессии
+    old_hp, _ = table.at(max(old_level, base_level))
+    new_hp, _ = table.at(max(new_level, base_level))
+
+    old_base = effects.base_stats(character)
+    gained = new_abilities - old_abilities
+    if gained:
+        owned = db.query(models.CharacterAbility.ability_id).filter(
+            models.CharacterAbility.character_id == character.id,
+            models.CharacterAbility.ability_id.in_(gained)
+        )
+        missing = gained - {ability_id for ability_id, in owned}
+        if missing:
+            db.execute(insert(models.CharacterAbility), [
+                {"character_id": character.id, "ability_id": ability_id, "from_progression": True}
+                for ability_id in sorted(missing)
+            ])
+    lost = old_abilities - new_abilities
+    if lost:
+        # Способности, добавленные игроком вручную, понижение уровня не трогает
+        db.query(models.CharacterAbility).filter(
+            models.CharacterAbility.character_id == character.id,
+            models.CharacterAbility.ability_id.in_(lost),
+            models.CharacterAbility.from_progression.is_(True)
+        ).delete(synchronize_session=False)
+    character.max_hp += new_hp - old_hp
+    character.current_hp += new_hp - old_hp
+    if new_level < old_level:
+        # Понижение уровня: не выше нового максимума и не ниже нуля
+        character.current_hp = max(0, min(character.current_hp, character.max_hp))
     character.level = new_level
+    new_base = effects.base_stats(character)
+    apply_stats_delta(db, character.id, {field: new_base[field] - old_base[field] for field in new_base})
+    mark_character_changed(db, character)
     db.commit()
     db.refresh(character)
     return character
 
 
-
 def get_progression_for_class_and_level(db: Session, character_class_id: int, level: int):
     """Получить progression для класса и уровня."""
     return db.query(models.ClassProgression).filter(
@@ -0,0 +1,201 @@
+"""Async CRUD operations for DnD project (AsyncSession variant of crud)."""
+
+from typing import Dict, List, Optional
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from crud import character_load_options, get_progression_table, mark_character_changed
+import effects
+import models
+
+
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[models.User]:
+    """Return user object by username."""
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    return result.scalars().first()
+
+
+async def get_characters_by_user(db: AsyncSession, user_id: int, after: Optional[int] = None, limit: Optional[int] = None) -> List[models.Character]:
+    """Get characters for a user, optionally one keyset page."""
+    query = (
+        select(models.Character)
+        .where(models.Character.owner_id == user_id)
+        .options(*character_load_options())
+        .order_by(models.Character.id)
+    )
+    if after is not None:
+        query = query.where(models.Character.id > after)
+    if limit is not None:
+        query = query.limit(limit)
+    result = await db.execute(query)
+    return list(result.scalars().all())
+
+
+async def get_character_by_local_id(db: AsyncSession, user_id: int, local_id: int) -> Optional[models.Character]:
+    """Get a character by user id and local_id."""
+    result = await db.execute(
+        select(models.Character)
+        .where(models.Character.owner_id == user_id, models.Character.local_id == local_id)
+        .options(*character_load_options())
+    )
+    return result.scalars().first()
+
+
+async def get_character_id_by_local_id(db: AsyncSession, user_id: int, local_id: int) -> Optional[int]:
+    """Get only the id of a character by user id and local_id."""
+    result = await db.execute(
+        select(models.Character.id)
+        .where(models.Character.owner_id == user_id, models.Character.local_id == local_id)
+    )
+    return result.scalar()
+
+
+async def get_character_abilities(db: AsyncSession, character_id: int) -> List[models.CharacterAbility]:
+    """Get all abilities of a character."""
+    result = await db.execute(
+        select(models.CharacterAbility)
+        .where(models.CharacterAbility.character_id == character_id)
+        .options(joinedload(models.CharacterAbility.ability))
+    )
+    return list(result.scalars().all())
+
+
+async def get_character_equipments(db: AsyncSession, character_id: int) -> List[models.CharacterEquipment]:
+    """Get all equipment of a character."""
+    result = await db.execute(
+        select(models.CharacterEquipment)
+        .where(models.CharacterEquipment.character_id == character_id)
+        .options(joinedload(models.CharacterEquipment.equipment))
+    )
+    return list(result.scalars().all())
+
+
+async def get_character_equipped_items(db: AsyncSession, character_id: int) -> List[models.CharacterEquipment]:
+    """Get all equipped items of a character."""
+    result = await db.execute(
+        select(models.CharacterEquipment)
+        .where(
+            models.CharacterEquipment.character_id == character_id,
+            models.CharacterEquipment.is_equipped.is_(True),
+        )
+        .options(joinedload(models.CharacterEquipment.equipment))
+    )
+    return list(result.scalars().all())
+
+
+async def touch_character(db: AsyncSession, character_id: int) -> None:
+    """Same as crud.mark_character_changed, by id (usually an identity map hit)."""
+    character = await db.get(models.Character, character_id)
+    if character is not None:
+        mark_character_changed(db, character)
+
+
+async def get_equipment_effects(db: AsyncSession, equipment_ids: List[int]) -> List[Dict[str, int]]:
+    """Get compiled effects by equipment id, compiling unseen items in one query."""
+    missing = {eq_id for eq_id in equipment_ids if eq_id not in effects.registry}
+    if missing:
+        result = await db.execute(
+            select(models.Equipment.id, models.Equipment.effects).where(models.Equipment.id.in_(missing))
+        )
+        for eq_id, raw in result:
+            effects.registry.register_raw(eq_id, raw)
+    return [effects.registry.get(eq_id) for eq_id in equipment_ids if eq_id in effects.registry]
+
+
+async def apply_stats_delta(db: AsyncSession, character_id: int, delta: Dict[str, int]) -> None:
+    """Add delta to the materialized effective stats of a character (atomic UPDATE)."""
+    delta = {field: value for field, value in delta.items() if value}
+    if not delta:
+        return
+    await db.execute(
+        update(models.CharacterStats)
+        .where(models.CharacterStats.character_id == character_id)
+        .values({
+            getattr(models.CharacterStats, field): getattr(models.CharacterStats, field) + value
+            for field, value in delta.items()
+        })
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def set_equipment_equipped(db: AsyncSession, character_id: int, equipment_id: int,
+                                 equipped: bool) -> Optional[models.CharacterEquipment]:
+    """Set equipment as equipped/unequipped for a character."""
+    result = await db.execute(
+        select(models.CharacterEquipment)
+        .where(
+            models.CharacterEquipment.character_id == character_id,
+            models.CharacterEquipment.equipment_id == equipment_id,
+        )
+        .options(joinedload(models.CharacterEquipment.equipment))
+    )
+    db_ce = result.scalars().first()
+    if not db_ce:
+        return None
+    if bool(db_ce.is_equipped) != equipped:
+        delta = effects.apply_effects(dict.fromkeys(effects.STAT_FIELDS, 0),
+                                      await get_equipment_effects(db, [equipment_id]), 1 if equipped else -1)
+        await apply_stats_delta(db, character_id, delta)
+    db_ce.is_equipped = equipped
+    await touch_character(db, character_id)
+    await db.commit()
+    return db_ce
+
+
+async def sync_character_level(db: AsyncSession, character: models.Character, new_level: int) -> models.Character:
+    """Sync character's abilities and HP with class progression for a new level.
+
+    Same steps as crud.sync_character_level; only the progression table is
+    built through the sync session on a cache miss.
+    """
+    if new_level < 1:
+        raise ValueError("Level must be at least 1")
+    old_level = character.level or 1
+    base_level = character.base_level or 1
+    table = await db.run_sync(get_progression_table, character.character_class_id)
+    _, old_abilities = table.at(old_level)
+    _, new_abilities = table.at(new_level)
+    # HP уровней до base_level персонаж получил при создании, а не из прогрессии
+    old_hp, _ = table.at(max(old_level, base_level))
+    new_hp, _ = table.at(max(new_level, base_level))
+
+    old_base = effects.base_stats(character)
+    gained = new_abilities - old_abilities
+    if gained:
+        owned = await db.execute(
+            select(models.CharacterAbility.ability_id).where(
+                models.CharacterAbility.character_id == character.id,
+                models.CharacterAbility.ability_id.in_(gained),
+            )
+        )
+        missing = gained - set(owned.scalars())
+        if missing:
+            await db.execute(insert(models.CharacterAbility), [
+                {"character_id": character.id, "ability_id": ability_id, "from_progression": True}
+                for ability_id in sorted(missing)
+            ])
+    lost = old_abilities - new_abilities
+    if lost:
+        # Способности, добавленные игроком вручную, понижение уровня не трогает
+        await db.execute(
+            delete(models.CharacterAbility)
+            .where(
+                models.CharacterAbility.character_id == character.id,
+                models.CharacterAbility.ability_id.in_(lost),
+                models.CharacterAbility.from_progression.is_(True),
+            )
+            .execution_options(synchronize_session=False)
+        )
+    character.max_hp += new_hp - old_hp
+    character.current_hp += new_hp - old_hp
+    if new_level < old_level:
+        # Понижение уровня: не выше нового максимума и не ниже нуля
+        character.current_hp = max(0, min(character.current_hp, character.max_hp))
+    character.level = new_level
+    new_base = effects.base_stats(character)
+    await apply_stats_delta(db, character.id, {field: new_base[field] - old_base[field] for field in new_base})
+    mark_character_changed(db, character)
+    await db.commit()
+    await db.refresh(character)
+    return character
@@ -1,19 +1,151 @@
 """Database configuration and session management."""
 
 import os
-from sqlalchemy import create_engine
+from urllib.parse import quote
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+import dbstats
+
 # Получаем путь к базе из переменной окружения, иначе используем дефолтную
 SQLALCHEMY_DATABASE_URL = os.getenv(
     "DATABASE_URL", "sqlite:///./minimal_db_2.4.db.db"
 )
 
+# DB_ASYNC=1 переключает горячие маршруты на асинхронный стек (AsyncEngine/AsyncSession)
+ASYNC_DB = os.getenv("DB_ASYNC", "0") == "1"
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1),
+)
+
+# DB_STRICT_LOADING=1 запрещает ленивую загрузку связей на горячих запросах:
+# случайный N+1 падает с ошибкой вместо тихих лишних запросов (включено в тестах)
+STRICT_LOADING = os.getenv("DB_STRICT_LOADING", "0") == "1"
+
+# Сколько секунд ждать, пока другое соединение держит блокировку записи SQLite
+BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "30"))
+
+# Профиль SQLite для каждого нового соединения; пустое значение оставляет
+# настройку по умолчанию, DB_SQLITE_PROFILE=0 отключает весь профиль
+SQLITE_PROFILE = os.getenv("DB_SQLITE_PROFILE", "1") == "1"
+SQLITE_PRAGMAS = {
+    # WAL: читатели не ждут писателя, писатель не ждёт читателей
+    "journal_mode": os.getenv("DB_JOURNAL_MODE", "WAL"),
+    # В режиме WAL NORMAL не портит базу при сбое, fsync только на checkpoint
+    "synchronous": os.getenv("DB_SYNCHRONOUS", "NORMAL"),
+    # Отрицательное значение в КиБ: 16 МиБ страничного кэша на соединение
+    "cache_size": os.getenv("DB_CACHE_SIZE", "-16384"),
+    "mmap_size": os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)),
+    "temp_store": os.getenv("DB_TEMP_STORE", "MEMORY"),
+}
+
+# Пул: по соединению на поток threadpool (у anyio их 40), чтобы запрос не
+# ждал соединения дольше, чем поток
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "30"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+
+def pool_options(url: str) -> dict:
+    """Explicit pool settings for an engine URL (none for in-memory SQLite)."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        # LIFO: нагрузку берут одни и те же соединения с прогретым кэшем страниц
+        "pool_use_lifo": True,
+    }
+
+
+def _apply_sqlite_profile(dbapi_connection, _record, read_only: bool = False):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT * 1000)}")
+    if SQLITE_PROFILE:
+        for name, value in SQLITE_PRAGMAS.items():
+            # Режим журнала меняет файл базы: его задаёт пишущее соединение
+            if value and not (read_only and name == "journal_mode"):
+                cursor.execute(f"PRAGMA {name} = {value}")
+    if read_only:
+        cursor.execute("PRAGMA query_only = ON")
+    cursor.close()
+
+
+def _apply_sqlite_read_profile(dbapi_connection, record):
+    _apply_sqlite_profile(dbapi_connection, record, read_only=True)
+
+
+def install_sqlite_profile(engine, read_only: bool = False) -> None:
+    """Apply the SQLite profile on connect (pass AsyncEngine.sync_engine for async)."""
+    listener = _apply_sqlite_read_profile if read_only else _apply_sqlite_profile
+    if engine.dialect.name == "sqlite" and not event.contains(engine, "connect", listener):
+        event.listen(engine, "connect", listener)
+
+
+def read_only_url(url: str) -> str:
+    """URL opening the same SQLite file read-only; other URLs are returned as is."""
+    parsed = make_url(url)
+    if (parsed.get_backend_name() != "sqlite" or parsed.database in (None, "", ":memory:")
+            or parsed.query.get("uri")):
+        return url
+    path = quote(os.path.abspath(parsed.database))
+    return parsed.set(database=f"file:{path}", query={"mode": "ro", "uri": "true"}).render_as_string(
+        hide_password=False)
+
+
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False},
+    **pool_options(SQLALCHEMY_DATABASE_URL),
 )
+install_sqlite_profile(engine)
+dbstats.install(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Чтения (GET) идут через свой пул: реплика из READ_DATABASE_URL или тот же
+# файл SQLite, открытый только на чтение, так что они не занимают пишущий пул.
+# С репликой чтение может отставать от только что сделанной записи
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL") or read_only_url(SQLALCHEMY_DATABASE_URL)
+
+if READ_DATABASE_URL == SQLALCHEMY_DATABASE_URL:
+    read_engine = engine
+else:
+    read_engine = create_engine(
+        READ_DATABASE_URL,
+        connect_args={"check_same_thread": False} if make_url(READ_DATABASE_URL).get_backend_name() == "sqlite" else {},
+        **pool_options(READ_DATABASE_URL),
+    )
+    install_sqlite_profile(read_engine, read_only=True)
+    dbstats.install(read_engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
 Base = declarative_base()
 
+_async_sessionmaker = None
+
+
+def get_async_sessionmaker():
+    """Create the async engine on first use and return its session factory."""
+    global _async_sessionmaker  # pylint: disable=global-statement
+    if _async_sessionmaker is None:
+        # Импорт здесь: aiosqlite нужен только для асинхронного режима
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL))
+        install_sqlite_profile(async_engine.sync_engine)
+        dbstats.install(async_engine.sync_engine)
+        _async_sessionmaker = sessionmaker(
+            bind=async_engine, class_=AsyncSession,
+            autoflush=False, expire_on_commit=False,
+        )
+    return _async_sessionmaker
+
+
+async def get_async_db():
+    """Dependency to get async DB session."""
+    async with get_async_sessionmaker()() as db:
+        yield db
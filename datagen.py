@@ -0,0 +1,216 @@
+"""Generate a deterministic synthetic database for benchmarks and index tests.
+
+Usage: python datagen.py --output bench.db [--users N] [--characters-per-user N] [--seed N] ...
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from dataclasses import asdict, dataclass, fields
+from typing import Dict, Iterator, List
+
+from sqlalchemy import create_engine, event, func, insert, select
+from sqlalchemy.engine import Connection, Engine
+
+from database import Base
+import effects
+import migrations
+import models
+import passwords
+from progression import ProgressionTable
+
+RARITIES = ("common", "uncommon", "rare", "very rare", "legendary")
+
+
+@dataclass
+class DatasetConfig:
+    """Sizes of the generated dataset; the same config and seed give the same rows."""
+    users: int = 1000
+    characters_per_user: int = 10
+    classes: int = 12
+    abilities: int = 500
+    equipment: int = 1000
+    levels: int = 20
+    abilities_per_level: int = 1
+    inventory: int = 5
+    equipped: int = 2
+    seed: int = 42
+    password: str = "password"
+    chunk_size: int = 10000
+
+
+@dataclass
+class Dataset:
+    """What was generated: id ranges and row counts."""
+    config: DatasetConfig
+    first_user_id: int
+    first_class_id: int
+    counts: Dict[str, int]
+
+    def user_ids(self) -> range:
+        return range(self.first_user_id, self.first_user_id + self.config.users)
+
+
+def username_for(user_id: int) -> str:
+    """Username of a generated user."""
+    return f"user{user_id}"
+
+
+def _next_id(conn: Connection, model) -> int:
+    return (conn.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def _insert(conn: Connection, model, rows: List[dict], counts: Dict[str, int]) -> None:
+    if rows:
+        conn.execute(insert(model), rows)
+        counts[model.__tablename__] = counts.get(model.__tablename__, 0) + len(rows)
+
+
+def _chunks(start: int, count: int, size: int) -> Iterator[range]:
+    for offset in range(0, count, size):
+        yield range(start + offset, start + min(offset + size, count))
+
+
+def generate(engine: Engine, config: DatasetConfig) -> Dataset:
+    """Create the schema and bulk insert a synthetic dataset.
+
+    Ids continue after existing rows, so a non-empty database is extended
+    rather than clobbered. Rows are consistent with what the API would have
+    written: abilities follow the class progression at the character's level,
+    HP includes the progression bonus, materialized effective stats include
+    equipped items, and users.last_local_id matches their characters.
+    """
+    rng = random.Random(config.seed)
+    counts: Dict[str, int] = {}
+    Base.metadata.create_all(bind=engine)
+    migrations.migrate(engine)
+    with engine.begin() as conn:
+        first_user_id = _next_id(conn, models.User)
+        first_class_id = _next_id(conn, models.CharacterClass)
+        first_ability_id = _next_id(conn, models.Ability)
+        first_equipment_id = _next_id(conn, models.Equipment)
+        progression_id = _next_id(conn, models.ClassProgression)
+        # Один хеш на всех: PBKDF2 на каждого пользователя занял бы часы
+        hashed_password = passwords.hash_password(config.password, salt=rng.randbytes(16))
+
+        class_ids = list(range(first_class_id, first_class_id + config.classes))
+        _insert(conn, models.CharacterClass, [
+            {"id": class_id, "name": f"Class {class_id}", "description": "generated"} for class_id in class_ids
+        ], counts)
+        ability_ids = list(range(first_ability_id, first_ability_id + config.abilities))
+        _insert(conn, models.Ability, [
+            {"id": ability_id, "name": f"Ability {ability_id}", "uses": rng.choice((-1, 1, 2, 3)),
+             "description": "generated"} for ability_id in ability_ids
+        ], counts)
+        equipment_effects = {}
+        equipment_rows = []
+        for equipment_id in range(first_equipment_id, first_equipment_id + config.equipment):
+            bonuses = {stat: rng.randint(1, 3) for stat in rng.sample(effects.STAT_FIELDS[:7], rng.randint(1, 2))}
+            equipment_effects[equipment_id] = bonuses
+            equipment_rows.append({
+                "id": equipment_id, "name": f"Item {equipment_id}", "cost": rng.randint(1, 5000),
+                "rarity": rng.choice(RARITIES), "description": "generated", "effects": json.dumps(bonuses),
+            })
+        _insert(conn, models.Equipment, equipment_rows, counts)
+
+        tables = {}
+        for class_id in class_ids:
+            progression_rows, link_rows, table_rows = [], [], []
+            for level in range(1, config.levels + 1):
+                hp_bonus = rng.randint(4, 10)
+                progression_rows.append({"id": progression_id, "character_class_id": class_id,
+                                         "level": level, "hp_bonus": hp_bonus})
+                granted = rng.sample(ability_ids, min(config.abilities_per_level, len(ability_ids)))
+                link_rows.extend({"class_progression_id": progression_id, "ability_id": ability_id}
+                                 for ability_id in granted)
+                table_rows.extend((progression_id, level, hp_bonus, ability_id) for ability_id in granted or [None])
+                progression_id += 1
+            _insert(conn, models.ClassProgression, progression_rows, counts)
+            _insert(conn, models.ClassProgressionAbility, link_rows, counts)
+            tables[class_id] = ProgressionTable(table_rows)
+
+        character_id = _next_id(conn, models.Character)
+        inventory = min(config.inventory, len(equipment_rows))
+        users_per_chunk = max(1, config.chunk_size // max(config.characters_per_user, 1))
+        for user_ids in _chunks(first_user_id, config.users, users_per_chunk):
+            users, characters, abilities, items, stats = [], [], [], [], []
+            for user_id in user_ids:
+                users.append({"id": user_id, "username": username_for(user_id), "hashed_password": hashed_password,
+                              "last_local_id": config.characters_per_user})
+                for local_id in range(1, config.characters_per_user + 1):
+                    class_id = rng.choice(class_ids)
+                    level = rng.randint(1, config.levels)
+                    hp_bonus, granted = tables[class_id].at(level)
+                    character = {stat: rng.randint(8, 18) for stat in effects.STAT_FIELDS[:7]}
+                    character["max_hp"] = character["current_hp"] = rng.randint(8, 12) + hp_bonus
+                    characters.append({"id": character_id, "owner_id": user_id, "local_id": local_id,
+                                       "name": f"Hero {character_id}", "character_class_id": class_id,
+                                       "level": level, **character})
+                    abilities.extend({"character_id": character_id, "ability_id": ability_id, "current_uses": 1}
+                                     for ability_id in sorted(granted))
+                    owned = rng.sample(equipment_rows, inventory)
+                    items.extend({"character_id": character_id, "equipment_id": row["id"], "name": row["name"],
+                                  "is_equipped": index < config.equipped} for index, row in enumerate(owned))
+                    effective = effects.apply_effects(
+                        dict(character), [equipment_effects[row["id"]] for row in owned[:config.equipped]])
+                    stats.append({"character_id": character_id, **effective})
+                    character_id += 1
+            _insert(conn, models.User, users, counts)
+            _insert(conn, models.Character, characters, counts)
+            _insert(conn, models.CharacterAbility, abilities, counts)
+            _insert(conn, models.CharacterEquipment, items, counts)
+            _insert(conn, models.CharacterStats, stats, counts)
+    return Dataset(config, first_user_id, first_class_id, counts)
+
+
+def _fast_bulk_load(engine: Engine) -> None:
+    """Relax durability for the duration of a one-off generation run."""
+    @event.listens_for(engine, "connect")
+    def _pragmas(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA synchronous = OFF")
+        cursor.execute("PRAGMA journal_mode = MEMORY")
+        cursor.close()
+
+
+def main(argv=None) -> int:
+    """Parse arguments, generate the database and print row counts."""
+    defaults = DatasetConfig()
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic DnD database.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--output", help="SQLite file to create")
+    target.add_argument("--database-url", help="existing database to extend")
+    parser.add_argument("--force", action="store_true", help="overwrite --output if it exists")
+    for field in fields(DatasetConfig):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=field.type,
+                            default=getattr(defaults, field.name))
+    args = parser.parse_args(argv)
+
+    if args.output:
+        if os.path.exists(args.output):
+            if not args.force:
+                parser.error(f"{args.output} exists, pass --force to overwrite it")
+            os.remove(args.output)
+        url = f"sqlite:///{args.output}"
+    else:
+        url = args.database_url
+    config = DatasetConfig(**{field.name: getattr(args, field.name) for field in fields(DatasetConfig)})
+    engine = create_engine(url)
+    if engine.dialect.name == "sqlite":
+        _fast_bulk_load(engine)
+    started = time.perf_counter()
+    try:
+        dataset = generate(engine, config)
+    finally:
+        engine.dispose()
+    print(f"{url}: generated in {time.perf_counter() - started:.1f} s with {asdict(config)}")
+    for table, count in dataset.counts.items():
+        print(f"  {table}: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
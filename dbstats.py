@@ -0,0 +1,108 @@
+"""Per-request SQL statement counting and N+1 detection."""
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+QUERIES_HEADER = "X-DB-Queries"
+TIME_HEADER = "X-DB-Time"
+# Столько одинаковых запросов за один HTTP-запрос считаем признаком N+1
+NPLUS1_THRESHOLD = int(os.getenv("DB_NPLUS1_THRESHOLD", "5"))
+
+
+class QueryStats:
+    """Statements executed within one request (or one tracked block)."""
+
+    __slots__ = ("count", "duration", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Dict[str, int] = {}
+
+    def repeated(self, threshold: int = NPLUS1_THRESHOLD) -> List[Tuple[str, int]]:
+        """Statements run at least threshold times, most repeated first."""
+        return sorted(((sql, count) for sql, count in self.statements.items() if count >= threshold),
+                      key=lambda item: -item[1])
+
+
+# Контекст копируется в поток threadpool, поэтому синхронные обработчики и
+# зависимости пишут в тот же объект, что создал middleware
+_current: ContextVar[Optional[QueryStats]] = ContextVar("db_query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    started = conn.info.get("query_started")
+    if started:
+        stats.duration += time.perf_counter() - started.pop()
+    stats.count += 1
+    stats.statements[statement] = stats.statements.get(statement, 0) + 1
+
+
+def install(engine: Engine) -> None:
+    """Count statements of an engine (pass AsyncEngine.sync_engine for async)."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def track() -> Iterator[QueryStats]:
+    """Count statements executed inside the block (in this context)."""
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+class QueryStatsMiddleware:
+    """Pure ASGI middleware: counts statements of each HTTP request.
+
+    Totals go to the X-DB-Queries / X-DB-Time (ms) response headers and to
+    scope["db_stats"] for the metrics middleware. Headers are written when the
+    response starts, so a streaming body's own queries are not included.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with track() as stats:
+            scope["db_stats"] = stats
+
+            async def send_with_headers(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (QUERIES_HEADER.lower().encode(), str(stats.count).encode()),
+                        (TIME_HEADER.lower().encode(), f"{stats.duration * 1000:.3f}".encode()),
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_with_headers)
+        repeated = stats.repeated()
+        if repeated:
+            route = scope.get("route")
+            logger.warning("Likely N+1 in %s %s: %d x %s", scope["method"],
+                           route.path if route is not None else scope["path"], repeated[0][1], repeated[0][0])
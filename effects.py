@@ -0,0 +1,102 @@
+"""Equipment effects: validation, compiled cache and stat summation."""
+
+import json
+import logging
+import threading
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Характеристики персонажа, на которые могут влиять предметы
+STAT_FIELDS = (
+    "armor_class",
+    "strength",
+    "dexterity",
+    "constitution",
+    "intelligence",
+    "wisdom",
+    "charisma",
+    "max_hp",
+    "current_hp",
+)
+
+
+def parse_effects(raw: Optional[str]) -> Dict[str, int]:
+    """Validate effects JSON and compile it to {stat: bonus}.
+
+    Raises ValueError for anything that is not a JSON object of known stats
+    with integer bonuses.
+    """
+    if not raw:
+        return {}
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"Effects must be valid JSON: {exc.msg}") from exc
+    if not isinstance(data, dict):
+        raise ValueError("Effects must be a JSON object")
+    compiled = {}
+    for key, value in data.items():
+        if key not in STAT_FIELDS:
+            raise ValueError(f"Unknown stat in effects: {key}")
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError(f"Effect bonus for {key} must be an integer")
+        if value:
+            compiled[key] = value
+    return compiled
+
+
+class EffectsRegistry:
+    """Compiled effects by equipment id.
+
+    Equipment effects never change after creation, so entries stay valid
+    for the life of the process.
+    """
+
+    def __init__(self):
+        self._compiled: Dict[int, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, equipment_id: int) -> bool:
+        return equipment_id in self._compiled
+
+    def get(self, equipment_id: int) -> Dict[str, int]:
+        """Return compiled effects of a registered item."""
+        return self._compiled[equipment_id]
+
+    def register(self, equipment_id: int, compiled: Dict[str, int]) -> None:
+        """Store already validated effects."""
+        with self._lock:
+            self._compiled[equipment_id] = compiled
+
+    def register_raw(self, equipment_id: int, raw: Optional[str]) -> Dict[str, int]:
+        """Compile effects stored before write-time validation existed."""
+        try:
+            compiled = parse_effects(raw)
+        except ValueError as exc:
+            # Старые строки не прошли бы валидацию: предупреждаем один раз и игнорируем
+            logger.warning("Ignoring invalid effects of equipment %s: %s", equipment_id, exc)
+            compiled = {}
+        self.register(equipment_id, compiled)
+        return compiled
+
+    def clear(self) -> None:
+        """Drop all compiled effects."""
+        with self._lock:
+            self._compiled.clear()
+
+
+registry = EffectsRegistry()
+
+
+def base_stats(character) -> Dict[str, int]:
+    """Return character stats without equipment bonuses."""
+    return {field: getattr(character, field) for field in STAT_FIELDS}
+
+
+def apply_effects(stats: Dict[str, int], effect_list: Iterable[Dict[str, int]], sign: int = 1) -> Dict[str, int]:
+    """Add (or with sign=-1 subtract) compiled effects to stats in place."""
+    for compiled in effect_list:
+        for key, value in compiled.items():
+            stats[key] += sign * value
+    return stats
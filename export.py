@@ -0,0 +1,76 @@
+"""Streaming NDJSON/CSV export with bounded memory."""
+
+import csv
+import io
+import os
+from typing import Callable, Iterator
+
+from sqlalchemy.orm import Query, Session
+
+from database import ReadSessionLocal
+import cache
+import crud
+import models
+import schemas
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+# Справочники, доступные для выгрузки: модель и схема строки
+CATALOG_EXPORTS = {
+    "character_classes": (models.CharacterClass, schemas.CharacterClass),
+    "class_progressions": (models.ClassProgression, schemas.ClassProgression),
+    "abilities": (models.Ability, schemas.Ability),
+    "equipment": (models.Equipment, schemas.Equipment),
+}
+
+
+def _csv_line(values: list) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue().encode("utf-8")
+
+
+def stream_rows(make_query: Callable[[Session], Query], schema: type, fmt: str) -> Iterator[bytes]:
+    """Yield encoded rows, fetching them from the database in batches.
+
+    The generator owns its session: the response is streamed after the
+    request dependencies are gone. Rows are read with yield_per, so only one
+    batch of ORM objects is alive at a time. CSV cells holding nested lists
+    or objects contain their JSON.
+    """
+    db = ReadSessionLocal()
+    try:
+        fields = list(schema.model_fields)
+        if fmt == "csv":
+            yield _csv_line(fields)
+        batch = []
+        for row in make_query(db).yield_per(EXPORT_BATCH_SIZE):
+            data = schema.model_validate(row).model_dump(mode="json")
+            if fmt == "csv":
+                batch.append(_csv_line([
+                    cache.dumps_json(data[field]).decode("utf-8") if isinstance(data[field], (list, dict))
+                    else data[field]
+                    for field in fields
+                ]))
+            else:
+                batch.append(cache.dumps_json(data) + b"\n")
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                yield b"".join(batch)
+                batch.clear()
+        if batch:
+            yield b"".join(batch)
+    finally:
+        db.close()
+
+
+def export_characters(user_id: int, fmt: str) -> Iterator[bytes]:
+    """Stream all characters of a user with nested abilities and equipment."""
+    return stream_rows(lambda db: crud.characters_export_query(db, user_id), schemas.Character, fmt)
+
+
+def export_catalog(table: str, fmt: str) -> Iterator[bytes]:
+    """Stream a whole catalog table."""
+    model, schema = CATALOG_EXPORTS[table]
+    return stream_rows(lambda db: db.query(model).order_by(model.id), schema, fmt)
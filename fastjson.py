@@ -0,0 +1,126 @@
+"""Opt-in fast JSON path for hot read routes (FAST_JSON=1).
+
+By default FastAPI validates what a route returns against response_model
+(from ORM attributes, in one more threadpool hop for sync routes) and then
+serializes it. With the fast path the route itself, already in the
+threadpool, copies the rows through a field plan compiled from the schema
+and renders them with orjson, so FastAPI skips its response handling. The
+output is byte-identical for rows that pass response_model validation. The
+plan only checks for None in non-Optional fields (a NULL column); such rows
+fall back to the default path, so FastAPI reports them as before. Other
+values are trusted to already have the column's type.
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Tuple, Type, get_args, get_origin
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+import cache
+import schemas
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен: без него тот же вывод даёт json
+    orjson = None
+
+# Читается один раз при импорте; бенчмарк и тесты переключают режим, присваивая fastjson.FAST_JSON
+FAST_JSON = os.getenv("FAST_JSON", "0") == "1"
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize plain JSON data exactly like JSONResponse, with orjson if installed."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return cache.dumps_json(content)
+
+
+class NeedsValidation(ValueError):
+    """A row has None in a non-Optional field: only response_model validation can handle it."""
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is available."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _compile(schema: Type[BaseModel]) -> Tuple:
+    """Field plan of a response schema: (name, default, nested plan, is list, nullable) per field."""
+    plan = []
+    for name, field in schema.model_fields.items():
+        nested, many = None, False
+        annotation = field.annotation
+        for candidate in (annotation, *get_args(annotation)):
+            if get_origin(candidate) in (list, List):
+                candidate, many = get_args(candidate)[0], True
+            if isinstance(candidate, type) and issubclass(candidate, BaseModel):
+                nested = _compile(candidate)
+                break
+        nullable = type(None) in get_args(annotation)
+        plan.append((name, field.get_default(call_default_factory=True), nested, many, nullable))
+    return tuple(plan)
+
+
+def _extract(plan: Tuple, obj: Any) -> Dict[str, Any]:
+    # Загруженные атрибуты лежат в __dict__ экземпляра: это быстрее, чем
+    # дескрипторы ORM, которые дёргает валидация from_attributes
+    state = obj.__dict__
+    row = {}
+    for name, default, nested, many, nullable in plan:
+        value = state[name] if name in state else getattr(obj, name, default)
+        if value is None and not nullable:
+            raise NeedsValidation(name)
+        if nested is not None and value is not None:
+            value = [_extract(nested, item) for item in value] if many else _extract(nested, value)
+        row[name] = value
+    return row
+
+
+class ModelSerializer:
+    """ORM rows -> response_model JSON bytes through a field plan compiled once.
+
+    The rows come straight from the database, so their values already have
+    the schema's types and validating them again only costs time: the plan
+    copies the schema fields in schema order and orjson renders the result.
+    Raises NeedsValidation for a None in a non-Optional field.
+    """
+
+    def __init__(self, schema: Any):
+        self.many = get_origin(schema) in (list, List)
+        self.plan = _compile(get_args(schema)[0] if self.many else schema)
+
+    def dump(self, content: Any) -> bytes:
+        if self.many:
+            return dumps([_extract(self.plan, row) for row in content])
+        return dumps(_extract(self.plan, content))
+
+
+CHARACTER = ModelSerializer(schemas.Character)
+CHARACTERS = ModelSerializer(List[schemas.Character])
+CHARACTER_ABILITIES = ModelSerializer(List[schemas.CharacterAbility])
+CHARACTER_EQUIPMENT = ModelSerializer(List[schemas.CharacterEquipment])
+
+
+def respond(content: Any, serializer: Optional[ModelSerializer] = None,
+            response: Optional[Response] = None) -> Any:
+    """Return content for FastAPI to serialize, or pre-rendered JSON when FAST_JSON is on.
+
+    Without a serializer content is plain dicts/lists and goes through orjson.
+    Headers already set on the injected response are carried over, because
+    FastAPI ignores them once the route returns its own Response.
+    """
+    if not FAST_JSON:
+        return content
+    headers: Optional[Dict[str, str]] = dict(response.headers) if response is not None else None
+    if serializer is None:
+        return FastJSONResponse(content, headers=headers)
+    try:
+        body = serializer.dump(content)
+    except NeedsValidation:
+        # NULL там, где схема его не допускает: пусть response_model выдаст ту же ошибку, что и без FAST_JSON
+        return content
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,34 +1,84 @@
 """Main FastAPI application for DnD project."""
 
-import json
-from typing import Any, Dict, List
-
-from fastapi import FastAPI, Depends, HTTPException, status, Response
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Depends, HTTPException, Query, status, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 from jose import JWTError, jwt
 
-from database import SessionLocal, engine, Base
-import models
+from database import SessionLocal, ReadSessionLocal, ASYNC_DB
+from pagination import PageParams, NEXT_CURSOR_HEADER
 import schemas
 import crud
 import auth
+import bulk_import
+import export
+import passwords
+import startup
+import metrics
+import fastjson
+import dbstats
+import cache
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Prepare the database and warm caches before serving, stop worker pools after."""
+    # Схема и прогрев идут здесь, а не при импорте: импорт main остаётся дешёвым
+    await run_in_threadpool(startup.start, catalog_loader)
+    if startup.WARM_UP:
+        started = time.perf_counter()
+        await passwords.hasher.warm()
+        startup.timings["warm_hasher"] = time.perf_counter() - started
+    yield
+    passwords.hasher.shutdown()
+
+STARTED_AT = time.time()
+app = FastAPI(lifespan=lifespan)
+# Порядок: последний добавленный снаружи; metrics читает scope["db_stats"] после dbstats
+app.add_middleware(dbstats.QueryStatsMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-Base.metadata.create_all(bind=engine)
+metrics.registry.add_collector("dnd_auth_cache", "Token cache counters.", cache.user_cache.stats)
+metrics.registry.add_collector("dnd_catalog_cache", "Catalog cache counters.", cache.catalog_cache.stats)
+metrics.registry.add_collector("dnd_password_hasher", "Password hashing pool state.", passwords.hasher.stats)
 
-app = FastAPI()
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+if ASYNC_DB:
+    # Импорт здесь: асинхронный стек требует sqlalchemy[asyncio] и aiosqlite.
+    # Маршруты, подключённые раньше, имеют приоритет: асинхронные версии
+    # перекрывают одноимённые синхронные обработчики ниже
+    import async_routes  # pylint: disable=import-outside-toplevel
+    app.include_router(async_routes.router)
 
-def get_db():
-    """Dependency to get DB session."""
+def get_write_db():
+    """Dependency to get a DB session for handlers that write."""
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_read_db():
+    """Dependency to get a read-only DB session (GET handlers)."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)):
     """Get the current user from the JWT token."""
+    cached = cache.user_cache.get(token)
+    if cached is not None:
+        return cached
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -44,22 +94,97 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     user = crud.get_user_by_username(db, username=username)
     if user is None:
         raise credentials_exception
-    return user
+    # Кэшируем снимок пользователя, а не ORM-объект: он переживает закрытие сессии
+    current_user = schemas.User.model_validate(user)
+    cache.user_cache.set(token, current_user, expires_at=payload.get("exp"))
+    return current_user
+
+async def hash_or_503(job):
+    """Await a password pool job, answering 503 when the pool is saturated."""
+    try:
+        return await job
+    except passwords.PasswordHasherBusy as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "1"}) from exc
+
+# Справочники: функция чтения из crud и схема ответа
+CATALOG = {
+    "character_classes": (crud.get_character_classes, schemas.CharacterClass),
+    "class_progressions": (crud.get_class_progressions, schemas.ClassProgression),
+    "abilities": (crud.get_abilities, schemas.Ability),
+    "equipment": (crud.get_equipments, schemas.Equipment),
+}
+
+def catalog_loader(table: str, db: Session):
+    """Return a loader of the whole catalog table as serialized rows."""
+    getter, schema = CATALOG[table]
+    return lambda: [schema.model_validate(row).model_dump(mode="json") for row in getter(db)]
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """Return 304 response if the client already has this ETag."""
+    if cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+def catalog_page(table: str, page: PageParams, request: Request, db: Session) -> Response:
+    """Serve a keyset page of a catalog table from the catalog cache."""
+    # ETag считается до чтения: запись во время чтения даст лишний 200, а не ложный 304
+    etag = cache.catalog_etag(table)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    body, next_cursor = cache.catalog_cache.page(table, catalog_loader(table, db), page.after, page.limit)
+    response = Response(content=body, media_type="application/json", headers={"ETag": etag})
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = str(next_cursor)
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus metrics of this process."""
+    # async: рендер идёт в потоке event loop, где пишет middleware
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/health", include_in_schema=False)
+def health(db: Session = Depends(get_read_db)):
+    """Health of the worker process that answered: 503 when it cannot reach the database."""
+    try:
+        db.execute(text("SELECT 1"))
+        database = "ok"
+    except SQLAlchemyError:
+        database = "unavailable"
+    # Под serve.py каждый ответ приходит от одного из воркеров: pid показывает, от какого
+    return JSONResponse(
+        status_code=200 if database == "ok" else 503,
+        content={
+            "status": "ok" if database == "ok" else "degraded",
+            "pid": os.getpid(),
+            "boot_id": cache.BOOT_ID,
+            "uptime": round(time.time() - STARTED_AT, 3),
+            "database": database,
+            "password_hasher": passwords.hasher.stats(),
+        },
+    )
 
 @app.post("/register", response_model=schemas.User)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register(user: schemas.UserCreate, db: Session = Depends(get_write_db)):
     """Register a new user."""
-    db_user = crud.get_user_by_username(db, user.username)
+    db_user = await run_in_threadpool(crud.get_user_by_username, db, user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    return crud.create_user(db, user)
+    hashed_password = await hash_or_503(passwords.hasher.hash(user.password))
+    return await run_in_threadpool(crud.create_user, db, user, hashed_password)
 
 @app.post("/token")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_write_db)):
     """User login and token generation."""
-    user = crud.authenticate_user(db, form_data.username, form_data.password)
-    if not user:
+    user = await run_in_threadpool(crud.get_user_by_username, db, form_data.username)
+    stored = user.hashed_password if user else passwords.DUMMY_HASH
+    if not await hash_or_503(passwords.hasher.verify(form_data.password, stored)) or not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
+    if passwords.needs_rehash(user.hashed_password):
+        # Открытый текст или другая стоимость хеша: пересчитываем при успешном входе
+        hashed_password = await hash_or_503(passwords.hasher.hash(form_data.password))
+        await run_in_threadpool(crud.update_user_password, db, user, hashed_password)
     access_token = auth.create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -71,7 +196,7 @@ def read_users_me(current_user: schemas.User = Depends(get_current_user)):
 @app.post("/character_classes/", response_model=schemas.CharacterClass)
 def create_character_class(
     char_class: schemas.CharacterClassCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     user: schemas.User = Depends(get_current_user)
 ):
     try:
@@ -86,36 +211,49 @@ def create_character_class(
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 @app.get("/character_classes/", response_model=List[schemas.CharacterClass])
-def get_character_classes(db: Session = Depends(get_db)):
-    """Get all character classes."""
-    return crud.get_character_classes(db)
+def get_character_classes(request: Request, page: PageParams = Depends(), db: Session = Depends(get_read_db)):
+    """Get character classes, one keyset page at a time."""
+    return catalog_page("character_classes", page, request, db)
 
 @app.get("/class_progression/", response_model=List[schemas.ClassProgression])
-def get_class_progressions(db: Session = Depends(get_db)):
-    """Get all class progressions."""
-    return crud.get_class_progressions(db)
+def get_class_progressions(request: Request, page: PageParams = Depends(), db: Session = Depends(get_read_db)):
+    """Get class progressions, one keyset page at a time."""
+    return catalog_page("class_progressions", page, request, db)
 
 @app.get("/class_progression/{prog_id}", response_model=schemas.ClassProgression)
-def get_class_progression(prog_id: int, db: Session = Depends(get_db)):
+def get_class_progression(prog_id: int, request: Request, db: Session = Depends(get_read_db)):
     """Get class progression by id."""
-    prog = crud.get_class_progression(db, prog_id)
-    if not prog:
+    etag = cache.catalog_etag("class_progressions")
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    body = cache.catalog_cache.item("class_progressions", catalog_loader("class_progressions", db), prog_id)
+    if body is None:
         raise HTTPException(status_code=404, detail="Not found")
-    return prog
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 @app.post("/class_progression/", response_model=schemas.ClassProgression)
 def create_class_progression(
     prog: schemas.ClassProgressionCreate,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_write_db)
 ):
     """Create a new class progression."""
     return crud.create_class_progression(db, prog)
 
+@app.post("/class_progression/import")
+async def import_class_progressions(
+    request: Request,
+    db: Session = Depends(get_write_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    """Bulk import class progressions from an NDJSON body (one ClassProgressionCreate per line)."""
+    return await bulk_import.import_ndjson("class_progressions", request.stream(), db)
+
 @app.put("/class_progression/{prog_id}", response_model=schemas.ClassProgression)
 def update_class_progression(
     prog_id: int,
     prog: schemas.ClassProgressionCreate,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_write_db)
 ):
     """Update class progression."""
     updated = crud.update_class_progression(db, prog_id, prog)
@@ -124,7 +262,7 @@ def update_class_progression(
     return updated
 
 @app.delete("/class_progression/{prog_id}", status_code=204)
-def delete_class_progression(prog_id: int, db: Session = Depends(get_db)):
+def delete_class_progression(prog_id: int, db: Session = Depends(get_write_db)):
     """Delete class progression."""
     deleted = crud.delete_class_progression(db, prog_id)
     if not deleted:
@@ -134,7 +272,7 @@ def delete_class_progression(prog_id: int, db: Session = Depends(get_db)):
 @app.post("/abilities/", response_model=schemas.Ability)
 def create_ability(
     ability: schemas.AbilityCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Create an ability."""
@@ -143,15 +281,24 @@ def create_ability(
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
+@app.post("/abilities/import")
+async def import_abilities(
+    request: Request,
+    db: Session = Depends(get_write_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    """Bulk import abilities from an NDJSON body (one AbilityCreate per line)."""
+    return await bulk_import.import_ndjson("abilities", request.stream(), db)
+
 @app.get("/abilities/", response_model=List[schemas.Ability])
-def get_abilities(db: Session = Depends(get_db)):
-    """Get all abilities."""
-    return crud.get_abilities(db)
+def get_abilities(request: Request, page: PageParams = Depends(), db: Session = Depends(get_read_db)):
+    """Get abilities, one keyset page at a time."""
+    return catalog_page("abilities", page, request, db)
 
 @app.post("/equipment/", response_model=schemas.Equipment)
 def create_equipment(
     equipment: schemas.EquipmentCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Create equipment."""
@@ -160,15 +307,24 @@ def create_equipment(
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
+@app.post("/equipment/import")
+async def import_equipment(
+    request: Request,
+    db: Session = Depends(get_write_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    """Bulk import equipment from an NDJSON body (one EquipmentCreate per line)."""
+    return await bulk_import.import_ndjson("equipment", request.stream(), db)
+
 @app.get("/equipment/", response_model=List[schemas.Equipment])
-def get_equipments(db: Session = Depends(get_db)):
-    """Get all equipment."""
-    return crud.get_equipments(db)
+def get_equipments(request: Request, page: PageParams = Depends(), db: Session = Depends(get_read_db)):
+    """Get equipment, one keyset page at a time."""
+    return catalog_page("equipment", page, request, db)
 
 @app.post("/characters/", response_model=schemas.Character)
 def create_character(
     character: schemas.CharacterCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Create a character."""
@@ -176,68 +332,95 @@ def create_character(
 
 @app.get("/characters/", response_model=List[schemas.Character])
 def get_characters(
-    db: Session = Depends(get_db),
+    response: Response,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_read_db),
     user: schemas.User = Depends(get_current_user)
 ):
-    """Get all characters of the current user."""
-    return crud.get_characters_by_user(db, user.id)
+    """Get characters of the current user, one keyset page at a time."""
+    characters = page.apply(response, crud.get_characters_by_user(db, user.id, page.after, page.fetch))
+    return fastjson.respond(characters, fastjson.CHARACTERS, response)
+
+@app.get("/characters/effective_stats/", response_model=List[Dict[str, Any]])
+def get_effective_stats_batch(
+    ids: Optional[str] = Query(None, description="Comma-separated local ids; all characters if omitted"),
+    db: Session = Depends(get_read_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    """Get effective stats of several (or all) characters of the current user."""
+    local_ids = None
+    if ids:
+        try:
+            local_ids = [int(part) for part in ids.split(",") if part.strip()]
+        except ValueError as exc:
+            raise HTTPException(status_code=422, detail="ids must be comma-separated integers") from exc
+    return fastjson.respond(crud.get_effective_stats_batch(db, user.id, local_ids, backfill=False))
 
 @app.get("/characters/{local_id}", response_model=schemas.Character)
 def get_character(
     local_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Get a character by local_id."""
+    etag = cache.character_etag(user.id, local_id)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
     character = crud.get_character_by_local_id(db, user.id, local_id)
     if character is None:
         raise HTTPException(status_code=404, detail="Character not found")
-    return character
+    response.headers["ETag"] = etag
+    return fastjson.respond(character, fastjson.CHARACTER, response)
 
 @app.delete("/characters/{local_id}", status_code=204)
 def delete_character(
     local_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Delete a character."""
-    character = crud.get_character_by_local_id(db, user.id, local_id)
-    if character is None:
+    character_id = crud.get_character_id_by_local_id(db, user.id, local_id)
+    if character_id is None:
         raise HTTPException(status_code=404, detail="Character not found")
-    crud.delete_character(db, character.id)
+    crud.delete_character(db, character_id)
     return Response(status_code=204)
 
 @app.put("/characters/{local_id}", response_model=schemas.Character)
 def update_character(
     local_id: int,
     character_update: schemas.CharacterCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Update a character."""
-    character = crud.get_character_by_local_id(db, user.id, local_id)
-    if character is None:
+    character_id = crud.get_character_id_by_local_id(db, user.id, local_id)
+    if character_id is None:
         raise HTTPException(status_code=404, detail="Character not found")
-    return crud.update_character(db, character.id, character_update)
+    return crud.update_character(db, character_id, character_update)
 
 @app.patch("/characters/{local_id}/set_level")
 def set_character_level(
     local_id: int,
     new_level: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Set character level and sync abilities/bonuses."""
     character = crud.get_character_by_local_id(db, user.id, local_id)
     if character is None:
         raise HTTPException(status_code=404, detail="Character not found")
-    character = crud.sync_character_level(db, character, new_level)
-    return character
+    try:
+        return crud.sync_character_level(db, character, new_level)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 @app.post("/characters/{local_id}/level_up")
 def level_up_character(
     local_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Increase character level by 1 and sync abilities/bonuses."""
@@ -251,28 +434,28 @@ def level_up_character(
 @app.get("/characters/{local_id}/abilities/", response_model=List[schemas.CharacterAbility])
 def get_character_abilities(
     local_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Get abilities of a character."""
     character = crud.get_character_by_local_id(db, user.id, local_id)
     if character is None:
         raise HTTPException(status_code=404, detail="Character not found")
-    return crud.get_character_abilities(db, character.id)
+    return fastjson.respond(crud.get_character_abilities(db, character.id), fastjson.CHARACTER_ABILITIES)
 
 @app.post("/characters/{local_id}/abilities/", response_model=schemas.CharacterAbility)
 def add_ability_to_character(
     local_id: int,
     ca: schemas.CharacterAbilityCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Add an ability to a character."""
-    character = crud.get_character_by_local_id(db, user.id, local_id)
-    if character is None:
+    character_id = crud.get_character_id_by_local_id(db, user.id, local_id)
+    if character_id is None:
         raise HTTPException(status_code=404, detail="Character not found")
     try:
-        return crud.add_ability_to_character(db, character.id, ca)
+        return crud.add_ability_to_character(db, character_id, ca)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
@@ -281,12 +464,12 @@ def add_ability_to_character(
 def delete_ability_from_character(
     local_id: int,
     ability_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Delete an ability from a character."""
-    character = crud.get_character_by_local_id(db, user.id, local_id)
-    if character is None:
+    character_id = crud.get_character_id_by_local_id(db, user.id, local_id)
+    if character_id is None:
         raise HTTPException(status_code=404, detail="Character not found")
     result = crud.remove_ability
 
@@ -294,10 +477,10 @@ def delete_ability_from_character(
 
 
     """Delete an ability from a character."""
-    character = crud.get_character_by_local_id(db, user.id, local_id)
-    if character is None:
+    character_id = crud.get_character_id_by_local_id(db, user.id, local_id)
+    if character_id is None:
         raise HTTPException(status_code=404, detail="Character not found")
-    result = crud.remove_ability_from_character(db, character.id, ability_id)
+    result = crud.remove_ability_from_character(db, character_id, ability_id)
     if result is None:
         raise HTTPException(status_code=404, detail="Ability not found for this character")
     return Response(status_code=204)
@@ -305,53 +488,53 @@ def delete_ability_from_character(
 @app.get("/characters/{local_id}/equipment/", response_model=List[schemas.CharacterEquipment])
 def get_character_equipments(
     local_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Get all equipment of a character."""
     character = crud.get_character_by_local_id(db, user.id, local_id)
     if character is None:
         raise HTTPException(status_code=404, detail="Character not found")
-    return crud.get_character_equipments(db, character.id)
+    return fastjson.respond(crud.get_character_equipments(db, character.id), fastjson.CHARACTER_EQUIPMENT)
 
 @app.get("/characters/{local_id}/equipment/equipped/",
          response_model=List[schemas.CharacterEquipment])
 def get_character_equipped_items(
     local_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Get all equipped items of a character."""
     character = crud.get_character_by_local_id(db, user.id, local_id)
     if character is None:
         raise HTTPException(status_code=404, detail="Character not found")
-    return crud.get_character_equipped_items(db, character.id)
+    return fastjson.respond(crud.get_character_equipped_items(db, character.id), fastjson.CHARACTER_EQUIPMENT)
 
 @app.post("/characters/{local_id}/equipment/", response_model=schemas.CharacterEquipment)
 def add_equipment_to_character(
     local_id: int,
     ce: schemas.CharacterEquipmentCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Add equipment to a character."""
-    character = crud.get_character_by_local_id(db, user.id, local_id)
-    if character is None:
+    character_id = crud.get_character_id_by_local_id(db, user.id, local_id)
+    if character_id is None:
         raise HTTPException(status_code=404, detail="Character not found")
-    return crud.add_equipment_to_character(db, character.id, ce)
+    return crud.add_equipment_to_character(db, character_id, ce)
 
 @app.delete("/characters/{local_id}/equipment/{equipment_id}", status_code=204)
 def delete_equipment_from_character(
     local_id: int,
     equipment_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Delete equipment from a character."""
-    character = crud.get_character_by_local_id(db, user.id, local_id)
-    if character is None:
+    character_id = crud.get_character_id_by_local_id(db, user.id, local_id)
+    if character_id is None:
         raise HTTPException(status_code=404, detail="Character not found")
-    result = crud.remove_equipment_from_character(db, character.id, equipment_id)
+    result = crud.remove_equipment_from_character(db, character_id, equipment_id)
     if result is None:
         raise HTTPException(status_code=404, detail="Equipment not found for this character")
     return Response(status_code=204)
@@ -361,14 +544,14 @@ def delete_equipment_from_character(
 def equip_equipment(
     local_id: int,
     equipment_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Equip an item to a character."""
-    character = crud.get_character_by_local_id(db, user.id, local_id)
-    if character is None:
+    character_id = crud.get_character_id_by_local_id(db, user.id, local_id)
+    if character_id is None:
         raise HTTPException(status_code=404, detail="Character not found")
-    ce = crud.set_equipment_equipped(db, character.id, equipment_id, True)
+    ce = crud.set_equipment_equipped(db, character_id, equipment_id, True)
     if ce is None:
         raise HTTPException(status_code=404, detail="Equipment not found for this character")
     return ce
@@ -378,14 +561,14 @@ def equip_equipment(
 def unequip_equipment(
     local_id: int,
     equipment_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Unequip an item from a character."""
-    character = crud.get_character_by_local_id(db, user.id, local_id)
-    if character is None:
+    character_id = crud.get_character_id_by_local_id(db, user.id, local_id)
+    if character_id is None:
         raise HTTPException(status_code=404, detail="Character not found")
-    ce = crud.set_equipment_equipped(db, character.id, equipment_id, False)
+    ce = crud.set_equipment_equipped(db, character_id, equipment_id, False)
     if ce is None:
         raise HTTPException(status_code=404, detail="Equipment not found for this character")
     return ce
@@ -393,67 +576,55 @@ def unequip_equipment(
 @app.get("/characters/{local_id}/effective_stats/", response_model=Dict[str, Any])
 def get_effective_stats(
     local_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Get effective stats of a character with equipment bonuses."""
-    character = crud.get_character_by_local_id(db, user.id, local_id)
-    if character is None:
+    stats = crud.get_effective_stats(db, user.id, local_id, backfill=False)
+    if stats is None:
         raise HTTPException(status_code=404, detail="Character not found")
-    equipped_items = crud.get_character_equipped_items(db, character.id)
-    stats = {
-        "armor_class": character.armor_class,
-        "strength": character.strength,
-        "dexterity": character.dexterity,
-        "constitution": character.constitution,
-        "intelligence": character.intelligence,
-        "wisdom": character.wisdom,
-        "charisma": character.charisma,
-        "max_hp": character.max_hp,
-        "current_hp": character.current_hp,
-    }
-    for item in equipped_items:
-        if item.equipment and item.equipment.effects:
-            try:
-                effects = json.loads(item.equipment.effects)
-                for key, value in effects.items():
-                    if key in stats:
-                        stats[key] += value
-            except (json.JSONDecodeError, TypeError, AttributeError):
-                pass
+    return fastjson.respond(stats)
+
+@app.get("/export/characters")
+def export_characters(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),  # pylint: disable=redefined-builtin
+    user: schemas.User = Depends(get_current_user)
+):
+    """Stream all characters of the current user as NDJSON or CSV."""
+    return StreamingResponse(export.export_characters(user.id, format), media_type=export.MEDIA_TYPES[format])
+
+@app.get("/export/catalog/{table}")
+def export_catalog(
+    table: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$")  # pylint: disable=redefined-builtin
+):
+    """Stream a whole catalog table as NDJSON or CSV."""
+    if table not in export.CATALOG_EXPORTS:
+        raise HTTPException(status_code=404, detail="Unknown catalog table")
+    return StreamingResponse(export.export_catalog(table, format), media_type=export.MEDIA_TYPES[format])
 
 @app.post("/class_progression/{progression_id}/add_ability/{ability_id}")
 def add_ability_to_progression(
     progression_id: int,
     ability_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Add an ability to a class progression (admin endpoint)."""
-    cpa = models.ClassProgressionAbility(
-        class_progression_id=progression_id,
-        ability_id=ability_id
-    )
-    db.add(cpa)
-    db.commit()
-    db.refresh(cpa)
-    return cpa
+    try:
+        return crud.add_ability_to_progression(db, progression_id, ability_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 @app.delete("/class_progression/{progression_id}/remove_ability/{ability_id}", status_code=204)
 def remove_ability_from_progression(
     progression_id: int,
     ability_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     user: schemas.User = Depends(get_current_user)
 ):
     """Remove an ability from a class progression (admin endpoint)."""
-    cpa = db.query(models.ClassProgressionAbility).filter(
-        models.ClassProgressionAbility.class_progression_id == progression_id,
-        models.ClassProgressionAbility.ability_id == ability_id
-    ).first()
-    if not cpa:
+    if crud.remove_ability_from_progression(db, progression_id, ability_id) is None:
         raise HTTPException(status_code=404, detail="Link not found")
-    db.delete(cpa)
-    db.commit()
     return Response(status_code=204)
 
@@ -0,0 +1,147 @@
+"""Request metrics: per-route latency histograms and Prometheus text output."""
+
+import bisect
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Границы корзин гистограммы задержек, в секундах
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Путь без маршрута (404) не должен плодить метки из сырых URL
+UNMATCHED = "<unmatched>"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RouteStats:
+    """Histogram and status counters of one method + route template."""
+
+    __slots__ = ("buckets", "total", "count", "statuses", "db_queries", "db_time", "nplus1")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)  # последняя корзина: +Inf
+        self.total = 0.0
+        self.count = 0
+        self.statuses: Dict[int, int] = {}
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.nplus1 = 0
+
+
+class Metrics:
+    """Request counters of one process.
+
+    Every update comes from the middleware on the event loop thread, so plain
+    integer increments need no lock; /metrics renders on the same thread.
+    """
+
+    def __init__(self):
+        self.routes: Dict[Tuple[str, str], RouteStats] = {}
+        self.in_flight = 0
+        self._collectors: List[Tuple[str, str, Callable[[], Dict[str, float]]]] = []
+
+    def observe(self, method: str, route: str, status: int, duration: float, db_stats=None) -> None:
+        """Record one finished request (with its dbstats.QueryStats if tracked)."""
+        stats = self.routes.get((method, route))
+        if stats is None:
+            stats = self.routes[(method, route)] = RouteStats()
+        stats.buckets[bisect.bisect_left(BUCKETS, duration)] += 1
+        stats.total += duration
+        stats.count += 1
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        if db_stats is not None:
+            stats.db_queries += db_stats.count
+            stats.db_time += db_stats.duration
+            if db_stats.repeated():
+                stats.nplus1 += 1
+
+    def add_collector(self, name: str, help_text: str, collect: Callable[[], Dict[str, float]]) -> None:
+        """Export a {key: value} snapshot function as a gauge labelled by key."""
+        self._collectors.append((name, help_text, collect))
+
+    def reset(self) -> None:
+        """Drop recorded requests (collectors stay)."""
+        self.routes.clear()
+
+    def render(self) -> str:
+        """Return all metrics in Prometheus text exposition format."""
+        lines = [
+            "# HELP http_requests_in_flight Requests currently being handled.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_requests_total Finished requests by route template and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        routes = sorted(self.routes.items())
+        for (method, route), stats in routes:
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{_escape(route)}",'
+                             f'status="{status}"}} {count}')
+        lines.append("# HELP http_request_duration_seconds Request latency by route template.")
+        lines.append("# TYPE http_request_duration_seconds histogram")
+        for (method, route), stats in routes:
+            labels = f'method="{method}",route="{_escape(route)}"'
+            cumulative = 0
+            for bound, count in zip((*BUCKETS, "+Inf"), stats.buckets):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {stats.total:.6f}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {stats.count}")
+        for name, help_text, attribute in (
+            ("http_request_db_queries_total", "SQL statements executed by requests.", "db_queries"),
+            ("http_request_db_seconds_total", "Time spent in SQL statements.", "db_time"),
+            ("http_request_nplus1_total", "Requests that repeated one statement (likely N+1).", "nplus1"),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (method, route), stats in routes:
+                value = getattr(stats, attribute)
+                value = f"{value:.6f}" if isinstance(value, float) else value
+                lines.append(f'{name}{{method="{method}",route="{_escape(route)}"}} {value}')
+        for name, help_text, collect in self._collectors:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in collect().items():
+                lines.append(f'{name}{{key="{_escape(str(key))}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware that times every HTTP request by route template.
+
+    The template comes from scope["route"], which the router fills in before
+    calling the endpoint, so /characters/7 and /characters/8 share a series.
+    """
+
+    def __init__(self, app, metrics: Optional[Metrics] = None):
+        self.app = app
+        self.metrics = metrics if metrics is not None else registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics = self.metrics
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - started
+            metrics.in_flight -= 1
+            route = scope.get("route")
+            metrics.observe(scope["method"], route.path if route is not None else UNMATCHED, status, duration,
+                            scope.get("db_stats"))
+
+
+registry = Metrics()
@@ -0,0 +1,150 @@
+"""Versioned schema migrations for existing database files.
+
+Base.metadata.create_all only creates missing tables; it never changes
+tables that already exist. Each migration here brings an older database
+file up to date and is recorded in the schema_migrations table. Migrations
+are idempotent, so they are also safe on databases created by create_all.
+
+Usage: python migrations.py
+"""
+
+import time
+from typing import Callable, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+
+def _dedupe(conn: Connection, table: str, columns: str) -> None:
+    # Уникальный индекс не создастся поверх дублей: оставляем самую раннюю строку
+    conn.execute(text(
+        f"DELETE FROM {table} WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY {columns})"
+    ))
+
+
+def _hot_path_indexes(conn: Connection) -> None:
+    _dedupe(conn, "character_abilities", "character_id, ability_id")
+    _dedupe(conn, "class_progression_abilities", "class_progression_id, ability_id")
+    for statement in (
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_character_abilities_character_ability "
+        "ON character_abilities (character_id, ability_id)",
+        "CREATE INDEX IF NOT EXISTS ix_character_equipment_character_equipment "
+        "ON character_equipment (character_id, equipment_id)",
+        "CREATE INDEX IF NOT EXISTS ix_character_equipment_character_equipped "
+        "ON character_equipment (character_id, is_equipped)",
+        "CREATE INDEX IF NOT EXISTS ix_class_progressions_class_level "
+        "ON class_progressions (character_class_id, level)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_class_progression_abilities_progression_ability "
+        "ON class_progression_abilities (class_progression_id, ability_id)",
+    ):
+        conn.execute(text(statement))
+
+
+def _has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute(text(f"PRAGMA table_info({table})")))
+
+
+def _user_local_id_counter(conn: Connection) -> None:
+    if not _has_column(conn, "users", "last_local_id"):
+        conn.execute(text("ALTER TABLE users ADD COLUMN last_local_id INTEGER NOT NULL DEFAULT 0"))
+    conn.execute(text(
+        "UPDATE users SET last_local_id = "
+        "(SELECT COALESCE(MAX(local_id), 0) FROM characters WHERE characters.owner_id = users.id)"
+    ))
+
+
+# Поля статов на момент миграции 3; список зафиксирован, как и сам SQL
+_STAT_COLUMNS = ("armor_class", "strength", "dexterity", "constitution", "intelligence",
+                 "wisdom", "charisma", "max_hp", "current_hp")
+
+
+def _backfill_effective_stats(conn: Connection) -> None:
+    # Персонажи, созданные до материализованных статов, получают строку один раз,
+    # а не пересчитываются при каждом чтении
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS character_effective_stats ("
+        "character_id INTEGER NOT NULL PRIMARY KEY REFERENCES characters (id), "
+        + ", ".join(f"{column} INTEGER NOT NULL" for column in _STAT_COLUMNS) + ")"
+    ))
+    known = ", ".join(f"'{column}'" for column in _STAT_COLUMNS)
+    # Предмет с невалидными эффектами (не объект, неизвестный стат, не целое) не даёт бонусов вовсе
+    valid_effects = (
+        "json_valid(e.effects) AND json_type(e.effects) = 'object' AND NOT EXISTS ("
+        f"SELECT 1 FROM json_each(e.effects) WHERE key NOT IN ({known}) OR type != 'integer')"
+    )
+    conn.execute(text(
+        f"INSERT INTO character_effective_stats (character_id, {', '.join(_STAT_COLUMNS)}) "
+        "SELECT c.id, "
+        + ", ".join(f"c.{column} + COALESCE(SUM(json_extract(e.effects, '$.{column}')), 0)"
+                    for column in _STAT_COLUMNS)
+        + " FROM characters c "
+        "LEFT JOIN character_equipment ce ON ce.character_id = c.id AND ce.is_equipped "
+        f"LEFT JOIN equipment e ON e.id = ce.equipment_id AND {valid_effects} "
+        "WHERE c.id NOT IN (SELECT character_id FROM character_effective_stats) "
+        "GROUP BY c.id"
+    ))
+
+
+def _progression_grants(conn: Connection) -> None:
+    if not _has_column(conn, "characters", "base_level"):
+        conn.execute(text("ALTER TABLE characters ADD COLUMN base_level INTEGER NOT NULL DEFAULT 1"))
+        # Какие уровни старые персонажи прошли через прогрессию, неизвестно: считаем текущий базовым
+        conn.execute(text("UPDATE characters SET base_level = COALESCE(level, 1)"))
+    if not _has_column(conn, "character_abilities", "from_progression"):
+        conn.execute(text(
+            "ALTER TABLE character_abilities ADD COLUMN from_progression BOOLEAN NOT NULL DEFAULT 0"
+        ))
+
+
+# (версия, описание, функция); новые миграции добавляются только в конец
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "composite indexes for hot lookup paths", _hot_path_indexes),
+    (2, "per-user local_id counter", _user_local_id_counter),
+    (3, "backfill materialized effective stats", _backfill_effective_stats),
+    (4, "track levels and abilities granted by class progression", _progression_grants),
+]
+
+
+def applied_versions(conn: Connection) -> set:
+    """Return versions already applied to the database."""
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description VARCHAR NOT NULL, applied_at FLOAT NOT NULL)"
+    ))
+    return {version for version, in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def pending_versions(engine: Engine) -> List[int]:
+    """Versions not applied yet, without touching the database."""
+    with engine.connect() as conn:
+        if not inspect(conn).has_table("schema_migrations"):
+            return [version for version, _, _ in MIGRATIONS]
+        done = {version for version, in conn.execute(text("SELECT version FROM schema_migrations"))}
+    return [version for version, _, _ in MIGRATIONS if version not in done]
+
+
+def migrate(engine: Engine) -> List[int]:
+    """Apply pending migrations, each in its own transaction; return applied versions."""
+    applied = []
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+    for version, description, apply in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            apply(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {"v": version, "d": description, "t": time.time()},
+            )
+        applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    from database import engine, Base, SQLALCHEMY_DATABASE_URL
+    import models  # noqa: F401  pylint: disable=unused-import
+
+    Base.metadata.create_all(bind=engine)
+    versions = migrate(engine)
+    print(f"{SQLALCHEMY_DATABASE_URL}: applied {versions or 'nothing'}")
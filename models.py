@@ -1,12 +1,18 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, UniqueConstraint
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database import Base
 
+def _initial_level(context):
+    # Уровень при создании: HP и способности до него пришли не из прогрессии
+    return context.get_current_parameters().get("level") or 1
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True)
     hashed_password = Column(String, nullable=False)
+    # Последний выданный local_id персонажа; увеличивается атомарно при создании
+    last_local_id = Column(Integer, nullable=False, default=0, server_default="0")
     characters = relationship("Character", back_populates="owner")
 
 class CharacterClass(Base):
@@ -26,6 +32,11 @@ class ClassProgression(Base):
     other_bonuses = Column(String)  # JSON для других бонусов (опционально)
     character_class = relationship("CharacterClass", back_populates="progressions")
 
+    # Индексы горячих запросов; для существующих баз их создаёт migrations.py
+    __table_args__ = (
+        Index("ix_class_progressions_class_level", "character_class_id", "level"),
+    )
+
 class Ability(Base):
     __tablename__ = "abilities"
     id = Column(Integer, primary_key=True, index=True)
@@ -52,6 +63,7 @@ class Character(Base):
     name = Column(String, nullable=False)
     character_class_id = Column(Integer, ForeignKey("character_classes.id"), nullable=False)
     level = Column(Integer, default=1)  # Новое поле
+    base_level = Column(Integer, nullable=False, default=_initial_level, server_default="1")
 
     max_hp = Column(Integer, nullable=False)
     current_hp = Column(Integer, nullable=False)
@@ -80,9 +92,15 @@ class CharacterAbility(Base):
     ability_id = Column(Integer, ForeignKey("abilities.id"))
     current_uses = Column(Integer, default=1)
     name = Column(String)
+    # Выдана прогрессией класса (при понижении уровня удаляется), а не добавлена вручную
+    from_progression = Column(Boolean, nullable=False, default=False, server_default="0")
     character = relationship("Character", back_populates="abilities")
     ability = relationship("Ability")
 
+    __table_args__ = (
+        Index("ux_character_abilities_character_ability", "character_id", "ability_id", unique=True),
+    )
+
 class CharacterEquipment(Base):
     __tablename__ = "character_equipment"
     id = Column(Integer, primary_key=True, index=True)
@@ -93,6 +111,11 @@ class CharacterEquipment(Base):
     character = relationship("Character", back_populates="equipment")
     equipment = relationship("Equipment")
 
+    __table_args__ = (
+        Index("ix_character_equipment_character_equipment", "character_id", "equipment_id"),
+        Index("ix_character_equipment_character_equipped", "character_id", "is_equipped"),
+    )
+
 
 class ClassProgressionAbility(Base):
     __tablename__ = "class_progression_abilities"
@@ -100,3 +123,24 @@ class ClassProgressionAbility(Base):
     class_progression_id = Column(Integer, ForeignKey("class_progressions.id"))
     ability_id = Column(Integer, ForeignKey("abilities.id"))
 
+    __table_args__ = (
+        Index(
+            "ux_class_progression_abilities_progression_ability",
+            "class_progression_id", "ability_id", unique=True
+        ),
+    )
+
+
+class CharacterStats(Base):
+    """Materialized effective stats (base stats plus equipped item effects)."""
+    __tablename__ = "character_effective_stats"
+    character_id = Column(Integer, ForeignKey("characters.id"), primary_key=True)
+    armor_class = Column(Integer, nullable=False)
+    strength = Column(Integer, nullable=False)
+    dexterity = Column(Integer, nullable=False)
+    constitution = Column(Integer, nullable=False)
+    intelligence = Column(Integer, nullable=False)
+    wisdom = Column(Integer, nullable=False)
+    charisma = Column(Integer, nullable=False)
+    max_hp = Column(Integer, nullable=False)
+    current_hp = Column(Integer, nullable=False)
@@ -0,0 +1,38 @@
+"""Keyset (cursor) pagination helpers for list endpoints."""
+
+import os
+from typing import Optional
+
+from fastapi import Query, Response
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+# Курсор следующей страницы отдаётся в заголовке, тело ответа остаётся списком
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams:
+    """Query parameters of a keyset page: rows with id > after, at most limit."""
+
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE,
+                           description=f"page size (default {DEFAULT_PAGE_SIZE}); follow the "
+                                       f"{NEXT_CURSOR_HEADER} header for the rest of the list"),
+        after: Optional[int] = Query(None, description="next_cursor of the previous page"),
+    ):
+        self.limit = limit
+        self.after = after
+
+    @property
+    def fetch(self) -> int:
+        """Rows to fetch: one extra row tells whether a next page exists."""
+        return self.limit + 1
+
+    def apply(self, response: Response, rows: list) -> list:
+        """Trim the extra row and set the next cursor header."""
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            response.headers[NEXT_CURSOR_HEADER] = str(rows[-1].id)
+        return rows
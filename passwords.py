@@ -0,0 +1,146 @@
+"""Password hashing offloaded to a bounded process pool."""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+ALGORITHM = "pbkdf2_sha256"
+# Стоимость хеширования; при изменении старые хеши пересчитываются при входе
+ITERATIONS = int(os.getenv("PASSWORD_HASH_ITERATIONS", "600000"))
+# 0 воркеров: хешировать в потоках (например, там, где нельзя порождать процессы)
+WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Сколько запросов может ждать свободного воркера, прежде чем отвечать 503
+MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+
+def hash_password(password: str, iterations: int = ITERATIONS, salt: Optional[bytes] = None) -> str:
+    """Return an encoded PBKDF2-SHA256 hash: algorithm$iterations$salt$hash."""
+    if salt is None:
+        salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return "$".join((
+        ALGORITHM,
+        str(iterations),
+        base64.b64encode(salt).decode("ascii"),
+        base64.b64encode(digest).decode("ascii"),
+    ))
+
+
+def verify_password(password: str, stored: str) -> bool:
+    """Check a password against a stored hash (or a legacy plain-text value)."""
+    parts = stored.split("$")
+    if len(parts) != 4 or parts[0] != ALGORITHM:
+        # Пароли, сохранённые до появления хеширования, лежат открытым текстом
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+    _, iterations, salt, digest = parts
+    candidate = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), base64.b64decode(salt), int(iterations))
+    return hmac.compare_digest(candidate, base64.b64decode(digest))
+
+
+# Хеш для входа под несуществующим именем: проверка стоит столько же, сколько
+# настоящая, и никогда не проходит, так что по времени ответа не узнать, есть ли пользователь
+DUMMY_HASH = "$".join((ALGORITHM, str(ITERATIONS), base64.b64encode(bytes(16)).decode("ascii"),
+                       base64.b64encode(bytes(32)).decode("ascii")))
+
+
+def needs_rehash(stored: str) -> bool:
+    """Whether a stored hash is plain text or uses other cost parameters."""
+    parts = stored.split("$")
+    return len(parts) != 4 or parts[0] != ALGORITHM or parts[1] != str(ITERATIONS)
+
+
+def _ready() -> bool:
+    return True
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Raised when too many hashing requests are already waiting."""
+
+
+class PasswordHasher:
+    """Runs hashing in a worker pool with a concurrency limit.
+
+    At most `workers` hashes run at once; up to `max_pending` more requests
+    wait for a slot, anything beyond is rejected so a login storm cannot
+    queue up unbounded work. All counters are touched from the event loop
+    thread only.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.workers > 0:
+                # spawn, а не fork: форкнутый воркер наследует слушающий сокет и
+                # обработчики сигналов сервера и переживает его остановку
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="password-hash")
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(self.workers, 1))
+        if self._semaphore.locked() and self.waiting >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy("Too many password hashing requests")
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        """Hash a password in the pool."""
+        return await self._run(hash_password, password)
+
+    async def verify(self, password: str, stored: str) -> bool:
+        """Verify a password in the pool."""
+        return await self._run(verify_password, password, stored)
+
+    async def warm(self) -> None:
+        """Start the worker processes now instead of on the first login."""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        await asyncio.gather(*(loop.run_in_executor(executor, _ready) for _ in range(max(self.workers, 1))))
+
+    def stats(self) -> dict:
+        """Return queue depth and throughput counters."""
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        """Stop the worker pool."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hasher = PasswordHasher(workers=WORKERS, max_pending=MAX_PENDING)
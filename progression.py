@@ -0,0 +1,87 @@
+"""Precomputed cumulative class progression tables."""
+
+import os
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+from cache import SharedCounters, shared_counters
+
+
+class ProgressionTable:
+    """Cumulative HP bonus and ability set of one class, indexed by level.
+
+    Both lists are dense (index = level), so a lookup for any level is a
+    constant-time list access; levels above the last progression reuse it.
+    If a level has several progression rows, only the first (lowest id) counts.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[int, int, Optional[int], Optional[int]]]):
+        rows = [row for row in rows if row[1] is not None and row[1] >= 1]
+        # Дубли (класс, уровень): как и прежний .first(), берём строку с меньшим id
+        first: Dict[int, int] = {}
+        for progression_id, level, _, _ in rows:
+            first[level] = min(progression_id, first.get(level, progression_id))
+        hp_by_level: Dict[int, int] = {}
+        abilities_by_level: Dict[int, set] = {}
+        for progression_id, level, hp_bonus, ability_id in rows:
+            if first[level] != progression_id:
+                continue
+            hp_by_level[level] = hp_bonus or 0
+            if ability_id is not None:
+                abilities_by_level.setdefault(level, set()).add(ability_id)
+        self.max_level = max(hp_by_level, default=0)
+        self.hp = [0] * (self.max_level + 1)
+        self.abilities: list = [frozenset()] * (self.max_level + 1)
+        hp, abilities = 0, frozenset()
+        for level in range(1, self.max_level + 1):
+            hp += hp_by_level.get(level, 0)
+            if level in abilities_by_level:
+                abilities = abilities | abilities_by_level[level]
+            self.hp[level] = hp
+            self.abilities[level] = abilities
+
+    def at(self, level: int) -> Tuple[int, FrozenSet[int]]:
+        """Return (cumulative HP bonus, cumulative ability ids) at a level."""
+        level = max(0, min(level, self.max_level))
+        return self.hp[level], self.abilities[level]
+
+
+class ProgressionCache:
+    """Progression tables by class id, rebuilt after any progression change.
+
+    The version is a shared counter, so an edit in one worker drops the
+    tables of every worker.
+    """
+
+    def __init__(self, ttl: float, counters: SharedCounters = shared_counters):
+        self.ttl = ttl
+        self._counters = counters
+        self._tables: Dict[int, Tuple[float, int, ProgressionTable]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        """Current version of the progression data."""
+        return self._counters.get("progression")
+
+    def get(self, class_id: int, loader) -> ProgressionTable:
+        """Return the table of a class, building it with loader() on a miss."""
+        version = self.version
+        entry = self._tables.get(class_id)
+        if entry is not None and entry[1] == version and entry[0] + self.ttl > time.time():
+            return entry[2]
+        table = ProgressionTable(loader())
+        with self._lock:
+            if self.version == version:
+                self._tables[class_id] = (time.time(), version, table)
+        return table
+
+    def invalidate(self) -> None:
+        """Drop every table (progression edits are rare)."""
+        with self._lock:
+            self._counters.bump("progression")
+            self._tables.clear()
+
+
+progression_cache = ProgressionCache(ttl=float(os.getenv("PROGRESSION_CACHE_TTL", "300")))
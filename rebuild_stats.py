@@ -0,0 +1,33 @@
+"""Verify and repair materialized effective stats of all characters.
+
+Usage: python rebuild_stats.py [--check]
+"""
+
+import argparse
+import sys
+
+from database import SessionLocal, engine, Base
+import crud
+
+
+def main(argv=None) -> int:
+    """Run the rebuild; in --check mode exit with 1 if anything is wrong."""
+    parser = argparse.ArgumentParser(description="Verify and repair materialized effective stats.")
+    parser.add_argument("--check", action="store_true", help="only report mismatches, do not repair")
+    args = parser.parse_args(argv)
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        mismatched = crud.rebuild_effective_stats(db, repair=not args.check)
+    finally:
+        db.close()
+    action = "found" if args.check else "repaired"
+    print(f"{len(mismatched)} character(s) with wrong or missing stats {action}")
+    if mismatched:
+        print("character ids:", ", ".join(str(character_id) for character_id in mismatched[:50]))
+    return 1 if mismatched and args.check else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
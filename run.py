@@ -1,3 +1,5 @@
+"""Development server with auto-reload; in production use serve.py."""
+
 import uvicorn
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+"""Production launcher: several uvicorn workers sharing one SQLite database.
+
+The master process prepares the schema once and then starts the workers
+with DB_INIT_SCHEMA=0; every connection gets the SQLite profile from
+database.py (WAL, busy timeout), so readers in one worker do not block
+writers in another. Worker caches stay consistent through a shared
+counters file (cache.SharedCounters).
+
+Signals to the master: SIGHUP restarts the workers one at a time (each new
+worker must be ready before the next old one stops), SIGTTIN / SIGTTOU add or
+remove a worker, SIGTERM / SIGINT stop gracefully. GET /health reports the
+worker that answered.
+
+Usage: python serve.py [--workers N] [--host HOST] [--port PORT]
+                       [--loop auto|uvloop|asyncio] [--http auto|httptools|h11]
+"""
+
+import argparse
+import importlib.util
+import logging
+import os
+import secrets
+import sys
+import tempfile
+from typing import Dict, List, Optional
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+# Реализация -> модуль, без которого её не выбрать
+LOOPS = {"uvloop": "uvloop", "asyncio": None}
+HTTP = {"httptools": "httptools", "h11": "h11"}
+
+
+def default_workers() -> int:
+    """Worker count from WEB_CONCURRENCY, else one per CPU."""
+    return int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the API with several uvicorn workers.")
+    parser.add_argument("--workers", type=int, default=default_workers(),
+                        help="worker processes (default: WEB_CONCURRENCY or CPU count)")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--loop", choices=("auto", *LOOPS), default=os.getenv("UVICORN_LOOP", "auto"))
+    parser.add_argument("--http", choices=("auto", *HTTP), default=os.getenv("UVICORN_HTTP", "auto"))
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+                        help="seconds a stopping worker may spend finishing requests")
+    parser.add_argument("--keep-alive", type=int, default=int(os.getenv("KEEP_ALIVE", "5")))
+    parser.add_argument("--max-requests", type=int, default=int(os.getenv("MAX_REQUESTS", "0")),
+                        help="recycle a worker after this many requests (0: never)")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    return parser.parse_args(argv)
+
+
+def pick(kind: str, requested: str, choices: Dict[str, Optional[str]]) -> str:
+    """Resolve 'auto' to the fastest installed implementation, check an explicit one."""
+    if requested == "auto":
+        for name, module in choices.items():
+            if module is None or importlib.util.find_spec(module) is not None:
+                return name
+    module = choices[requested]
+    if module is not None and importlib.util.find_spec(module) is None:
+        raise SystemExit(f"--{kind} {requested} needs the {module} package")
+    return requested
+
+
+def prepare_database() -> None:
+    """Create and migrate the schema once, before any worker starts."""
+    # pylint: disable=import-outside-toplevel
+    import migrations
+    import models  # noqa: F401  pylint: disable=unused-import
+    from database import Base, engine
+    Base.metadata.create_all(bind=engine)
+    migrations.migrate(engine)
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            logger.info("SQLite journal mode: %s", conn.exec_driver_sql("PRAGMA journal_mode").scalar())
+    engine.dispose()
+
+
+def worker_environment(workers: int, sync_file: str) -> Dict[str, str]:
+    """Environment the workers inherit from the master."""
+    env = {
+        # Схему уже подготовил мастер: воркеры не должны гоняться за миграциями
+        "DB_INIT_SCHEMA": "0",
+        "CACHE_SYNC_FILE": sync_file,
+        "CACHE_BOOT_ID": secrets.token_hex(4),
+    }
+    if "PASSWORD_HASH_WORKERS" not in os.environ:
+        # Пулы хеширования всех воркеров вместе не больше числа CPU
+        env["PASSWORD_HASH_WORKERS"] = str(max(1, (os.cpu_count() or 1) // workers))
+    return env
+
+
+def uvicorn_options(args: argparse.Namespace) -> dict:
+    """Keyword arguments of uvicorn.run for the parsed options."""
+    options = {
+        "host": args.host,
+        "port": args.port,
+        "workers": args.workers,
+        "loop": pick("loop", args.loop, LOOPS),
+        "http": pick("http", args.http, HTTP),
+        "timeout_graceful_shutdown": args.graceful_timeout,
+        "timeout_keep_alive": args.keep_alive,
+        "log_level": args.log_level,
+        # Заголовок Server не нужен клиентам
+        "server_header": False,
+    }
+    if args.max_requests:
+        # Разброс, чтобы воркеры не перезапускались одновременно
+        options["limit_max_requests"] = args.max_requests
+        options["limit_max_requests_jitter"] = max(1, args.max_requests // 10)
+    return options
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Prepare the database and run the workers until the master is stopped."""
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s:     %(message)s")
+    options = uvicorn_options(args)
+    prepare_database()
+    fd, sync_file = tempfile.mkstemp(prefix="dnd-cache-")
+    os.close(fd)
+    os.environ.update(worker_environment(args.workers, sync_file))
+    logger.info("Starting %d worker(s), loop=%s, http=%s", args.workers, options["loop"], options["http"])
+    try:
+        uvicorn.run("main:app", **options)
+    finally:
+        os.unlink(sync_file)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
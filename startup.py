@@ -0,0 +1,89 @@
+"""Startup work run by the app lifespan: schema setup, schema check, warm-up."""
+
+import logging
+import os
+import time
+from typing import Callable, Dict, List
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+
+from database import Base, ReadSessionLocal, engine, read_engine
+from pagination import DEFAULT_PAGE_SIZE
+import cache
+import crud
+import migrations
+import models
+
+logger = logging.getLogger(__name__)
+
+# DB_INIT_SCHEMA=0: схему создаёт отдельный шаг деплоя (python migrations.py)
+INIT_SCHEMA = os.getenv("DB_INIT_SCHEMA", "1") == "1"
+# DB_SCHEMA_CHECK=1: не стартовать на базе, где не хватает таблиц, колонок или миграций
+SCHEMA_CHECK = os.getenv("DB_SCHEMA_CHECK", "0") == "1"
+WARM_UP = os.getenv("STARTUP_WARM_UP", "1") == "1"
+
+# Длительность шагов последнего запуска, секунды
+timings: Dict[str, float] = {}
+
+
+def schema_problems(bind: Engine) -> List[str]:
+    """Describe what the database lacks compared to the models and migrations."""
+    inspector = inspect(bind)
+    existing = set(inspector.get_table_names())
+    problems = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            problems.append(f"missing table {table.name}")
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        problems.extend(f"missing column {table.name}.{column.name}"
+                        for column in table.columns if column.name not in columns)
+    problems.extend(f"migration {version} not applied" for version in migrations.pending_versions(bind))
+    return problems
+
+
+def warm_pool(bind: Engine) -> int:
+    """Open the pool's connections up front; return how many were opened."""
+    size = bind.pool.size() if hasattr(bind.pool, "size") else 1
+    connections = [bind.connect() for _ in range(size)]
+    for connection in connections:
+        connection.close()
+    return len(connections)
+
+
+def warm_caches(catalog_loader: Callable) -> None:
+    """Load catalog snapshots (with their first page) and progression tables."""
+    db = ReadSessionLocal()
+    try:
+        for table in cache.CatalogCache.TABLES:
+            cache.catalog_cache.page(table, catalog_loader(table, db), None, DEFAULT_PAGE_SIZE)
+        for class_id, in db.query(models.CharacterClass.id):
+            crud.get_progression_table(db, class_id)
+    finally:
+        db.close()
+
+
+def _timed(name: str, step: Callable, *args):
+    started = time.perf_counter()
+    result = step(*args)
+    timings[name] = time.perf_counter() - started
+    return result
+
+
+def start(catalog_loader: Callable) -> None:
+    """Run the synchronous startup steps enabled by the environment."""
+    timings.clear()
+    if INIT_SCHEMA:
+        _timed("create_all", Base.metadata.create_all, engine)
+        _timed("migrate", migrations.migrate, engine)
+    if SCHEMA_CHECK:
+        problems = _timed("schema_check", schema_problems, engine)
+        if problems:
+            raise RuntimeError("Database schema is out of date: " + "; ".join(problems))
+    if WARM_UP:
+        _timed("warm_pool", warm_pool, engine)
+        if read_engine is not engine:
+            _timed("warm_read_pool", warm_pool, read_engine)
+        _timed("warm_caches", warm_caches, catalog_loader)
+    logger.info("Startup steps: %s", {name: round(value, 4) for name, value in timings.items()})
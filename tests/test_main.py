@@ -1,4 +1,9 @@
+import asyncio
+import csv
+import io
+import json
 import os
+import shutil
 import sys
 import os as os2
 
@@ -7,14 +12,42 @@ if os.path.exists("test.db"):
     os.remove("test.db")
 
 os.environ["DATABASE_URL"] = "sqlite:///./test.db"
+# Любая ленивая загрузка на горячих запросах должна падать в тестах
+os.environ["DB_STRICT_LOADING"] = "1"
+# Дешёвое хеширование паролей, чтобы тесты не тратили секунды на PBKDF2
+os.environ["PASSWORD_HASH_ITERATIONS"] = "1000"
 
 sys.path.append(os2.path.abspath(os2.path.join(os2.path.dirname(__file__), '..')))
 
-from main import app
-from database import Base, engine
+from main import app, get_read_db, get_write_db
+import async_routes
+from database import Base, engine, SessionLocal, ReadSessionLocal
+import crud
+import effects
+import models
+import passwords
+import migrations
+import startup
+import database
+import serve
+import dbstats
+import metrics
+import fastjson
+from progression import ProgressionTable, progression_cache
+from pagination import DEFAULT_PAGE_SIZE
+import datagen
+from benchmarks import harness, scenarios, metrics_overhead
+from cache import user_cache, invalidate_user, catalog_cache, CatalogCache, SharedCounters, TTLCache, VersionMap
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.exc import InvalidRequestError, OperationalError
+from sqlalchemy.orm import Session
 from fastapi.testclient import TestClient
 
 Base.metadata.create_all(bind=engine)
+migrations.migrate(engine)
 client = TestClient(app)
 
 
@@ -29,12 +62,24 @@ def auth_headers(token):
     """Сформировать headers с авторизацией."""
     return {"Authorization": f"Bearer {token}"}
 
+def assert_query_budget(resp, budget):
+    """Проверить, что обработка запроса уложилась в бюджет SQL-запросов."""
+    assert resp.status_code < 400, resp.text
+    queries = int(resp.headers[dbstats.QUERIES_HEADER])
+    assert queries <= budget, f"{resp.request.method} {resp.request.url.path}: {queries} queries > budget {budget}"
+    return queries
+
 def create_class_and_character(headers):
     """Создать класс и персонажа, вернуть их id."""
     resp = client.post(
         "/character_classes/", json={"name": "Fighter", "description": "Strong"}, headers=headers
     )
-    class_id = resp.json()["id"]
+    if resp.status_code == 400:
+        # Класс уже создан предыдущим тестом
+        classes = client.get("/character_classes/", params={"limit": 1000}).json()
+        class_id = next(c["id"] for c in classes if c["name"] == "Fighter")
+    else:
+        class_id = resp.json()["id"]
     char_data = {
         "local_id": 1,
         "name": "Hero",
@@ -389,4 +434,949 @@ def test_level_up_gives_abilities():
     ability_ids = [a["ability"]["id"] for a in resp.json()]
     assert ability_id in ability_ids
 
-#
\ No newline at end of file
+#
+
+def test_current_user_is_cached():
+    """Тест кэширования пользователя по токену."""
+    token = get_token("cacheuser", "cachepass")
+    headers = auth_headers(token)
+    resp = client.get("/users/me", headers=headers)
+    assert resp.status_code == 200
+    hits = user_cache.stats()["hits"]
+    resp = client.get("/users/me", headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()["username"] == "cacheuser"
+    assert user_cache.stats()["hits"] == hits + 1
+    # Регистрация другого пользователя не сбрасывает чужие токены
+    client.post("/register", json={"username": "cacheneighbour", "password": "pass"})
+    client.get("/users/me", headers=headers)
+    assert user_cache.stats()["hits"] == hits + 2
+    assert invalidate_user("cacheuser") == 1
+    resp = client.get("/users/me", headers=auth_headers("garbage"))
+    assert resp.status_code == 401
+
+def test_async_character_routes():
+    """Тест асинхронных маршрутов чтения персонажей."""
+    token = get_token("asyncuser", "asyncpass")
+    headers = auth_headers(token)
+    resp = client.post("/character_classes/", json={"name": "Warlock", "description": "Pact"}, headers=headers)
+    class_id = resp.json()["id"]
+    char_data = {
+        "local_id": 1,
+        "name": "Morgana",
+        "character_class_id": class_id,
+        "level": 1,
+        "max_hp": 9,
+        "current_hp": 9,
+        "armor_class": 11,
+        "strength": 8,
+        "dexterity": 12,
+        "constitution": 12,
+        "intelligence": 12,
+        "wisdom": 10,
+        "charisma": 16
+    }
+    resp = client.post("/characters/", json=char_data, headers=headers)
+    local_id = resp.json()["local_id"]
+
+    async_app = FastAPI()
+    async_app.include_router(async_routes.router)
+    async_client = TestClient(async_app)
+    resp = async_client.get("/users/me", headers=headers)
+    assert resp.status_code == 200 and resp.json()["username"] == "asyncuser"
+    sync_list = client.get("/characters/", headers=headers).json()
+    resp = async_client.get("/characters/", headers=headers)
+    assert resp.status_code == 200
+    assert resp.json() == sync_list
+    resp = async_client.get(f"/characters/{local_id}", headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()["character_class"]["name"] == "Warlock"
+    resp = async_client.get(f"/characters/{local_id}/equipment/", headers=headers)
+    assert resp.status_code == 200 and resp.json() == []
+    resp = async_client.get("/characters/999", headers=headers)
+    assert resp.status_code == 404
+
+    # Записи сценариев level_up и equip_churn
+    ability_id = client.post("/abilities/", json={"name": "Eldritch Blast", "uses": -1}, headers=headers).json()["id"]
+    prog_id = client.post("/class_progression/", json={
+        "character_class_id": class_id, "level": 2, "hp_bonus": 5
+    }, headers=headers).json()["id"]
+    client.post(f"/class_progression/{prog_id}/add_ability/{ability_id}", headers=headers)
+    equipment_id = client.post("/equipment/", json={
+        "name": "Pact Blade", "cost": 5, "effects": json.dumps({"strength": 2})
+    }, headers=headers).json()["id"]
+    client.post(f"/characters/{local_id}/equipment/", json={"equipment_id": equipment_id}, headers=headers)
+    resp = async_client.patch(f"/characters/{local_id}/equipment/{equipment_id}/equip", headers=headers)
+    assert resp.status_code == 200 and resp.json()["is_equipped"] is True
+    assert resp.json()["equipment"]["name"] == "Pact Blade"
+    assert client.get(f"/characters/{local_id}/effective_stats/", headers=headers).json()["strength"] == 10
+    resp = async_client.patch(f"/characters/{local_id}/equipment/{equipment_id}/unequip", headers=headers)
+    assert resp.status_code == 200 and resp.json()["is_equipped"] is False
+    assert client.get(f"/characters/{local_id}/effective_stats/", headers=headers).json()["strength"] == 8
+    resp = async_client.patch(f"/characters/{local_id}/equipment/999999/equip", headers=headers)
+    assert resp.status_code == 404
+
+    etag = client.get(f"/characters/{local_id}", headers=headers).headers["etag"]
+    resp = async_client.post(f"/characters/{local_id}/level_up", headers=headers)
+    assert resp.status_code == 200 and resp.json()["level"] == 2 and resp.json()["max_hp"] == 14
+    character = client.get(f"/characters/{local_id}", headers=headers)
+    assert character.headers["etag"] != etag
+    assert [a["ability_id"] for a in character.json()["abilities"]] == [ability_id]
+    assert client.get(f"/characters/{local_id}/effective_stats/", headers=headers).json()["max_hp"] == 14
+    resp = async_client.patch(f"/characters/{local_id}/set_level", params={"new_level": 1}, headers=headers)
+    assert resp.status_code == 200 and resp.json()["max_hp"] == 9
+    assert client.get(f"/characters/{local_id}", headers=headers).json()["abilities"] == []
+    resp = async_client.patch(f"/characters/{local_id}/set_level", params={"new_level": 0}, headers=headers)
+    assert resp.status_code == 400
+
+def test_strict_loading_raises_on_lazy_load():
+    """Тест строгого режима: ленивая загрузка на горячем запросе падает."""
+    token = get_token("strictuser", "strictpass")
+    headers = auth_headers(token)
+    resp = client.post("/character_classes/", json={"name": "Paladin", "description": "Oath"}, headers=headers)
+    class_id = resp.json()["id"]
+    char_data = {
+        "local_id": 1,
+        "name": "Arthas",
+        "character_class_id": class_id,
+        "level": 1,
+        "max_hp": 12,
+        "current_hp": 12,
+        "armor_class": 16,
+        "strength": 15,
+        "dexterity": 9,
+        "constitution": 14,
+        "intelligence": 10,
+        "wisdom": 12,
+        "charisma": 14
+    }
+    resp = client.post("/characters/", json=char_data, headers=headers)
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    db = SessionLocal()
+    try:
+        character = crud.get_character_by_local_id(db, user_id, resp.json()["local_id"])
+        assert character.character_class.name == "Paladin"
+        assert character.abilities == []
+        with pytest.raises(InvalidRequestError):
+            character.owner  # pylint: disable=pointless-statement
+    finally:
+        db.close()
+
+def test_keyset_pagination():
+    """Тест курсорной пагинации списков."""
+    token = get_token("pageuser", "pagepass")
+    headers = auth_headers(token)
+    for i in range(5):
+        client.post("/abilities/", json={"name": f"Page Ability {i}", "uses": 1}, headers=headers)
+    seen = []
+    after = None
+    while True:
+        params = {"limit": 2}
+        if after is not None:
+            params["after"] = after
+        resp = client.get("/abilities/", params=params)
+        assert resp.status_code == 200
+        page = resp.json()
+        assert len(page) <= 2
+        seen.extend(a["id"] for a in page)
+        after = resp.headers.get("X-Next-Cursor")
+        if after is None:
+            break
+    all_ids = [a["id"] for a in client.get("/abilities/", params={"limit": 1000}).json()]
+    assert seen == all_ids == sorted(all_ids)
+    # Без limit отдаётся страница по умолчанию, остальное по курсору
+    resp = client.get("/abilities/")
+    assert [a["id"] for a in resp.json()] == all_ids[:DEFAULT_PAGE_SIZE]
+    assert ("X-Next-Cursor" in resp.headers) == (len(all_ids) > DEFAULT_PAGE_SIZE)
+    assert client.get("/abilities/", params={"limit": 0}).status_code == 422
+
+def test_catalog_cache_read_through_and_invalidation():
+    """Тест кэша справочников: повторные чтения из памяти, запись сбрасывает кэш."""
+    token = get_token("cataloguser", "catalogpass")
+    headers = auth_headers(token)
+    client.post("/equipment/", json={"name": "Посох", "cost": 3}, headers=headers)
+    resp = client.get("/equipment/", params={"limit": 1000})
+    assert resp.status_code == 200
+    assert resp.content == JSONResponse(resp.json()).body
+    hits = catalog_cache.stats()["hits"]
+    assert client.get("/equipment/", params={"limit": 1000}).content == resp.content
+    assert catalog_cache.stats()["hits"] == hits + 1
+    version = catalog_cache.version("equipment")
+    resp = client.post("/equipment/", json={"name": "Rope", "cost": 1}, headers=headers)
+    rope_id = resp.json()["id"]
+    assert catalog_cache.version("equipment") == version + 1
+    resp = client.get("/equipment/", params={"limit": 1000})
+    assert any(e["id"] == rope_id for e in resp.json())
+
+def test_etag_not_modified():
+    """Тест ETag/If-None-Match для справочников и персонажа."""
+    token = get_token("etaguser", "etagpass")
+    headers = auth_headers(token)
+    resp = client.get("/abilities/")
+    etag = resp.headers["ETag"]
+    resp = client.get("/abilities/", headers={"If-None-Match": etag})
+    assert resp.status_code == 304 and resp.content == b""
+    client.post("/abilities/", json={"name": "Etag Ability", "uses": 1}, headers=headers)
+    resp = client.get("/abilities/", headers={"If-None-Match": etag})
+    assert resp.status_code == 200 and resp.headers["ETag"] != etag
+
+    resp = client.post("/character_classes/", json={"name": "Cleric", "description": "Faith"}, headers=headers)
+    class_id = resp.json()["id"]
+    char_data = {
+        "local_id": 1,
+        "name": "Tyrael",
+        "character_class_id": class_id,
+        "level": 1,
+        "max_hp": 10,
+        "current_hp": 10,
+        "armor_class": 14,
+        "strength": 12,
+        "dexterity": 10,
+        "constitution": 12,
+        "intelligence": 10,
+        "wisdom": 16,
+        "charisma": 12
+    }
+    local_id = client.post("/characters/", json=char_data, headers=headers).json()["local_id"]
+    resp = client.get(f"/characters/{local_id}", headers=headers)
+    etag = resp.headers["ETag"]
+    resp = client.get(f"/characters/{local_id}", headers={**headers, "If-None-Match": etag})
+    assert resp.status_code == 304
+    char_data["current_hp"] = 5
+    client.put(f"/characters/{local_id}", json=char_data, headers=headers)
+    resp = client.get(f"/characters/{local_id}", headers={**headers, "If-None-Match": etag})
+    assert resp.status_code == 200 and resp.json()["current_hp"] == 5
+
+def test_invalid_effects_rejected():
+    """Тест валидации эффектов предметов при создании."""
+    token = get_token("effuser", "effpass")
+    headers = auth_headers(token)
+    bad = ['{"strength": "2"}', '[1, 2]', '{"luck": 1}', '{not json}', '{"dexterity": true}']
+    for i, raw in enumerate(bad):
+        resp = client.post("/equipment/", json={"name": f"Bad item {i}", "cost": 1, "effects": raw}, headers=headers)
+        assert resp.status_code == 400
+    resp = client.post("/equipment/", json={"name": "Good item", "cost": 1, "effects": '{"wisdom": 1}'}, headers=headers)
+    assert resp.status_code == 200
+
+def test_materialized_stats_rebuild():
+    """Тест материализованных статов: инкрементальные изменения и пересборка."""
+    token = get_token("statuser", "statpass")
+    headers = auth_headers(token)
+    resp = client.post("/character_classes/", json={"name": "Barbarian", "description": "Rage"}, headers=headers)
+    class_id = resp.json()["id"]
+    char_data = {
+        "local_id": 1,
+        "name": "Conan",
+        "character_class_id": class_id,
+        "level": 1,
+        "max_hp": 15,
+        "current_hp": 15,
+        "armor_class": 12,
+        "strength": 17,
+        "dexterity": 13,
+        "constitution": 16,
+        "intelligence": 8,
+        "wisdom": 10,
+        "charisma": 9
+    }
+    local_id = client.post("/characters/", json=char_data, headers=headers).json()["local_id"]
+    resp = client.post("/equipment/", json={"name": "Greataxe", "cost": 30, "effects": '{"strength": 2}'}, headers=headers)
+    eq_id = resp.json()["id"]
+    client.post(f"/characters/{local_id}/equipment/", json={"equipment_id": eq_id, "is_equipped": True}, headers=headers)
+    char_data["strength"] = 18
+    client.put(f"/characters/{local_id}", json=char_data, headers=headers)
+    stats = client.get(f"/characters/{local_id}/effective_stats/", headers=headers).json()
+    assert stats["strength"] == 20
+
+    db = SessionLocal()
+    try:
+        assert crud.rebuild_effective_stats(db, repair=False) == []
+        user_id = client.get("/users/me", headers=headers).json()["id"]
+        character = db.query(models.Character).filter(
+            models.Character.owner_id == user_id, models.Character.local_id == local_id
+        ).first()
+        crud.apply_stats_delta(db, character.id, {"strength": 5})
+        db.commit()
+        assert crud.rebuild_effective_stats(db, repair=True) == [character.id]
+        assert crud.rebuild_effective_stats(db, repair=False) == []
+    finally:
+        db.close()
+    stats = client.get(f"/characters/{local_id}/effective_stats/", headers=headers).json()
+    assert stats["strength"] == 20
+
+def test_effective_stats_batch():
+    """Тест пакетного получения эффективных характеристик."""
+    token = get_token("partyuser", "partypass")
+    headers = auth_headers(token)
+    resp = client.post("/character_classes/", json={"name": "Rogue", "description": "Sneaky"}, headers=headers)
+    class_id = resp.json()["id"]
+    resp = client.post("/equipment/", json={"name": "Ring of Wits", "cost": 100, "effects": '{"intelligence": 3}'}, headers=headers)
+    eq_id = resp.json()["id"]
+    local_ids = []
+    for name in ("Alpha", "Beta", "Gamma"):
+        char_data = {
+            "local_id": 1,
+            "name": name,
+            "character_class_id": class_id,
+            "level": 1,
+            "max_hp": 8,
+            "current_hp": 8,
+            "armor_class": 12,
+            "strength": 10,
+            "dexterity": 14,
+            "constitution": 10,
+            "intelligence": 12,
+            "wisdom": 10,
+            "charisma": 10
+        }
+        local_ids.append(client.post("/characters/", json=char_data, headers=headers).json()["local_id"])
+    client.post(f"/characters/{local_ids[1]}/equipment/", json={"equipment_id": eq_id, "is_equipped": True}, headers=headers)
+
+    resp = client.get("/characters/effective_stats/", headers=headers)
+    assert resp.status_code == 200
+    assert [s["local_id"] for s in resp.json()] == local_ids
+    resp = client.get("/characters/effective_stats/", params={"ids": f"{local_ids[1]},{local_ids[2]}"}, headers=headers)
+    batch = resp.json()
+    assert [s["intelligence"] for s in batch] == [15, 12]
+    single = client.get(f"/characters/{local_ids[1]}/effective_stats/", headers=headers).json()
+    assert {k: v for k, v in batch[0].items() if k != "local_id"} == single
+    assert client.get("/characters/effective_stats/", params={"ids": "1,x"}, headers=headers).status_code == 422
+
+def test_level_jump_and_level_down():
+    """Тест прыжка через несколько уровней и понижения уровня."""
+    token = get_token("jumpuser", "jumppass")
+    headers = auth_headers(token)
+    resp = client.post("/character_classes/", json={"name": "Wizard", "description": "Books"}, headers=headers)
+    class_id = resp.json()["id"]
+    ability_ids = []
+    for level, hp_bonus in ((2, 4), (3, 4), (5, 6)):
+        resp = client.post("/abilities/", json={"name": f"Wizard Spell {level}", "uses": 1}, headers=headers)
+        ability_ids.append(resp.json()["id"])
+        resp = client.post("/class_progression/", json={
+            "character_class_id": class_id, "level": level, "hp_bonus": hp_bonus
+        }, headers=headers)
+        client.post(f"/class_progression/{resp.json()['id']}/add_ability/{ability_ids[-1]}", headers=headers)
+    char_data = {
+        "local_id": 1,
+        "name": "Elminster",
+        "character_class_id": class_id,
+        "level": 1,
+        "max_hp": 6,
+        "current_hp": 6,
+        "armor_class": 10,
+        "strength": 8,
+        "dexterity": 12,
+        "constitution": 10,
+        "intelligence": 18,
+        "wisdom": 12,
+        "charisma": 10
+    }
+    local_id = client.post("/characters/", json=char_data, headers=headers).json()["local_id"]
+
+    resp = client.patch(f"/characters/{local_id}/set_level", params={"new_level": 5}, headers=headers)
+    assert resp.status_code == 200
+    character = client.get(f"/characters/{local_id}", headers=headers).json()
+    assert character["level"] == 5 and character["max_hp"] == 20 and character["current_hp"] == 20
+    assert sorted(a["ability_id"] for a in character["abilities"]) == sorted(ability_ids)
+
+    resp = client.patch(f"/characters/{local_id}/set_level", params={"new_level": 2}, headers=headers)
+    assert resp.status_code == 200
+    character = client.get(f"/characters/{local_id}", headers=headers).json()
+    assert character["level"] == 2 and character["max_hp"] == 10 and character["current_hp"] == 10
+    assert [a["ability_id"] for a in character["abilities"]] == ability_ids[:1]
+    stats = client.get(f"/characters/{local_id}/effective_stats/", headers=headers).json()
+    assert stats["max_hp"] == 10
+    # Раненый персонаж при понижении не уходит в отрицательные HP
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    db = SessionLocal()
+    try:
+        crud.get_character_by_local_id(db, user_id, local_id).current_hp = 3
+        db.commit()
+    finally:
+        db.close()
+    client.patch(f"/characters/{local_id}/set_level", params={"new_level": 1}, headers=headers)
+    character = client.get(f"/characters/{local_id}", headers=headers).json()
+    assert character["max_hp"] == 6 and character["current_hp"] == 0
+    resp = client.patch(f"/characters/{local_id}/set_level", params={"new_level": 0}, headers=headers)
+    assert resp.status_code == 400
+
+def test_level_down_keeps_manual_abilities_and_creation_hp():
+    """Тест понижения уровня: ручные способности и HP уровня создания не снимаются."""
+    token = get_token("leveldownuser", "leveldownpass")
+    headers = auth_headers(token)
+    class_id = client.post("/character_classes/", json={"name": "Pactkeeper", "description": "Pact"},
+                           headers=headers).json()["id"]
+    ability_ids = []
+    for level in (2, 3):
+        resp = client.post("/abilities/", json={"name": f"Pactkeeper Gift {level}", "uses": 1}, headers=headers)
+        ability_ids.append(resp.json()["id"])
+        resp = client.post("/class_progression/", json={
+            "character_class_id": class_id, "level": level, "hp_bonus": 5
+        }, headers=headers)
+        client.post(f"/class_progression/{resp.json()['id']}/add_ability/{ability_ids[-1]}", headers=headers)
+    char_data = {
+        "local_id": 1, "name": "Hexblade", "character_class_id": class_id, "level": 1,
+        "max_hp": 8, "current_hp": 8, "armor_class": 12, "strength": 10, "dexterity": 12,
+        "constitution": 12, "intelligence": 10, "wisdom": 10, "charisma": 16
+    }
+    # Способность уровня 3 игрок добавил сам ещё на первом уровне
+    local_id = client.post("/characters/", json=char_data, headers=headers).json()["local_id"]
+    client.post(f"/characters/{local_id}/abilities/", json={"ability_id": ability_ids[1]}, headers=headers)
+    client.patch(f"/characters/{local_id}/set_level", params={"new_level": 3}, headers=headers)
+    client.patch(f"/characters/{local_id}/set_level", params={"new_level": 1}, headers=headers)
+    character = client.get(f"/characters/{local_id}", headers=headers).json()
+    assert [a["ability_id"] for a in character["abilities"]] == ability_ids[1:]
+    assert character["max_hp"] == 8
+
+    # Персонаж создан сразу на 3 уровне: его HP не из прогрессии, понижение их не снимает
+    high = client.post("/characters/", json={**char_data, "name": "Veteran", "level": 3, "max_hp": 30,
+                                             "current_hp": 30}, headers=headers).json()["local_id"]
+    client.patch(f"/characters/{high}/set_level", params={"new_level": 1}, headers=headers)
+    character = client.get(f"/characters/{high}", headers=headers).json()
+    assert character["level"] == 1 and character["max_hp"] == 30 and character["current_hp"] == 30
+    client.post(f"/characters/{high}/level_up", headers=headers)
+    client.post(f"/characters/{high}/level_up", headers=headers)
+    client.post(f"/characters/{high}/level_up", headers=headers)
+    character = client.get(f"/characters/{high}", headers=headers).json()
+    assert character["level"] == 4 and character["max_hp"] == 30
+    assert client.get(f"/characters/{high}/effective_stats/", headers=headers).json()["max_hp"] == 30
+
+def test_progression_table_cumulative():
+    """Тест накопительной таблицы прогрессии класса."""
+    table = ProgressionTable([(1, 2, 3, 10), (1, 2, 3, 11), (2, 4, 5, None), (3, 5, 1, 12)])
+    assert table.at(1) == (0, frozenset())
+    assert table.at(2) == (3, frozenset({10, 11}))
+    assert table.at(5) == (9, frozenset({10, 11, 12}))
+    assert table.at(20) == table.at(5)
+
+def test_progression_table_duplicate_level_uses_first_row():
+    """Тест дублей (класс, уровень): учитывается только первая строка, как в .first()."""
+    table = ProgressionTable([(7, 2, 1, 20), (3, 2, 4, 10), (3, 2, 4, 11), (9, 3, 2, None)])
+    assert table.at(2) == (4, frozenset({10, 11}))
+    assert table.at(3) == (6, frozenset({10, 11}))
+
+def test_ndjson_bulk_import():
+    """Тест потокового NDJSON-импорта с отчётом об ошибках по строкам."""
+    token = get_token("importuser", "importpass")
+    headers = auth_headers(token)
+    client.post("/equipment/", json={"name": "Imported Existing", "cost": 1}, headers=headers)
+    lines = [
+        json.dumps({"name": "Imported Lantern", "cost": 2, "effects": '{"wisdom": 1}'}),
+        "",
+        json.dumps({"name": "Imported Existing", "cost": 1}),
+        "{broken",
+        json.dumps({"name": "Imported Lantern", "cost": 3}),
+        json.dumps({"name": "Imported Cursed", "cost": 3, "effects": '{"luck": 1}'}),
+        json.dumps({"name": "Imported Rope", "cost": 1}),
+    ]
+    resp = client.post("/equipment/import", content="\n".join(lines), headers=headers)
+    assert resp.status_code == 200
+    report = resp.json()
+    assert report["inserted"] == 2
+    assert [e["line"] for e in report["errors"]] == [3, 4, 5, 6]
+    names = {e["name"] for e in client.get("/equipment/", params={"limit": 1000}).json()}
+    assert {"Imported Lantern", "Imported Rope"} <= names
+    assert "Imported Cursed" not in names
+
+    resp = client.post("/class_progression/import", content=json.dumps({"character_class_id": 999999, "level": 2}), headers=headers)
+    assert resp.json() == {"inserted": 0, "errors": [{"line": 1, "error": "Character class not found"}]}
+
+def test_streaming_export():
+    """Тест потоковой выгрузки персонажей и справочников."""
+    token = get_token("exportuser", "exportpass")
+    headers = auth_headers(token)
+    _, local_id = create_class_and_character(headers)
+    resp = client.post("/equipment/", json={"name": "Export Torch", "cost": 1, "effects": '{"wisdom": 1}'}, headers=headers)
+    client.post(f"/characters/{local_id}/equipment/", json={"equipment_id": resp.json()["id"]}, headers=headers)
+
+    resp = client.get("/export/characters", headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in resp.text.splitlines()]
+    assert rows == client.get("/characters/", headers=headers).json()
+    assert rows[0]["equipment"][0]["equipment"]["name"] == "Export Torch"
+
+    resp = client.get("/export/characters", params={"format": "csv"}, headers=headers)
+    reader = list(csv.DictReader(io.StringIO(resp.text)))
+    assert len(reader) == 1 and json.loads(reader[0]["equipment"])[0]["equipment"]["name"] == "Export Torch"
+
+    resp = client.get("/export/catalog/equipment")
+    names = [json.loads(line)["name"] for line in resp.text.splitlines()]
+    assert "Export Torch" in names
+    assert client.get("/export/catalog/users").status_code == 404
+    assert client.get("/export/catalog/abilities", params={"format": "xml"}).status_code == 422
+
+def test_password_hashing_and_rehash():
+    """Тест хеширования паролей и прозрачного перехеширования при входе."""
+    token = get_token("hashuser", "hashpass")
+    db = SessionLocal()
+    try:
+        user = crud.get_user_by_username(db, "hashuser")
+        assert user.hashed_password.startswith("pbkdf2_sha256$1000$")
+        assert not passwords.needs_rehash(user.hashed_password)
+        # Пароль открытым текстом, как в базах до хеширования
+        crud.update_user_password(db, user, "hashpass")
+    finally:
+        db.close()
+    resp = client.post("/token", data={"username": "hashuser", "password": "wrong"})
+    assert resp.status_code == 400
+    resp = client.post("/token", data={"username": "hashuser", "password": "hashpass"})
+    assert resp.status_code == 200
+    db = SessionLocal()
+    try:
+        assert crud.get_user_by_username(db, "hashuser").hashed_password.startswith("pbkdf2_sha256$")
+    finally:
+        db.close()
+    assert client.get("/users/me", headers=auth_headers(token)).status_code == 200
+    assert passwords.hasher.stats()["completed"] > 0
+    # Неизвестное имя проверяется против фиктивного хеша той же стоимости
+    completed = passwords.hasher.stats()["completed"]
+    resp = client.post("/token", data={"username": "nosuchuser", "password": "hashpass"})
+    assert resp.status_code == 400
+    assert passwords.hasher.stats()["completed"] == completed + 1
+    assert not passwords.verify_password("", passwords.DUMMY_HASH)
+
+def test_password_hasher_rejects_when_saturated():
+    """Тест ограничения очереди хеширования."""
+    hasher = passwords.PasswordHasher(workers=0, max_pending=0)
+
+    async def storm():
+        return await asyncio.gather(*(hasher.hash("pw") for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(storm())
+    hasher.shutdown()
+    assert isinstance(results[0], str) and passwords.verify_password("pw", results[0])
+    assert all(isinstance(r, passwords.PasswordHasherBusy) for r in results[1:])
+    assert hasher.stats() == {"in_flight": 0, "waiting": 0, "completed": 1, "rejected": 2}
+
+def test_migrations_upgrade_old_database(tmp_path):
+    """Тест миграций на копии базы, созданной до появления индексов."""
+    db_path = tmp_path / "old.db"
+    shutil.copy(os.path.join(os.path.dirname(__file__), "..", "minimal_db_2.4.db.db"), db_path)
+    old_engine = create_engine(f"sqlite:///{db_path}")
+    try:
+        with old_engine.begin() as conn:
+            # Старые предметы с невалидными эффектами бонусов не дают
+            for name, raw in (("Cursed Ring", '{"strength": "x"}'), ("Odd Amulet", '{"luck": 1, "wisdom": 2}')):
+                equipment_id = conn.execute(text(
+                    "INSERT INTO equipment (name, cost, effects) VALUES (:n, 1, :e) RETURNING id"
+                ), {"n": name, "e": raw}).scalar()
+                conn.execute(text(
+                    "INSERT INTO character_equipment (character_id, equipment_id, is_equipped, name) "
+                    "VALUES (2, :e, 1, :n)"
+                ), {"e": equipment_id, "n": name})
+        problems = startup.schema_problems(old_engine)
+        assert "missing column users.last_local_id" in problems
+        assert "migration 1 not applied" in problems
+        assert migrations.migrate(old_engine) == [version for version, _, _ in migrations.MIGRATIONS]
+        assert startup.schema_problems(old_engine) == []
+        with old_engine.connect() as conn:
+            # Статы старых персонажей материализованы миграцией
+            without_stats = conn.execute(text(
+                "SELECT COUNT(*) FROM characters WHERE id NOT IN (SELECT character_id FROM character_effective_stats)"
+            )).scalar()
+        assert without_stats == 0
+        # Реестр эффектов ключуется по id: в другой базе те же id означают другие предметы
+        effects.registry.clear()
+        with Session(old_engine) as db:
+            # SQL миграции даёт те же статы, что и полный пересчёт в crud
+            assert crud.rebuild_effective_stats(db, repair=False) == []
+        assert migrations.migrate(old_engine) == []
+        with old_engine.connect() as conn:
+            indexes = {name for name, in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+        assert {"ux_character_abilities_character_ability", "ix_class_progressions_class_level"} <= indexes
+        with old_engine.connect() as conn:
+            # Счётчик заполнен из уже существующих персонажей
+            stale = conn.execute(text(
+                "SELECT COUNT(*) FROM users WHERE last_local_id != "
+                "(SELECT COALESCE(MAX(local_id), 0) FROM characters WHERE owner_id = users.id)"
+            )).scalar()
+        assert stale == 0
+    finally:
+        old_engine.dispose()
+
+
+def test_hot_queries_use_indexes(tmp_path):
+    """Тест EXPLAIN QUERY PLAN: горячие запросы идут по индексам на сгенерированной базе."""
+    generated = create_engine(f"sqlite:///{tmp_path / 'generated.db'}")
+    datagen.generate(generated, datagen.DatasetConfig(users=200, characters_per_user=5, abilities=100, equipment=100))
+    hot_queries = [
+        select(models.CharacterAbility).where(
+            models.CharacterAbility.character_id == 1, models.CharacterAbility.ability_id == 2
+        ),
+        select(models.CharacterEquipment).where(
+            models.CharacterEquipment.character_id == 1, models.CharacterEquipment.equipment_id == 2
+        ),
+        select(models.CharacterEquipment.equipment_id).where(
+            models.CharacterEquipment.character_id == 1, models.CharacterEquipment.is_equipped.is_(True)
+        ),
+        select(models.ClassProgression).where(
+            models.ClassProgression.character_class_id == 1, models.ClassProgression.level == 3
+        ),
+        select(models.ClassProgressionAbility.ability_id).where(
+            models.ClassProgressionAbility.class_progression_id == 1
+        ),
+    ]
+    try:
+        with generated.connect() as conn:
+            # Со статистикой планировщик выбирает план так же, как на большой базе
+            conn.execute(text("ANALYZE"))
+            for query in hot_queries:
+                sql = str(query.compile(generated, compile_kwargs={"literal_binds": True}))
+                plan = " | ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+                assert "USING" in plan and "INDEX" in plan, f"{sql}\n-> {plan}"
+    finally:
+        generated.dispose()
+
+
+def test_local_ids_are_sequential_and_never_reused():
+    """Тест счётчика local_id: номера идут подряд и не переиспользуются."""
+    headers = auth_headers(get_token("counteruser", "pass"))
+    _, first = create_class_and_character(headers)
+    _, second = create_class_and_character(headers)
+    assert second == first + 1
+    assert client.delete(f"/characters/{second}", headers=headers).status_code == 204
+    _, third = create_class_and_character(headers)
+    assert third == second + 1
+
+
+def test_benchmark_harness_in_process():
+    """Тест бенчмарка: сценарии проходят без ошибок, сравнение с базой ловит регрессию."""
+    dataset = datagen.generate(engine, datagen.DatasetConfig(
+        users=2, characters_per_user=2, classes=1, abilities=5, equipment=5, levels=3, inventory=2, seed=3
+    ))
+    # Строки вставлены в обход crud: сбрасываем кэши справочников
+    catalog_cache.clear()
+    progression_cache.invalidate()
+
+    async def bench():
+        async with harness.in_process_client(app) as bench_client:
+            fixture = await scenarios.prepare(bench_client, dataset, concurrency=2)
+            return {"scenarios": {
+                name: await scenarios.run_scenario(bench_client, fixture, scenarios.SCENARIOS[name],
+                                                   concurrency=2, iterations=2)
+                for name in ("roster", "level_up", "equip_churn", "catalog")
+            }}
+
+    results = asyncio.run(bench())
+    for result in results["scenarios"].values():
+        assert result["total"]["errors"] == 0
+        assert result["total"]["count"] > 0
+    assert "GET /characters/{local_id}" in results["scenarios"]["roster"]["routes"]
+    assert harness.compare(results, results, tolerance=0.1) == []
+    slower = json.loads(json.dumps(results))
+    for stats in slower["scenarios"]["catalog"]["routes"].values():
+        stats["p95_ms"] *= 3
+    assert harness.compare(slower, results, tolerance=0.1)
+    assert harness.percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.0
+
+
+def test_datagen_is_deterministic(tmp_path):
+    """Тест генератора: одинаковый seed даёт одинаковые строки, счётчики local_id согласованы."""
+    config = datagen.DatasetConfig(users=20, characters_per_user=3, abilities=30, equipment=30, seed=11)
+    dumps = []
+    for name in ("a.db", "b.db"):
+        generated = create_engine(f"sqlite:///{tmp_path / name}")
+        try:
+            dataset = datagen.generate(generated, config)
+            with generated.connect() as conn:
+                dumps.append([conn.execute(text(f"SELECT * FROM {table} ORDER BY 1")).all() for table in (
+                    "users", "characters", "character_abilities", "character_equipment", "character_effective_stats"
+                )])
+                stale = conn.execute(text(
+                    "SELECT COUNT(*) FROM users WHERE last_local_id != "
+                    "(SELECT MAX(local_id) FROM characters WHERE owner_id = users.id)"
+                )).scalar()
+        finally:
+            generated.dispose()
+        assert dataset.counts["characters"] == 60
+        assert stale == 0
+    assert dumps[0] == dumps[1]
+
+
+def test_metrics_endpoint():
+    """Тест /metrics: серии по шаблону маршрута, статусы, гистограмма и счётчики кэшей."""
+    headers = auth_headers(get_token("metricsuser", "pass"))
+    _, local_id = create_class_and_character(headers)
+    assert client.get(f"/characters/{local_id}", headers=headers).status_code == 200
+    assert client.get("/characters/999999", headers=headers).status_code == 404
+    assert client.get("/no/such/path").status_code == 404
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    body = resp.text
+    assert 'http_requests_total{method="GET",route="/characters/{local_id}",status="200"}' in body
+    assert 'http_requests_total{method="GET",route="/characters/{local_id}",status="404"} ' in body
+    assert 'route="<unmatched>",status="404"' in body
+    assert f"/characters/{local_id}\"" not in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/characters/{local_id}",le="+Inf"}' in body
+    assert "http_requests_in_flight 1" in body
+    assert 'dnd_auth_cache{key="hits"}' in body
+    assert 'dnd_password_hasher{key="completed"}' in body
+
+
+def test_metrics_overhead_benchmark_records_every_call():
+    """Тест бенчмарка middleware: каждый вызов записан один раз, время меряет сам бенчмарк."""
+    recorded = metrics.Metrics()
+    wrapped = metrics.MetricsMiddleware(metrics_overhead._app, recorded)  # pylint: disable=protected-access
+    asyncio.run(metrics_overhead._time_calls(wrapped, 50))  # pylint: disable=protected-access
+    stats = recorded.routes[("GET", "/characters/{local_id}")]
+    assert len(recorded.routes) == 1 and recorded.in_flight == 0
+    assert stats.count == sum(stats.buckets) == 50 and stats.statuses == {200: 50}
+    result = metrics_overhead.measure(requests=10, rounds=1)
+    assert set(result) == {"bare_us", "instrumented_us", "overhead_us"}
+
+
+def test_query_budget_does_not_grow_with_roster():
+    """Тест бюджета запросов: список персонажей не делает N+1 при росте числа персонажей."""
+    headers = auth_headers(get_token("budgetuser", "pass"))
+    _, local_id = create_class_and_character(headers)
+    client.get("/characters/", headers=headers)
+    small = assert_query_budget(client.get("/characters/", headers=headers), budget=5)
+    abilities = [client.post("/abilities/", json={"name": f"Budget ability {i}"}, headers=headers).json()["id"]
+                 for i in range(3)]
+    items = [client.post("/equipment/", json={"name": f"Budget item {i}", "cost": 1}, headers=headers).json()["id"]
+             for i in range(3)]
+    for _ in range(8):
+        _, local_id = create_class_and_character(headers)
+        for ability_id in abilities:
+            client.post(f"/characters/{local_id}/abilities/", json={"ability_id": ability_id}, headers=headers)
+        for equipment_id in items:
+            client.post(f"/characters/{local_id}/equipment/", json={"equipment_id": equipment_id}, headers=headers)
+    large = client.get("/characters/", headers=headers)
+    assert len(large.json()) == 9
+    assert assert_query_budget(large, budget=small) == small
+    assert float(large.headers[dbstats.TIME_HEADER]) >= 0
+    assert 'http_request_db_queries_total{method="GET",route="/characters/"}' in client.get("/metrics").text
+
+
+def test_repeated_statements_flagged_as_nplus1():
+    """Тест детектора N+1: одинаковый запрос в цикле помечается."""
+    db = SessionLocal()
+    try:
+        with dbstats.track() as stats:
+            for user_id in range(dbstats.NPLUS1_THRESHOLD):
+                db.query(models.User).filter(models.User.id == user_id).first()
+            db.query(models.Ability).count()
+    finally:
+        db.close()
+    assert stats.count == dbstats.NPLUS1_THRESHOLD + 1
+    repeated = stats.repeated()
+    assert len(repeated) == 1 and repeated[0][1] == dbstats.NPLUS1_THRESHOLD
+    assert "FROM users" in repeated[0][0]
+
+
+def test_fast_json_path_is_byte_identical(monkeypatch):
+    """Тест FAST_JSON: горячие маршруты отдают те же байты и заголовки, что и обычный путь."""
+    headers = auth_headers(get_token("fastjsonuser", "pass"))
+    _, local_id = create_class_and_character(headers)
+    _, second = create_class_and_character(headers)
+    ability_id = client.post("/abilities/", json={"name": "Fast ability ünïcode"}, headers=headers).json()["id"]
+    equipment_id = client.post("/equipment/", json={
+        "name": "Fast item", "cost": 3, "effects": json.dumps({"strength": 2})
+    }, headers=headers).json()["id"]
+    client.post(f"/characters/{local_id}/abilities/", json={"ability_id": ability_id}, headers=headers)
+    client.post(f"/characters/{local_id}/equipment/", json={"equipment_id": equipment_id}, headers=headers)
+    client.patch(f"/characters/{local_id}/equipment/{equipment_id}/equip", headers=headers)
+    urls = [
+        "/characters/",
+        "/characters/?limit=1",
+        f"/characters/{local_id}",
+        f"/characters/{local_id}/abilities/",
+        f"/characters/{local_id}/equipment/",
+        f"/characters/{local_id}/equipment/equipped/",
+        f"/characters/{local_id}/effective_stats/",
+        f"/characters/effective_stats/?ids={local_id},{second}",
+    ]
+    responses = {}
+    for fast in (False, True):
+        monkeypatch.setattr(fastjson, "FAST_JSON", fast)
+        responses[fast] = [client.get(url, headers=headers) for url in urls]
+    for url, slow, fast in zip(urls, responses[False], responses[True]):
+        assert slow.status_code == fast.status_code == 200, url
+        assert slow.content == fast.content, url
+        for header in ("content-type", "etag", "x-next-cursor"):
+            assert slow.headers.get(header) == fast.headers.get(header), (url, header)
+    assert "x-next-cursor" in responses[True][1].headers
+
+def test_fast_json_falls_back_on_null_in_required_field(monkeypatch):
+    """Тест FAST_JSON: NULL в обязательном поле уходит на валидацию response_model."""
+    monkeypatch.setattr(fastjson, "FAST_JSON", True)
+    character = models.Character(id=1, owner_id=1, local_id=1, name="Nameless", character_class_id=1,
+                                 level=None, max_hp=1, current_hp=1, armor_class=10, strength=10,
+                                 dexterity=10, constitution=10, intelligence=10, wisdom=10, charisma=10)
+    with pytest.raises(fastjson.NeedsValidation):
+        fastjson.CHARACTER.dump(character)
+    assert fastjson.respond(character, fastjson.CHARACTER) is character
+    character.level = 1
+    assert json.loads(fastjson.respond(character, fastjson.CHARACTER).body)["level"] == 1
+
+
+def test_lifespan_prepares_and_warms(monkeypatch, tmp_path):
+    """Тест запуска: lifespan создаёт схему и прогревает кэши до первого запроса."""
+    catalog_cache.clear()
+    progression_cache.invalidate()
+    monkeypatch.setattr(startup, "WARM_UP", True)
+    with TestClient(app) as warm_client:
+        assert {"create_all", "migrate", "warm_pool", "warm_caches", "warm_hasher"} <= set(startup.timings)
+        misses = catalog_cache.misses
+        assert warm_client.get("/equipment/").status_code == 200
+        assert catalog_cache.misses == misses
+        assert progression_cache._tables
+    # Пул хеширования остановлен вместе с приложением и поднимется заново по требованию
+    assert passwords.hasher._executor is None
+    # Проверка схемы не даёт стартовать на пустой базе
+    empty_engine = create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+    monkeypatch.setattr(startup, "engine", empty_engine)
+    monkeypatch.setattr(startup, "INIT_SCHEMA", False)
+    monkeypatch.setattr(startup, "SCHEMA_CHECK", True)
+    try:
+        with pytest.raises(RuntimeError, match="missing table users"):
+            with TestClient(app):
+                pass
+    finally:
+        empty_engine.dispose()
+
+
+def test_worker_caches_share_invalidations(tmp_path):
+    """Тест общих счётчиков: запись в одном воркере сбрасывает кэши другого."""
+    sync_file = str(tmp_path / "counters")
+    first, second = SharedCounters(sync_file), SharedCounters(sync_file)
+    catalogs = [CatalogCache(ttl=300, max_pages=8, counters=counters) for counters in (first, second)]
+    rows = [{"id": 1, "name": "Sword"}]
+    for catalog in catalogs:
+        catalog.page("equipment", lambda: rows, None, 10)
+    rows = [{"id": 1, "name": "Axe"}]
+    catalogs[0].invalidate("equipment")
+    body, _ = catalogs[1].page("equipment", lambda: rows, None, 10)
+    assert b"Axe" in body and catalogs[1].version("equipment") == 1
+
+    tokens = [TTLCache(maxsize=10, ttl=300, channel="users", tag=str, counters=counters)
+              for counters in (first, second)]
+    for token_cache in tokens:
+        token_cache.set("token", "user")
+        token_cache.set("other token", "other")
+    # Второй воркер теряет токены только этого пользователя
+    assert tokens[0].invalidate_tag("user") == 1
+    assert tokens[1].get("token") is None
+    assert tokens[1].get("other token") == "other"
+    assert tokens[1].stats()["size"] == 1
+
+    versions = [VersionMap(maxsize=10, channel="characters", counters=counters) for counters in (first, second)]
+    before = versions[1].get((1, 1))
+    versions[0].bump((1, 1))
+    after = versions[1].get((1, 1))
+    assert after > before
+    versions[1].bump((2, 1))
+    assert versions[1].get((1, 1)) >= after
+
+
+def test_serve_settings_and_health(monkeypatch):
+    """Тест запуска воркеров: выбор реализаций, окружение воркеров и /health."""
+    args = serve.parse_args(["--workers", "3", "--max-requests", "1000"])
+    options = serve.uvicorn_options(args)
+    assert options["workers"] == 3 and options["limit_max_requests"] == 1000
+    assert options["loop"] in serve.LOOPS and options["http"] in serve.HTTP
+    monkeypatch.setattr(serve.importlib.util, "find_spec", lambda name: None)
+    assert serve.pick("loop", "auto", serve.LOOPS) == "asyncio"
+    with pytest.raises(SystemExit):
+        serve.pick("http", "httptools", serve.HTTP)
+    monkeypatch.delenv("PASSWORD_HASH_WORKERS", raising=False)
+    env = serve.worker_environment(workers=1, sync_file="/tmp/counters")
+    assert env["DB_INIT_SCHEMA"] == "0" and env["CACHE_SYNC_FILE"] == "/tmp/counters"
+    assert int(env["PASSWORD_HASH_WORKERS"]) >= 1
+
+    resp = client.get("/health")
+    assert resp.status_code == 200
+    assert resp.json()["pid"] == os.getpid() and resp.json()["database"] == "ok"
+
+
+def test_sqlite_profile_applied_on_connect(tmp_path):
+    """Тест профиля SQLite: PRAGMA на каждом соединении и явный пул."""
+    url = f"sqlite:///{tmp_path / 'profile.db'}"
+    profiled = create_engine(url, **database.pool_options(url))
+    database.install_sqlite_profile(profiled)
+    try:
+        with profiled.connect() as conn:
+            pragma = lambda name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+            assert pragma("journal_mode") == "wal"
+            assert pragma("synchronous") == 1  # NORMAL
+            assert pragma("temp_store") == 2  # MEMORY
+            assert pragma("cache_size") == int(database.SQLITE_PRAGMAS["cache_size"])
+            assert pragma("busy_timeout") == int(database.BUSY_TIMEOUT * 1000)
+        assert profiled.pool.size() == database.POOL_SIZE
+    finally:
+        profiled.dispose()
+    assert database.pool_options("sqlite://") == {}
+
+
+def test_get_routes_use_read_only_sessions():
+    """Тест разделения сессий: GET читают через пул только для чтения."""
+    def calls(dependant):
+        for dependency in dependant.dependencies:
+            yield dependency.call
+            yield from calls(dependency)
+
+    for route in app.routes:
+        if hasattr(route, "dependant") and "GET" in route.methods:
+            assert get_write_db not in set(calls(route.dependant)), route.path
+
+    read_db = ReadSessionLocal()
+    try:
+        with pytest.raises(OperationalError, match="readonly"):
+            read_db.execute(text("DELETE FROM character_effective_stats"))
+    finally:
+        read_db.close()
+
+    # Недостающие статы GET считает на лету, но не сохраняет
+    token = get_token("readonlyuser", "readonlypass")
+    headers = auth_headers(token)
+    class_id = client.post("/character_classes/", json={"name": "Archdruid", "description": "Nature"},
+                           headers=headers).json()["id"]
+    char_data = {"local_id": 1, "name": "Radagast", "character_class_id": class_id, "level": 1, "max_hp": 8,
+                 "current_hp": 8, "armor_class": 11, "strength": 9, "dexterity": 12, "constitution": 12,
+                 "intelligence": 12, "wisdom": 16, "charisma": 10}
+    local_id = client.post("/characters/", json=char_data, headers=headers).json()["local_id"]
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    db = SessionLocal()
+    try:
+        character_id = crud.get_character_by_local_id(db, user_id, local_id).id
+        db.query(models.CharacterStats).filter(models.CharacterStats.character_id == character_id).delete()
+        db.commit()
+        resp = client.get(f"/characters/{local_id}/effective_stats/", headers=headers)
+        assert resp.status_code == 200 and resp.json()["wisdom"] == 16
+        batch = client.get("/characters/effective_stats/", headers=headers).json()
+        assert batch[0]["wisdom"] == 16
+        assert db.query(models.CharacterStats).filter(models.CharacterStats.character_id == character_id).count() == 0
+        # Без строк статов число запросов не растёт с числом персонажей
+        small = assert_query_budget(client.get("/characters/effective_stats/", headers=headers), budget=10)
+        for _ in range(5):
+            create_class_and_character(headers)
+        db.query(models.CharacterStats).filter(models.CharacterStats.character_id.in_(
+            db.query(models.Character.id).filter(models.Character.owner_id == user_id))).delete(synchronize_session=False)
+        db.commit()
+        large = client.get("/characters/effective_stats/", headers=headers)
+        assert len(large.json()) == 6
+        assert assert_query_budget(large, budget=small) == small
+    finally:
+        db.close()
+
+def test_write_routes_look_up_only_character_id():
+    """Тест лёгкого поиска персонажа для маршрутов записи: один запрос без графа."""
+    token = get_token("idlookupuser", "idlookuppass")
+    headers = auth_headers(token)
+    _, local_id = create_class_and_character(headers)
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    db = SessionLocal()
+    try:
+        character = crud.get_character_by_local_id(db, user_id, local_id)
+        db.expunge_all()
+        with dbstats.track() as stats:
+            assert crud.get_character_id_by_local_id(db, user_id, local_id) == character.id
+            assert crud.get_character_id_by_local_id(db, user_id, local_id + 1000) is None
+        assert stats.count == 2
+        assert not db.identity_map
+    finally:
+        db.close()
+    resp = client.post(f"/characters/{local_id + 1000}/equipment/", json={"equipment_id": 1}, headers=headers)
+    assert resp.status_code == 404